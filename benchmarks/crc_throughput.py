@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Measure CRC-24Q throughput in MB/s on the captured RTCM 3 samples.
+
+The previous implementation, which read the frame one BitStream byte at a
+time, is included as the baseline. Run from the repository root, with or
+without the package installed::
+
+    python benchmarks/crc_throughput.py
+
+@author: Lars Stenseng
+@mail: lars@stenseng.net
+"""
+
+import glob
+import os
+import sys
+from timeit import repeat
+
+from bitstring import BitStream
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ntripstreams.crc import (  # noqa: E402
+    _CRC24Q_LUT,
+    crc24q,
+    crc24qVerify,
+    crc24qVerifyArray,
+    np,
+)
+from ntripstreams.framer import RtcmFramer  # noqa: E402
+
+SAMPLES = os.path.join(
+    os.path.dirname(__file__), "..", "tests", "data", "samples", "*.rtcm3"
+)
+
+
+def crc24qBitStream(data: BitStream) -> int:
+    """The previous crc24q, reading one BitStream byte per step."""
+    data.pos = 0
+    crclut = list(_CRC24Q_LUT)
+    crc = 0
+    length = int(data.length / 8)
+    for _ in range(length):
+        crc = (crc << 8) ^ crclut[data.read("bytes:1")[0] ^ (crc >> 16)]
+        crc = crc & 0xFFFFFF
+    return crc
+
+
+def throughput(label: str, func, numBytes: int, number: int = 5) -> float:
+    """Print and return the best-of-three throughput of ``func`` in MB/s."""
+    best = min(repeat(func, number=number, repeat=3)) / number
+    rate = numBytes / best / 1e6
+    print(f"{label:<32} {rate:8.2f} MB/s")
+    return rate
+
+
+def main() -> None:
+    frames = []
+    for path in sorted(glob.glob(SAMPLES)):
+        with open(path, "rb") as fh:
+            frames += [frame.data for frame in RtcmFramer().feed(fh.read())]
+    numBytes = sum(len(frame) for frame in frames)
+    bitFrames = [BitStream(frame) for frame in frames]
+    print(f"{len(frames)} frames, {numBytes} bytes")
+    baseline = throughput(
+        "previous crc24q(BitStream)",
+        lambda: [crc24qBitStream(frame) for frame in bitFrames],
+        numBytes,
+        number=1,
+    )
+    rate = throughput(
+        "crc24q(bytes)", lambda: [crc24q(frame) for frame in frames], numBytes
+    )
+    print(f"{'speedup over previous':<32} {rate / baseline:8.1f} x")
+    throughput(
+        "crc24q(BitStream)", lambda: [crc24q(frame) for frame in bitFrames], numBytes
+    )
+    throughput("crc24qVerify(frames)", lambda: crc24qVerify(frames), numBytes)
+    if np is not None:
+        archive = b"".join(frames)
+        lengths = np.array([len(frame) for frame in frames])
+        offsets = np.cumsum(lengths) - lengths
+        throughput(
+            "crc24qVerifyArray(archive)",
+            lambda: crc24qVerifyArray(archive, offsets, lengths),
+            numBytes,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,37 @@
 """ntripstreams: NTRIP communication and RTCM 3 handling.
 
 Re-exports the main public API: the :class:`~ntripstreams.ntripstreams.NtripStream`
-client/server class, the :class:`~ntripstreams.rtcm3.Rtcm3` message
-encoder/decoder, and the :func:`~ntripstreams.crc.crc24q` and
+client/server class, the :class:`~ntripstreams.framer.RtcmFramer` sans-IO
+RTCM 3 framer and its :class:`~ntripstreams.framer.RtcmFrame` frames, the
+:class:`~ntripstreams.rtcm3.Rtcm3` message encoder/decoder and its lazily
+decoded :class:`~ntripstreams.rtcm3.RtcmMessage` messages and
+:class:`~ntripstreams.rtcm3.RtcmMessageType` registry entries, the indexed
+:class:`~ntripstreams.sourcetable.Sourcetable` and its
+:class:`~ntripstreams.cache.SourcetableCache`, the
+:func:`~ntripstreams.harvest.harvestSourcetables` multi-caster harvester, and the
+:func:`~ntripstreams.crc.crc24q`, :func:`~ntripstreams.crc.crc24qVerify` and
 :func:`~ntripstreams.crc.crcNmea` checksum helpers.
 """
 
-__all__ = ["NtripStream", "Rtcm3", "crc24q", "crcNmea"]
+__all__ = [
+    "NtripStream",
+    "RtcmFrame",
+    "RtcmFramer",
+    "Rtcm3",
+    "RtcmMessage",
+    "RtcmMessageType",
+    "Sourcetable",
+    "SourcetableCache",
+    "crc24q",
+    "crc24qVerify",
+    "crcNmea",
+    "harvestSourcetables",
+]
 
-from ntripstreams.crc import crc24q, crcNmea
+from ntripstreams.cache import SourcetableCache
+from ntripstreams.crc import crc24q, crc24qVerify, crcNmea
+from ntripstreams.framer import RtcmFrame, RtcmFramer
+from ntripstreams.harvest import harvestSourcetables
 from ntripstreams.ntripstreams import NtripStream
-from ntripstreams.rtcm3 import Rtcm3
+from ntripstreams.rtcm3 import Rtcm3, RtcmMessage, RtcmMessageType
+from ntripstreams.sourcetable import Sourcetable
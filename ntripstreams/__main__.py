@@ -49,6 +49,12 @@ def procSigterm(signum: int, frame: Optional[FrameType]) -> None:
     exit(4)
 
 
+async def procSourcetable(ntripstream: NtripStream, url: str) -> None:
+    """Print a caster's source table line by line as it is received."""
+    async for line in ntripstream.iterSourcetableLines(url):
+        print(line)
+
+
 async def procRtcmStream(
     url: str,
     mountPoint: str,
@@ -95,7 +101,7 @@ async def procRtcmStream(
             continue
         while True:
             try:
-                rtcmFrame, timeStamp = await ntripstream.getRtcmFrame()
+                rtcmFrames = await ntripstream.getRtcmFrames()
                 fail = 0
             except (ConnectionError, IOError):
                 fail += 1
@@ -106,38 +112,37 @@ async def procRtcmStream(
                 )
                 await asyncio.sleep(sleepTime)
                 break
-            try:
-                messageType, data = rtcmMessage.decodeRtcmFrame(rtcmFrame)
-                description = rtcmMessage.messageDescription(messageType)
-            except Exception:
-                logging.info("Failed to decode RTCM frame.")
-                return
-            logging.debug(
-                f"{mountPoint}:RTCM message #:{messageType}" f' "{description}".'
-            )
-            if (
-                (messageType >= 1001 and messageType <= 1004)
-                or (messageType >= 1009 and messageType <= 1012)
-                or (messageType >= 1071 and messageType <= 1077)
-                or (messageType >= 1081 and messageType <= 1087)
-                or (messageType >= 1091 and messageType <= 1097)
-                or (messageType >= 1101 and messageType <= 1107)
-                or (messageType >= 1111 and messageType <= 1117)
-                or (messageType >= 1121 and messageType <= 1127)
-            ):
-                numSignals = len(data[1])
-                signals = ""
-                if messageType >= 1071 and messageType <= 1127:
-                    signals = rtcmMessage.msmSignalTypes(messageType, data[0][10])
-                    numSignals = len(data[2])
-                logging.info(
-                    f"{mountPoint}:RTCM message #:{messageType},"
-                    f" Constellation: {rtcmMessage.constellation(messageType)},"
-                    f" GNSS: {data[0][2]},"
-                    f" Sats: {len(data[1])},"
-                    f" Signals: {numSignals},"
-                    f" Signal Types: {signals}"
+            for rtcmFrame, timeStamp in rtcmFrames:
+                if rtcmFrame.messageType is None:
+                    # Zero-length keep-alive or fill frame.
+                    continue
+                try:
+                    message = rtcmMessage.decodeRtcmHeader(rtcmFrame)
+                    messageType = message.messageType
+                    description = rtcmMessage.messageDescription(messageType)
+                except Exception:
+                    logging.info("Failed to decode RTCM frame.")
+                    return
+                logging.debug(
+                    f"{mountPoint}:RTCM message #:{messageType}" f' "{description}".'
                 )
+                messageInfo = rtcmMessage.messageTypeInfo(messageType)
+                if messageInfo is not None and messageInfo.observables:
+                    numSignals = message.numSats
+                    signals = ""
+                    if messageInfo.msmLevel:
+                        signals = rtcmMessage.msmSignalTypes(
+                            messageType, message.head.gnssSignalMask
+                        )
+                        numSignals = message.numCells
+                    logging.info(
+                        f"{mountPoint}:RTCM message #:{messageType},"
+                        f" Constellation: {messageInfo.constellation},"
+                        f" GNSS: {message.gnssEpochTime},"
+                        f" Sats: {message.numSats},"
+                        f" Signals: {numSignals},"
+                        f" Signal Types: {signals}"
+                    )
 
 
 async def rtcmStreamTasks(url: str, mountPoints: str, user: str, passwd: str) -> None:
@@ -267,9 +272,7 @@ def main() -> None:
     ntripstream = NtripStream()
     if not args.mountpoint:
         try:
-            sourceTable = asyncio.run(ntripstream.requestSourcetable(args.url))
-            for source in sourceTable:
-                print(source)
+            asyncio.run(procSourcetable(ntripstream, args.url))
         except OSError as error:
             logging.error(error)
     else:
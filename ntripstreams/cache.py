@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Caching of NTRIP source tables.
+
+Defines :class:`SourcetableCache`, which keeps the source tables of casters in
+memory and optionally on disk, revalidates expired copies with conditional
+requests and falls back to a stale copy when a caster cannot be reached.
+
+@author: Lars Stenseng
+@mail: lars@stenseng.net
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import namedtuple
+from hashlib import sha1
+from time import time
+
+from ntripstreams.ntripstreams import NtripStream
+from ntripstreams.sourcetable import Sourcetable
+
+CacheEntry = namedtuple("CacheEntry", ["lines", "fetched", "lastModified", "etag"])
+CacheEntry.__doc__ = """A cached source table and the validators of its response."""
+
+
+class SourcetableCache:
+    """A source table cache with TTL, conditional revalidation and stale reuse.
+
+    A source table younger than ``ttl`` seconds is returned without contacting
+    the caster. An older copy is revalidated with ``If-Modified-Since`` and
+    ``If-None-Match`` when the caster sent ``Last-Modified`` or ``ETag``; a
+    ``304 Not Modified`` answer renews it without transferring the table
+    again. If the caster cannot be reached, or the table arrives incomplete,
+    the cached copy is returned as long as it is younger than ``maxStale``.
+
+    Concurrent requests for the same caster share a single fetch. With
+    ``cacheDir`` the tables are also stored as JSON files, one per caster URL,
+    so that several processes, and restarted ones, share the fetched tables.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        Age in seconds up to which a cached table is used as is. The default
+        is 300.
+    cacheDir : str, optional
+        Directory for the on-disk cache. The default is None, for a
+        memory-only cache.
+    maxStale : float, optional
+        Age in seconds up to which a cached table is returned when the caster
+        fails. The default is None, for no limit.
+
+    Attributes
+    ----------
+    hits : int
+        Requests answered from the cache without contacting the caster.
+    misses : int
+        Requests for which no usable copy was cached.
+    revalidations : int
+        Expired copies revalidated with the caster.
+    notModified : int
+        Revalidations answered with ``304 Not Modified``.
+    staleHits : int
+        Requests answered with a stale copy because the caster failed.
+    errors : int
+        Failed fetches.
+    """
+
+    def __init__(self, ttl: float = 300.0, cacheDir: str = None, maxStale=None):
+        self.ttl = ttl
+        self.cacheDir = cacheDir
+        self.maxStale = maxStale
+        self.entries = {}
+        self.tables = {}
+        self.locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.notModified = 0
+        self.staleHits = 0
+        self.errors = 0
+        if cacheDir is not None:
+            os.makedirs(cacheDir, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"SourcetableCache(entries={len(self.entries)}, hits={self.hits}, "
+            f"misses={self.misses}, notModified={self.notModified}, "
+            f"staleHits={self.staleHits}, errors={self.errors})"
+        )
+
+    async def getLines(self, casterUrl: str) -> tuple:
+        """Return the source table lines of a caster.
+
+        Parameters
+        ----------
+        casterUrl : str
+            Caster URL and port, e.g. ``http[s]://caster.hostname.net:port``.
+
+        Raises
+        ------
+        OSError
+            If the caster fails and no usable copy is cached.
+
+        Returns
+        -------
+        tuple of str
+            The source table lines, ending with ``ENDSOURCETABLE``. The same
+            tuple is returned as long as the cached table is unchanged.
+        """
+        entry = self._lookup(casterUrl)
+        if entry is not None and time() - entry.fetched < self.ttl:
+            self.hits += 1
+            return entry.lines
+        lock = self.locks.setdefault(casterUrl, asyncio.Lock())
+        async with lock:
+            # Another request may have refreshed the entry while we waited.
+            entry = self._lookup(casterUrl)
+            if entry is not None and time() - entry.fetched < self.ttl:
+                self.hits += 1
+                return entry.lines
+            return (await self._refresh(casterUrl, entry)).lines
+
+    async def getSourcetable(self, casterUrl: str) -> Sourcetable:
+        """Return the parsed source table of a caster.
+
+        The parsed :class:`~ntripstreams.sourcetable.Sourcetable` is kept as
+        long as the cached lines are unchanged.
+
+        Parameters
+        ----------
+        casterUrl : str
+            Caster URL and port, e.g. ``http[s]://caster.hostname.net:port``.
+
+        Raises
+        ------
+        OSError
+            If the caster fails and no usable copy is cached.
+
+        Returns
+        -------
+        Sourcetable
+            The parsed source table.
+        """
+        lines = await self.getLines(casterUrl)
+        lastLines, table = self.tables.get(casterUrl, (None, None))
+        if lastLines is not lines:
+            table = Sourcetable(lines)
+            self.tables[casterUrl] = (lines, table)
+        return table
+
+    def invalidate(self, casterUrl: str = None) -> None:
+        """Drop the cached table of a caster, or of all casters.
+
+        Parameters
+        ----------
+        casterUrl : str, optional
+            Caster URL. The default is None, for all casters.
+        """
+        urls = list(self.entries) if casterUrl is None else [casterUrl]
+        for url in urls:
+            self.entries.pop(url, None)
+            self.tables.pop(url, None)
+            if self.cacheDir is not None:
+                try:
+                    os.remove(self._path(url))
+                except FileNotFoundError:
+                    pass
+
+    async def _refresh(self, casterUrl: str, entry: CacheEntry) -> CacheEntry:
+        """Fetch or revalidate a source table, falling back to ``entry``."""
+        if entry is None:
+            self.misses += 1
+        else:
+            self.revalidations += 1
+        ntripStream = NtripStream()
+        notModified = False
+        try:
+            lines = tuple(
+                [
+                    line
+                    async for line in ntripStream.iterSourcetableLines(
+                        casterUrl,
+                        None if entry is None else entry.lastModified,
+                        None if entry is None else entry.etag,
+                    )
+                ]
+            )
+            if ntripStream.ntripResponseStatusCode == "304" and entry is not None:
+                self.notModified += 1
+                notModified = True
+                lines = entry.lines
+            elif not lines or lines[-1] != "ENDSOURCETABLE":
+                raise ConnectionError(f"Incomplete source table from {casterUrl}")
+        except (OSError, asyncio.TimeoutError) as error:
+            self.errors += 1
+            if entry is None or (
+                self.maxStale is not None and time() - entry.fetched >= self.maxStale
+            ):
+                raise
+            self.staleHits += 1
+            logging.warning(f"{casterUrl}: Using cached source table: {error}")
+            return entry
+        lastModified = ntripStream.getResponseHeaderField("Last-Modified")
+        etag = ntripStream.getResponseHeaderField("ETag")
+        if notModified:
+            # A 304 need not repeat the validators of the cached table.
+            lastModified = lastModified or entry.lastModified
+            etag = etag or entry.etag
+        entry = CacheEntry(lines, time(), lastModified, etag)
+        self._store(casterUrl, entry)
+        return entry
+
+    def _lookup(self, casterUrl: str):
+        """Return the cached entry of a caster, loading it from disk if needed."""
+        entry = self.entries.get(casterUrl)
+        if self.cacheDir is None:
+            return entry
+        if entry is not None and time() - entry.fetched < self.ttl:
+            return entry
+        # The file may have been refreshed by another process.
+        try:
+            with open(self._path(casterUrl), encoding="utf-8") as fh:
+                stored = json.load(fh)
+            diskEntry = CacheEntry(
+                tuple(stored["lines"]),
+                stored["fetched"],
+                stored["lastModified"],
+                stored["etag"],
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return entry
+        if entry is None or diskEntry.fetched > entry.fetched:
+            self.entries[casterUrl] = entry = diskEntry
+        return entry
+
+    def _store(self, casterUrl: str, entry: CacheEntry) -> None:
+        """Keep an entry in memory and write it to the on-disk cache."""
+        self.entries[casterUrl] = entry
+        if self.cacheDir is None:
+            return
+        path = self._path(casterUrl)
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmpPath, "w", encoding="utf-8") as fh:
+                json.dump({"url": casterUrl, **entry._asdict()}, fh)
+            os.replace(tmpPath, path)
+        except OSError as error:
+            logging.warning(f"{casterUrl}: Cannot write source table cache: {error}")
+
+    def _path(self, casterUrl: str) -> str:
+        """Return the cache file of a caster URL."""
+        name = sha1(casterUrl.encode("utf-8")).hexdigest()
+        return os.path.join(self.cacheDir, f"{name}.json")
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Sans-IO framing of RTCM 3 byte streams.
+
+Defines :class:`RtcmFrame`, the compact value type for one RTCM 3 frame,
+:class:`RtcmFramer`, a synchronous framer that turns arbitrary chunks of
+received bytes into complete, CRC-24Q validated frames, and
+:class:`ChunkedDecoder`, an incremental decoder for HTTP chunked transfer
+encoding. Neither does I/O of its own, so they serve sockets, files, serial
+ports or captured archives alike.
+
+@author: Lars Stenseng
+@mail: lars@stenseng.net
+"""
+
+import logging
+from time import monotonic_ns
+
+from ntripstreams.crc import crc24q
+
+
+class RtcmFrame:
+    """A complete RTCM 3 frame (preamble, header, payload and CRC).
+
+    The message number and the header fields are decoded once, when the frame
+    is created, and kept in slots alongside the raw bytes.
+
+    Parameters
+    ----------
+    data : bytes
+        The raw frame, from the ``0xD3`` preamble to the 24-bit CRC.
+    timeNs : int, optional
+        Monotonic receive time in nanoseconds. The default is the current
+        :func:`time.monotonic_ns`.
+
+    Attributes
+    ----------
+    data : bytes
+        The raw frame.
+    messageType : int or None
+        The 12-bit message number, or ``None`` for an empty payload.
+    payloadLength : int
+        Length of the message payload in bytes.
+    crc : int
+        The 24-bit CRC transmitted with the frame.
+    timeNs : int
+        Monotonic receive time in nanoseconds.
+    """
+
+    __slots__ = ("data", "messageType", "payloadLength", "crc", "timeNs")
+
+    def __init__(self, data: bytes, timeNs: int = None):
+        self.data = data
+        self.payloadLength = ((data[1] & 0x03) << 8) | data[2]
+        if self.payloadLength >= 2:
+            self.messageType = (data[3] << 4) | (data[4] >> 4)
+        else:
+            self.messageType = None
+        self.crc = int.from_bytes(data[-3:], "big")
+        self.timeNs = monotonic_ns() if timeNs is None else timeNs
+
+    def __repr__(self) -> str:
+        return (
+            f"RtcmFrame(messageType={self.messageType}, "
+            f"payloadLength={self.payloadLength}, crc=0x{self.crc:06X})"
+        )
+
+    def __len__(self) -> int:
+        """Return the frame length in bytes."""
+        return len(self.data)
+
+    def __bytes__(self) -> bytes:
+        return self.data
+
+    @property
+    def payload(self) -> memoryview:
+        """The message payload, without header and CRC, as a memoryview."""
+        return memoryview(self.data)[3 : 3 + self.payloadLength]
+
+    def tobytes(self) -> bytes:
+        """Return the raw frame, like :meth:`bitstring.Bits.tobytes`."""
+        return self.data
+
+
+class RtcmFramer:
+    """Split a byte stream into CRC-validated RTCM 3 frames.
+
+    Received bytes are appended to an internal ``bytearray`` that is consumed
+    through a read offset; the consumed head is only discarded once it grows
+    past ``compactSize`` bytes. Frame boundaries are found with
+    ``bytes.find`` on the ``0xD3`` preamble and the 10-bit length field.
+
+    After a rejected candidate the search resumes at the next ``0xD3`` byte
+    without copying the buffer. Candidates whose six reserved header bits are
+    not zero are rejected before the CRC is computed, so garbage costs a
+    bounded amount of work per byte. Zero-length frames, sent as keep-alive
+    or fill, are valid and emitted with ``messageType`` ``None``.
+
+    Parameters
+    ----------
+    name : str, optional
+        Label used in log messages, e.g. the mountpoint. The default is None.
+    compactSize : int, optional
+        Size in bytes of the consumed buffer head that triggers compaction.
+        The default is 4096.
+
+    Attributes
+    ----------
+    bytesSkipped : int
+        Bytes discarded while searching for a valid frame.
+    crcFailures : int
+        Candidate frames rejected by the CRC-24Q check.
+    headerRejects : int
+        Candidate frames rejected by the reserved-bit check.
+    framesEmitted : int
+        Validated frames returned.
+    timeNs : int or None
+        Monotonic time in nanoseconds of the last :meth:`append`; frames are
+        stamped with the time of the data that completed them.
+    """
+
+    def __init__(self, name: str = None, compactSize: int = 4096):
+        self.name = name
+        self.compactSize = compactSize
+        self.buffer = bytearray()
+        self.offset = 0
+        self.aligned = False
+        self.bytesSkipped = 0
+        self.crcFailures = 0
+        self.headerRejects = 0
+        self.framesEmitted = 0
+        self.timeNs = None
+
+    def __len__(self) -> int:
+        """Return the number of buffered, not yet framed bytes."""
+        return len(self.buffer) - self.offset
+
+    def reset(self) -> None:
+        """Discard buffered bytes, e.g. after reconnecting. Counters are kept."""
+        self.buffer.clear()
+        self.offset = 0
+        self.aligned = False
+
+    def append(self, data, timeNs: int = None) -> None:
+        """Buffer received bytes without framing them.
+
+        Parameters
+        ----------
+        data : bytes, bytearray or memoryview
+            The received bytes.
+        timeNs : int, optional
+            Monotonic receive time in nanoseconds. The default is the current
+            :func:`time.monotonic_ns`.
+        """
+        self.timeNs = monotonic_ns() if timeNs is None else timeNs
+        self.buffer += data
+
+    def feed(self, data, timeNs: int = None) -> list:
+        """Buffer received bytes and return every complete frame.
+
+        Parameters
+        ----------
+        data : bytes, bytearray or memoryview
+            The received bytes.
+        timeNs : int, optional
+            Monotonic receive time in nanoseconds. The default is the current
+            :func:`time.monotonic_ns`.
+
+        Returns
+        -------
+        list of RtcmFrame
+            The CRC-validated frames completed by ``data`` and any previously
+            buffered bytes, in stream order.
+        """
+        self.append(data, timeNs)
+        return self.extractAll()
+
+    def extractAll(self) -> list:
+        """Pop every complete, CRC-validated frame from the buffer.
+
+        Returns
+        -------
+        list of RtcmFrame
+            The buffered frames, in stream order.
+        """
+        frames = []
+        while True:
+            frame = self.extract()
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def extract(self):
+        """Pop the next CRC-validated frame from the buffer.
+
+        Returns
+        -------
+        RtcmFrame or None
+            The next frame, or ``None`` if no complete frame is buffered.
+        """
+        buffer = self.buffer
+        while True:
+            framePos = buffer.find(b"\xd3", self.offset)
+            if framePos < 0:
+                self.bytesSkipped += len(buffer) - self.offset
+                buffer.clear()
+                self.offset = 0
+                return None
+            self.bytesSkipped += framePos - self.offset
+            self.offset = framePos
+            if len(buffer) - framePos < 3:
+                break
+            payloadLength = ((buffer[framePos + 1] & 0x03) << 8) | buffer[framePos + 2]
+            if buffer[framePos + 1] & 0xFC:
+                # Reserved bits must be zero.
+                self.headerRejects += 1
+                self.bytesSkipped += 1
+                self.offset = framePos + 1
+                continue
+            frameEnd = framePos + payloadLength + 6
+            if len(buffer) < frameEnd:
+                break
+            frame = bytes(buffer[framePos:frameEnd])
+            calcCrc = crc24q(memoryview(frame)[:-3])
+            frameCrc = int.from_bytes(frame[-3:], "big")
+            if calcCrc == frameCrc:
+                self.aligned = True
+                self.offset = frameEnd
+                self.framesEmitted += 1
+                self._compact()
+                return RtcmFrame(frame, self.timeNs)
+            self.aligned = False
+            self.crcFailures += 1
+            self.bytesSkipped += 1
+            self.offset = framePos + 1
+            logging.warning(
+                f"{self.name}:CRC mismatch {hex(calcCrc)} != {hex(frameCrc)}."
+                " Realigning!"
+            )
+        self._compact()
+        return None
+
+    def _compact(self) -> None:
+        """Drop the consumed head of the buffer once it is large enough."""
+        if self.offset >= self.compactSize:
+            del self.buffer[: self.offset]
+            self.offset = 0
+
+
+class ChunkedDecoder:
+    """Incrementally decode an HTTP chunked transfer-encoded body.
+
+    Accepts the body in arbitrary pieces, so chunk size lines, payloads and
+    their terminating CRLF may be split across reads. Chunk extensions
+    (``;name=value``, RTCM 10410.1 sec. 2.4) and blank size lines are ignored.
+    Decoding stops at the terminating zero-length chunk; trailers are not
+    parsed.
+
+    Parameters
+    ----------
+    maxLineLength : int, optional
+        Longest accepted chunk size line in bytes. The default is 1024.
+
+    Attributes
+    ----------
+    done : bool
+        ``True`` once the terminating zero-length chunk has been received.
+    """
+
+    def __init__(self, maxLineLength: int = 1024):
+        self.maxLineLength = maxLineLength
+        self.line = bytearray()
+        self.remaining = 0
+        self.state = "size"
+        self.done = False
+
+    def feed(self, data) -> bytes:
+        """Decode the next piece of a chunked body.
+
+        Parameters
+        ----------
+        data : bytes or bytearray
+            The received bytes.
+
+        Raises
+        ------
+        IOError
+            If a chunk size line is malformed or too long, or a chunk does not
+            end with CRLF.
+
+        Returns
+        -------
+        bytes
+            The chunk payload bytes contained in ``data``.
+        """
+        payload = bytearray()
+        pos = 0
+        length = len(data)
+        while pos < length and not self.done:
+            if self.state == "data":
+                end = min(pos + self.remaining, length)
+                payload += data[pos:end]
+                self.remaining -= end - pos
+                pos = end
+                if self.remaining == 0:
+                    self.state = "dataEnd"
+                continue
+            lineEnd = data.find(b"\n", pos)
+            if lineEnd < 0:
+                self.line += data[pos:]
+                if len(self.line) > self.maxLineLength:
+                    raise IOError("Chunk malformed ")
+                break
+            self.line += data[pos : lineEnd + 1]
+            pos = lineEnd + 1
+            line = bytes(self.line).strip()
+            self.line.clear()
+            self._processLine(line)
+        return bytes(payload)
+
+    def _processLine(self, line: bytes) -> None:
+        """Handle a complete chunk size line or chunk terminator."""
+        if self.state == "dataEnd":
+            if line:
+                raise IOError("Chunk malformed ")
+            self.state = "size"
+            return
+        sizeField = line.split(b";", 1)[0].strip()
+        if not sizeField:
+            return
+        try:
+            self.remaining = int(sizeField, 16)
+        except ValueError:
+            raise IOError("Chunk malformed ") from None
+        if self.remaining == 0:
+            self.done = True
+        else:
+            self.state = "data"
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Concurrent harvesting of source tables from many casters.
+
+Defines :func:`harvestSourcetables`, which fetches the source tables of many
+casters at once and merges them into a single indexed
+:class:`~ntripstreams.sourcetable.Sourcetable`.
+
+@author: Lars Stenseng
+@mail: lars@stenseng.net
+"""
+
+import asyncio
+import logging
+from collections import namedtuple
+from time import monotonic
+
+from ntripstreams.ntripstreams import NtripStream
+from ntripstreams.sourcetable import Sourcetable, parseSourcetableLine
+
+HarvestResult = namedtuple("HarvestResult", ["sourcetable", "errors", "elapsed"])
+HarvestResult.__doc__ = """The merged source table of a harvest and its failures."""
+
+
+async def _fetchLines(casterUrl: str, timeout: float, cache) -> list:
+    """Fetch the complete source table lines of one caster."""
+    if cache is not None:
+        return await asyncio.wait_for(cache.getLines(casterUrl), timeout)
+    ntripStream = NtripStream()
+    try:
+        lines = await asyncio.wait_for(
+            ntripStream.requestSourcetable(casterUrl), timeout
+        )
+    finally:
+        if ntripStream.ntripWriter is not None:
+            ntripStream.ntripWriter.close()
+    if not lines or lines[-1] != "ENDSOURCETABLE":
+        raise ConnectionError(f"Incomplete source table from {casterUrl}")
+    return lines
+
+
+async def harvestSourcetables(
+    casterUrls,
+    maxConcurrency: int = 16,
+    timeout: float = 30.0,
+    cache=None,
+    cellSize: float = 1.0,
+) -> HarvestResult:
+    """Fetch the source tables of many casters concurrently and merge them.
+
+    Up to ``maxConcurrency`` casters are contacted at once, so a harvest
+    takes about as long as the slowest caster rather than the sum of all of
+    them. A caster that fails or exceeds ``timeout`` is reported in
+    ``errors`` and the others are merged regardless.
+
+    The tables are merged in the order of ``casterUrls``, whatever order
+    they arrive in: a mountpoint offered by several casters is kept from the
+    first of them, and the dropped copies are listed in the ``duplicates`` of
+    the merged table.
+
+    Parameters
+    ----------
+    casterUrls : iterable of str
+        Caster URLs and ports, e.g. ``http[s]://caster.hostname.net:port``,
+        in order of preference.
+    maxConcurrency : int, optional
+        Number of casters fetched at once. The default is 16.
+    timeout : float, optional
+        Time limit in seconds for fetching one source table. The default is
+        30.
+    cache : SourcetableCache, optional
+        Cache used to fetch the source tables. The default is None, to
+        always contact the casters.
+    cellSize : float, optional
+        Size of the spatial grid cells in degrees. The default is 1.0.
+
+    Returns
+    -------
+    HarvestResult
+        The merged ``sourcetable``, with the caster URL of each stream in its
+        ``sources``, the ``errors`` as a dict of caster URL to exception and
+        the ``elapsed`` time in seconds.
+    """
+    casterUrls = list(dict.fromkeys(casterUrls))
+    semaphore = asyncio.Semaphore(maxConcurrency)
+    start = monotonic()
+
+    async def fetch(casterUrl):
+        async with semaphore:
+            try:
+                return await _fetchLines(casterUrl, timeout, cache)
+            except Exception as error:
+                # Any failure is the caster's; it must not abort the others.
+                logging.warning(f"{casterUrl}: Source table harvest failed: {error!r}")
+                return error
+
+    results = await asyncio.gather(*(fetch(casterUrl) for casterUrl in casterUrls))
+    sourcetable = Sourcetable(cellSize=cellSize, unique=True)
+    errors = {}
+    for casterUrl, result in zip(casterUrls, results):
+        if isinstance(result, BaseException):
+            errors[casterUrl] = result
+            continue
+        for line in result:
+            record = parseSourcetableLine(line)
+            if record is not None:
+                sourcetable.addRecord(record, casterUrl)
+    sourcetable.complete = not errors
+    return HarvestResult(sourcetable, errors, monotonic() - start)
@@ -4,7 +4,9 @@
 
 Defines :class:`NtripStream`, an ``asyncio``-based class for connecting to an
 NTRIP caster, requesting source tables and streams, publishing as a server, and
-framing RTCM 3 messages from the received byte stream.
+framing RTCM 3 messages from the received byte stream, plus
+:class:`NtripProtocol`, a low-level transport protocol that feeds received data
+straight into the RTCM 3 framer.
 
 @author: Lars Stenseng
 @mail: lars@stenseng.net
@@ -13,14 +15,15 @@ framing RTCM 3 messages from the received byte stream.
 import asyncio
 import logging
 from base64 import b64encode
-from time import gmtime, strftime, time
+from time import gmtime, monotonic, strftime, time
 from typing import Union
 from urllib.parse import urlsplit
 
-from bitstring import Bits, BitStream
+from bitstring import BitStream
 
 from ntripstreams.__version__ import __version__
-from ntripstreams.crc import crc24q
+from ntripstreams.framer import ChunkedDecoder, RtcmFrame, RtcmFramer
+from ntripstreams.sourcetable import parseSourcetableLine
 
 
 class NtripStream:
@@ -28,13 +31,78 @@ class NtripStream:
 
     A single instance holds the connection to one caster and the state used
     while framing RTCM 3 messages. Typical client use is to call
-    :meth:`requestSourcetable` to list mountpoints, or
-    :meth:`requestNtripStream` followed by repeated :meth:`getRtcmFrame` calls
-    to read the stream. Server use publishes with :meth:`requestNtripServer`
-    and :meth:`sendRtcmFrame`.
+    :meth:`requestSourcetable` (or :meth:`iterSourcetable` to parse records as
+    they arrive) to list mountpoints, or :meth:`requestNtripStream` followed
+    by repeated :meth:`getRtcmFrame` calls or an ``async for`` loop over the
+    instance to read the stream. Server use publishes with
+    :meth:`requestNtripServer` and :meth:`sendRtcmFrame`.
+
+    Iterating over the instance starts a reader task that fills a bounded
+    queue of ``(frame, timestamp)`` tuples; ``overflowPolicy`` decides what
+    happens when the consumer falls ``maxQueueSize`` frames behind.
+
+    Connecting, waiting for the response header and waiting for data are
+    each bounded by a timeout. A stream that receives nothing for
+    ``idleTimeout`` seconds has stalled: the stall is counted and, with
+    ``reconnectOnStall``, a stream opened with :meth:`requestNtripStream` or
+    :meth:`requestNtripStreamProtocol` is requested again at once, so reading
+    continues after a short gap. Otherwise the stall surfaces as a
+    :class:`TimeoutError`, and :meth:`reconnectNtripStream` requests the
+    stream again; a failed reconnect surfaces as its error.
+
+    Parameters
+    ----------
+    maxQueueSize : int, optional
+        High-water mark of the frame queue used by ``async for``. The default
+        is 256.
+    overflowPolicy : str, optional
+        ``"block"`` stops reading the socket until the consumer catches up,
+        ``"dropOldest"`` discards the oldest queued frame and ``"dropNewest"``
+        discards the frame just received. The default is ``"block"``.
+    connectTimeout : float, optional
+        Time limit in seconds for opening the connection, or None for no
+        limit. The default is 10.
+    headerTimeout : float, optional
+        Time limit in seconds for receiving the response header, or None for
+        no limit. The default is 10.
+    idleTimeout : float, optional
+        Time in seconds without received data after which a stream or source
+        table has stalled, or None for no limit. The default is 30.
+    reconnectOnStall : bool, optional
+        Request a stalled stream again instead of raising. The default is
+        True.
+
+    Attributes
+    ----------
+    rtcmStalls : int
+        Stalls detected on the stream.
+    rtcmReconnects : int
+        Successful reconnects.
+    rtcmReconnectFailures : int
+        Failed reconnects.
+    rtcmLastRecoveryTime : float or None
+        Seconds from the last data before the latest stall to the first data
+        after it.
+    rtcmMaxRecoveryTime : float
+        Longest recovery time in seconds.
     """
 
-    def __init__(self):
+    overflowPolicies = ("block", "dropOldest", "dropNewest")
+
+    def __init__(
+        self,
+        maxQueueSize: int = 256,
+        overflowPolicy: str = "block",
+        connectTimeout: float = 10.0,
+        headerTimeout: float = 10.0,
+        idleTimeout: float = 30.0,
+        reconnectOnStall: bool = True,
+    ):
+        if overflowPolicy not in self.overflowPolicies:
+            raise ValueError(
+                f"Unknown overflow policy {overflowPolicy!r}, "
+                f"expected one of {self.overflowPolicies}"
+            )
         self.__CLIENTVERSION = __version__
         self.__CLIENTNAME = "Bedrock_Solutions_NtripClient/" + f"{self.__CLIENTVERSION}"
         self.casterUrl = None
@@ -47,10 +115,32 @@ class NtripStream:
         self.ntripResponseHeader = []
         self.ntripResponseStatusCode = None
         self.ntripStreamChunked = False
+        self.ntripChunkedDecoder = None
         self.nmeaString = ""
-        self.rtcmFrameBuffer = BitStream()
-        self.rtcmFramePreample = False
-        self.rtcmFrameAligned = False
+        self.rtcmFramer = RtcmFramer()
+        self.rtcmFrameTimeStamp = None
+        self.rtcmQueueSize = maxQueueSize
+        self.rtcmOverflowPolicy = overflowPolicy
+        self.rtcmFramesDropped = 0
+        self.rtcmQueue = None
+        self.rtcmReaderTask = None
+        self.rtcmReaderError = None
+        self.rtcmProtocol = None
+        self.connectTimeout = connectTimeout
+        self.headerTimeout = headerTimeout
+        self.idleTimeout = idleTimeout
+        self.reconnectOnStall = reconnectOnStall
+        self.ntripStreamRequest = None
+        self.rtcmFrameCallback = None
+        self.rtcmReconnectTask = None
+        self.rtcmReconnecting = False
+        self.rtcmLastDataTime = None
+        self.rtcmStallStart = None
+        self.rtcmStalls = 0
+        self.rtcmReconnects = 0
+        self.rtcmReconnectFailures = 0
+        self.rtcmLastRecoveryTime = None
+        self.rtcmMaxRecoveryTime = 0.0
 
     async def openNtripConnection(self, casterUrl: str) -> bool:
         """Open a TCP (or TLS) connection to an NTRIP caster.
@@ -64,7 +154,8 @@ class NtripStream:
         Raises
         ------
         TimeoutError
-            If the connection attempt times out.
+            If the connection attempt times out or exceeds
+            ``self.connectTimeout``.
         OSError
             If the connection cannot be established.
 
@@ -75,14 +166,15 @@ class NtripStream:
         """
         self.casterUrl = urlsplit(casterUrl)
         try:
-            if self.casterUrl.scheme == "https":
-                self.ntripReader, self.ntripWriter = await asyncio.open_connection(
-                    self.casterUrl.hostname, self.casterUrl.port, ssl=True
-                )
-            else:
-                self.ntripReader, self.ntripWriter = await asyncio.open_connection(
-                    self.casterUrl.hostname, self.casterUrl.port
-                )
+            self.ntripReader, self.ntripWriter = await self._wait(
+                asyncio.open_connection(
+                    self.casterUrl.hostname,
+                    self.casterUrl.port,
+                    ssl=True if self.casterUrl.scheme == "https" else None,
+                ),
+                self.connectTimeout,
+                "connection",
+            )
         except TimeoutError as error:
             logging.error(f"Connection to {casterUrl} timed out: {error}")
             raise TimeoutError(
@@ -97,25 +189,79 @@ class NtripStream:
         )
         return True
 
-    def setRequestSourceTableHeader(self, casterUrl: str) -> None:
+    async def _wait(self, awaitable, timeout: float, what: str):
+        """Await ``awaitable`` for at most ``timeout`` seconds.
+
+        A :class:`TimeoutError` raised by ``awaitable`` itself, e.g. an
+        operating system connect timeout, is passed on unchanged.
+
+        Raises
+        ------
+        TimeoutError
+            If ``awaitable`` is not done within ``timeout`` seconds.
+        """
+        if timeout is None:
+            return await awaitable
+        if hasattr(asyncio, "timeout"):
+            # Python 3.11+: a deadline on the current task, without the
+            # extra task per call of asyncio.wait_for.
+            deadline = asyncio.timeout(timeout)
+            try:
+                async with deadline:
+                    return await awaitable
+            except TimeoutError:
+                if not deadline.expired():
+                    raise
+                raise self._timeoutError(what, timeout) from None
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            # Before 3.11 only wait_for raises asyncio.TimeoutError; an
+            # operating system timeout is the distinct builtin TimeoutError.
+            raise self._timeoutError(what, timeout) from None
+
+    def _timeoutError(self, what: str, timeout: float) -> TimeoutError:
+        """Return the error for ``what`` not received within ``timeout`` s."""
+        return TimeoutError(
+            f"No {what} from {self.casterUrl.netloc} within {timeout} s"
+        )
+
+    def setRequestSourceTableHeader(
+        self, casterUrl: str, ifModifiedSince: str = None, etag: str = None
+    ) -> None:
         """Build the request header used to fetch a caster's source table.
 
-        The result is stored on ``self.ntripRequestHeader``.
+        The result is stored on ``self.ntripRequestHeader``. With
+        ``ifModifiedSince`` or ``etag`` the request is conditional, and a
+        caster that supports it answers ``304 Not Modified`` if the source
+        table is unchanged.
 
         Parameters
         ----------
         casterUrl : str
             Caster URL and port, e.g. ``http[s]://caster.hostname.net:port``.
+        ifModifiedSince : str, optional
+            ``Last-Modified`` value of a previous response, sent as
+            ``If-Modified-Since``. The default is None.
+        etag : str, optional
+            ``ETag`` value of a previous response, sent as ``If-None-Match``.
+            The default is None.
         """
         self.casterUrl = urlsplit(casterUrl)
         timestamp = strftime("%a, %d %b %Y %H:%M:%S GMT", gmtime())
+        conditional = ""
+        if ifModifiedSince:
+            conditional += f"If-Modified-Since: {ifModifiedSince}\r\n"
+        if etag:
+            conditional += f"If-None-Match: {etag}\r\n"
         self.ntripRequestHeader = (
             f"GET / HTTP/1.1\r\n"
             f"Host: {self.casterUrl.netloc}\r\n"
             f"Ntrip-Version: Ntrip/"
             f"{self.ntripVersion}.0\r\n"
             f"User-Agent: NTRIP {self.__CLIENTNAME}\r\n"
-            f"Date: {timestamp}\r\n"
+            + conditional
+            + f"Date: {timestamp}\r\n"
             f"Connection: close\r\n"
             f"\r\n"
         ).encode("ISO-8859-1")
@@ -266,8 +412,23 @@ class NtripStream:
         ------
         ConnectionError
             If the connection fails while reading the response header.
+        TimeoutError
+            If the header is not received within ``self.headerTimeout``.
         """
         self.ntripResponseHeader = []
+        try:
+            rawHeader = await self._wait(
+                self._readResponseHeader(), self.headerTimeout, "response header"
+            )
+        except TimeoutError as error:
+            logging.error(f"{self.ntripMountPoint}: {error}")
+            if self.ntripWriter is not None:
+                self.ntripWriter.close()
+            raise
+        self.setNtripResponseHeader(rawHeader)
+
+    async def _readResponseHeader(self) -> list:
+        """Read the raw lines of the response header."""
         ntripResponseHeaderTimestamp = []
         rawHeader = []
         while True:
@@ -284,11 +445,35 @@ class NtripStream:
             rawHeader.append(line)
             if line.decode("ISO-8859-1").rstrip() == "":
                 break
+        return rawHeader
+
+    def setNtripResponseHeader(self, rawHeader: list) -> None:
+        """Parse the raw lines of the caster's HTTP response header.
+
+        Populates ``self.ntripResponseHeader``, ``self.ntripStreamChunked`` and
+        ``self.ntripResponseStatusCode``.
+
+        Parameters
+        ----------
+        rawHeader : list of bytes
+            The raw header lines, including the terminating empty line.
+
+        Raises
+        ------
+        ConnectionError
+            If the caster closed the connection without a response header.
+        """
         self.ntripResponseHeader = self.getHeaderStrings(rawHeader)
-        if "Transfer-Encoding: chunked".lower() in [
+        if not self.ntripResponseHeader:
+            logging.error(f"{self.casterUrl}: Connection closed without response.")
+            raise ConnectionError(
+                f"Connection to {self.casterUrl} closed before the response header."
+            )
+        self.ntripStreamChunked = "Transfer-Encoding: chunked".lower() in [
             line.lower() for line in self.ntripResponseHeader
-        ]:
-            self.ntripStreamChunked = True
+        ]
+        if self.ntripStreamChunked:
+            self.ntripChunkedDecoder = ChunkedDecoder()
             logging.info(f"{self.ntripMountPoint}: Stream is chunked")
         statusResponse = self.ntripResponseHeader[0].split(" ")
         if statusResponse[0] == "OK":
@@ -300,6 +485,27 @@ class NtripStream:
         else:
             self.ntripResponseStatusCode = 0
 
+    def getResponseHeaderField(self, name: str):
+        """Return the value of a response header field.
+
+        Parameters
+        ----------
+        name : str
+            Field name, e.g. ``"ETag"`` (case-insensitive).
+
+        Returns
+        -------
+        str or None
+            The value of the first matching field, or ``None`` if the response
+            has no such field.
+        """
+        name = name.lower()
+        for line in self.ntripResponseHeader[1:]:
+            field, sep, value = line.partition(":")
+            if sep and field.strip().lower() == name:
+                return value.strip()
+        return None
+
     def ntripResponseStatusOk(self) -> bool:
         """Check whether the caster returned HTTP status 200.
 
@@ -315,8 +521,6 @@ class NtripStream:
             ``True`` when the caster responded with status 200.
         """
         if self.ntripResponseStatusCode == "200":
-            self.rtcmFramePreample = False
-            self.rtcmFrameAligned = False
             return True
         else:
             logging.error(
@@ -325,114 +529,209 @@ class NtripStream:
             )
             for line in self.ntripResponseHeader:
                 logging.error(f"{self.ntripMountPoint}: TCP response: {line}")
-            self.ntripWriter.close()
+            if self.rtcmProtocol is not None:
+                self.rtcmProtocol.transport.close()
+            else:
+                self.ntripWriter.close()
             raise ConnectionError(
                 f"{self.ntripMountPoint}: {self.ntripResponseHeader[0]}"
             )
 
-    async def sendRequestHeader(self) -> None:
+    async def sendRequestHeader(self, acceptNotModified: bool = False) -> None:
         """Send the prepared request header and read the caster's response.
 
         Writes ``self.ntripRequestHeader`` to the caster, then reads the
         response header and validates the status code.
+
+        Parameters
+        ----------
+        acceptNotModified : bool, optional
+            Accept ``304 Not Modified``, the answer to a conditional request,
+            as well as 200. The default is False.
         """
         self.ntripWriter.write(self.ntripRequestHeader)
         await self.ntripWriter.drain()
         logging.info(f"{self.ntripMountPoint}: Request sent.")
         await self.getNtripResponseHeader()
+        if acceptNotModified and self.ntripResponseStatusCode == "304":
+            logging.info(f"{self.casterUrl.netloc}: Not modified.")
+            return
         if self.ntripResponseStatusOk():
             for line in self.ntripResponseHeader:
                 logging.debug(f"TCP response: {line}")
 
-    async def _readChunkedBody(self) -> bytes:
-        """Read an HTTP chunked-transfer body and return the decoded bytes.
+    async def _readChunkedLines(self):
+        """Yield the lines of an HTTP chunked-transfer body as they arrive.
 
-        Reads chunks until the terminating zero-length chunk or end of stream,
-        stripping the hex size lines and any ``;extension`` (RTCM 10410.1
-        sec. 2.4).
+        The received data is fed to ``self.ntripChunkedDecoder`` until the
+        terminating zero-length chunk or the end of the stream (RTCM 10410.1
+        sec. 2.4); only the current, incomplete line is buffered between
+        reads.
 
-        Returns
-        -------
-        bytes
-            The concatenated chunk payloads.
+        Raises
+        ------
+        IOError
+            If a chunk is malformed.
+
+        Yields
+        ------
+        str
+            The next line, without the line ending.
         """
-        body = bytearray()
-        while True:
-            try:
-                sizeLine = await self.ntripReader.readuntil(b"\r\n")
-            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        line = bytearray()
+        while not self.ntripChunkedDecoder.done:
+            rawData = await self._wait(
+                self.ntripReader.read(2048), self.idleTimeout, "source table data"
+            )
+            if not rawData:
                 break
-            sizeField = sizeLine[:-2].split(b";", 1)[0].strip()
-            if not sizeField:
-                continue
             try:
-                length = int(sizeField, 16)
-            except ValueError:
-                break
-            if length == 0:
-                break
+                data = self.ntripChunkedDecoder.feed(rawData)
+            except IOError:
+                logging.error(f"{self.casterUrl.netloc}: Chunk malformed.")
+                raise
+            start = 0
+            while (end := data.find(b"\n", start)) >= 0:
+                line += data[start:end]
+                yield line.decode("ISO-8859-1").rstrip()
+                line.clear()
+                start = end + 1
+            line += data[start:]
+        if line:
+            yield line.decode("ISO-8859-1").rstrip()
+
+    async def _readSourcetableLines(self):
+        """Yield the lines of a plain source table body as they arrive.
+
+        Raises
+        ------
+        ConnectionError
+            If the connection fails while receiving the source table.
+
+        Yields
+        ------
+        str
+            The next line, without the line ending.
+        """
+        while True:
             try:
-                chunk = await self.ntripReader.readexactly(length + 2)
-            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                line = await self._wait(
+                    self.ntripReader.readline(), self.idleTimeout, "source table data"
+                )
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError) as error:
+                logging.error(f"Connection to {self.casterUrl} failed with: {error}")
+                raise ConnectionError(
+                    f"Connection to {self.casterUrl} failed with: {error}"
+                ) from None
+            if not line:
                 break
-            body += chunk[:-2]
-        return bytes(body)
+            yield line.decode("ISO-8859-1").rstrip()
 
-    async def requestSourcetable(self, casterUrl: str) -> list:
-        """Connect to a caster and return its full source table.
+    async def iterSourcetableLines(
+        self, casterUrl: str, ifModifiedSince: str = None, etag: str = None
+    ):
+        """Connect to a caster and yield its source table line by line.
+
+        Lines are yielded as they are received, so memory use is bounded by a
+        single line regardless of the size of the source table. The
+        connection is closed after ``ENDSOURCETABLE``, at the end of the
+        stream, or when the generator is closed early.
+
+        A conditional request (see :meth:`setRequestSourceTableHeader`)
+        answered with ``304 Not Modified`` yields no lines and leaves
+        ``self.ntripResponseStatusCode`` at ``"304"``.
 
         Parameters
         ----------
         casterUrl : str
             Caster URL and port, e.g. ``http[s]://caster.hostname.net:port``.
+        ifModifiedSince : str, optional
+            ``Last-Modified`` value of a previous response. The default is
+            None.
+        etag : str, optional
+            ``ETag`` value of a previous response. The default is None.
 
         Raises
         ------
         ConnectionError
             If the connection fails while receiving the source table.
 
-        Returns
-        -------
-        list of str
+        Yields
+        ------
+        str
             The source table lines, ending with ``ENDSOURCETABLE``.
         """
         await self.openNtripConnection(casterUrl)
-        self.setRequestSourceTableHeader(casterUrl)
-        await self.sendRequestHeader()
-        ntripSourcetable = []
+        self.setRequestSourceTableHeader(casterUrl, ifModifiedSince, etag)
+        try:
+            await self.sendRequestHeader(acceptNotModified=True)
+        except BaseException:
+            self.ntripWriter.close()
+            raise
+        if self.ntripResponseStatusCode == "304":
+            self.ntripWriter.close()
+            return
         if self.ntripStreamChunked:
             # A caster may send the source table with chunked transfer encoding
-            # (RTCM 10410.1 sec. 2.4); decode it before splitting into lines.
-            body = await self._readChunkedBody()
-            for line in body.decode("ISO-8859-1").splitlines():
-                ntripSourcetable.append(line)
-                if line == "ENDSOURCETABLE":
-                    break
-            self.ntripWriter.close()
-            logging.info("Sourcetabel received.")
+            # (RTCM 10410.1 sec. 2.4).
+            lines = self._readChunkedLines()
         else:
-            while True:
-                try:
-                    line = await self.ntripReader.readline()
-                except (
-                    asyncio.IncompleteReadError,
-                    asyncio.LimitOverrunError,
-                ) as error:
-                    logging.error(
-                        f"Connection to {self.casterUrl} failed with: {error}"
-                    )
-                    raise ConnectionError(
-                        f"Connection to {self.casterUrl} failed with: {error}"
-                    ) from None
-                if not line:
-                    break
-                line = line.decode("ISO-8859-1").rstrip()
-                ntripSourcetable.append(line)
+            lines = self._readSourcetableLines()
+        try:
+            async for line in lines:
+                yield line
                 if line == "ENDSOURCETABLE":
-                    self.ntripWriter.close()
-                    logging.info("Sourcetabel received.")
+                    logging.info("Sourcetable received.")
                     break
-        return ntripSourcetable
+        finally:
+            await lines.aclose()
+            self.ntripWriter.close()
+
+    async def iterSourcetable(self, casterUrl: str):
+        """Connect to a caster and yield its parsed source table records.
+
+        Parameters
+        ----------
+        casterUrl : str
+            Caster URL and port, e.g. ``http[s]://caster.hostname.net:port``.
+
+        Raises
+        ------
+        ConnectionError
+            If the connection fails while receiving the source table.
+
+        Yields
+        ------
+        StrRecord, CasRecord or NetRecord
+            The records of the ``STR``, ``CAS`` and ``NET`` lines, see
+            :func:`~ntripstreams.sourcetable.parseSourcetableLine`.
+        """
+        async for line in self.iterSourcetableLines(casterUrl):
+            record = parseSourcetableLine(line)
+            if record is not None:
+                yield record
+
+    async def requestSourcetable(self, casterUrl: str) -> list:
+        """Connect to a caster and return its full source table.
+
+        Collects the lines of :meth:`iterSourcetableLines`.
+
+        Parameters
+        ----------
+        casterUrl : str
+            Caster URL and port, e.g. ``http[s]://caster.hostname.net:port``.
+
+        Raises
+        ------
+        ConnectionError
+            If the connection fails while receiving the source table.
+
+        Returns
+        -------
+        list of str
+            The source table lines, ending with ``ENDSOURCETABLE``.
+        """
+        return [line async for line in self.iterSourcetableLines(casterUrl)]
 
     async def requestNtripServer(
         self,
@@ -483,123 +782,569 @@ class NtripStream:
             Password for basic authentication. The default is None.
         """
         self.ntripMountPoint = mountPoint
+        self.ntripStreamRequest = (casterUrl, mountPoint, user, passwd)
+        self.rtcmFramer.name = mountPoint
+        self.rtcmFramer.reset()
+        self.rtcmProtocol = None
         await self.openNtripConnection(casterUrl)
         self.setRequestStreamHeader(
             self.casterUrl.geturl(), self.ntripMountPoint, user, passwd
         )
         await self.sendRequestHeader()
 
-    async def sendRtcmFrame(self, rtcmFrame: BitStream) -> None:
+    async def reconnectNtripStream(self) -> None:
+        """Close the connection and request the last requested stream again.
+
+        A stream opened with :meth:`requestNtripStreamProtocol` is requested
+        again in protocol mode, delivering to the same callback or queue.
+
+        Raises
+        ------
+        OSError
+            If the connection cannot be established.
+        ConnectionError
+            If the caster does not respond with status 200.
+        TimeoutError
+            If connecting or receiving the response header times out.
+        """
+        logging.warning(f"{self.ntripMountPoint}: Reconnecting.")
+        self.rtcmReconnecting = True
+        try:
+            if self.rtcmProtocol is not None:
+                self.rtcmProtocol.transport.abort()
+                if self.rtcmReaderTask.done() and self.rtcmQueue.empty():
+                    # The stream has ended and been read to its end.
+                    self.rtcmQueue = asyncio.Queue(self.rtcmQueueSize)
+                    self.rtcmReaderError = None
+                    self.rtcmReaderTask = asyncio.get_running_loop().create_future()
+                await self._openNtripProtocol()
+            else:
+                if self.ntripWriter is not None:
+                    self.ntripWriter.close()
+                await self.requestNtripStream(*self.ntripStreamRequest)
+        except OSError as error:
+            self.rtcmReconnectFailures += 1
+            logging.error(f"{self.ntripMountPoint}: Reconnect failed: {error}")
+            raise
+        finally:
+            self.rtcmReconnecting = False
+        self.rtcmReconnects += 1
+
+    async def requestNtripStreamProtocol(
+        self,
+        casterUrl: str,
+        mountPoint: str,
+        user: str = None,
+        passwd: str = None,
+        frameCallback=None,
+    ) -> None:
+        """Connect to a caster with a low-level protocol and request a stream.
+
+        Instead of an :class:`asyncio.StreamReader`, the connection is served
+        by an :class:`NtripProtocol` whose ``data_received`` feeds
+        ``self.rtcmFramer`` directly. Each validated frame is handed to
+        ``frameCallback`` in the same event loop iteration, or, without a
+        callback, queued for ``async for`` iteration under the instance's
+        overflow policy; iterating a stream with a callback raises
+        :class:`RuntimeError`. :meth:`getRtcmFrame` and :meth:`getRtcmFrames`
+        are not used in this mode. ``self.rtcmReaderTask`` completes when the
+        stream ends.
+
+        The protocol watches the connection for stalls: after
+        ``idleTimeout`` seconds without data the connection is aborted and,
+        with ``reconnectOnStall``, the stream is requested again. Otherwise,
+        or if the reconnect fails, the stream ends with the error.
+
+        Parameters
+        ----------
+        casterUrl : str
+            Caster URL and port, e.g. ``http[s]://caster.hostname.net:port``.
+        mountPoint : str
+            Mountpoint name to consume, without the leading ``/``.
+        user : str, optional
+            Username for basic authentication. The default is None.
+        passwd : str, optional
+            Password for basic authentication. The default is None.
+        frameCallback : callable, optional
+            Called as ``frameCallback(frame, timeStamp)`` for every validated
+            frame. The default is None.
+
+        Raises
+        ------
+        OSError
+            If the connection cannot be established.
+        ConnectionError
+            If the connection is lost before the response header or the
+            caster does not respond with status 200.
+        TimeoutError
+            If connecting or receiving the response header times out.
+        """
+        self.ntripMountPoint = mountPoint
+        self.ntripStreamRequest = (casterUrl, mountPoint, user, passwd)
+        self.rtcmFrameCallback = frameCallback
+        self.rtcmFramer.name = mountPoint
+        self.rtcmQueue = asyncio.Queue(self.rtcmQueueSize)
+        self.rtcmReaderError = None
+        self.rtcmReaderTask = asyncio.get_running_loop().create_future()
+        await self._openNtripProtocol()
+
+    async def _openNtripProtocol(self) -> None:
+        """Connect an :class:`NtripProtocol` for ``self.ntripStreamRequest``.
+
+        Raises
+        ------
+        OSError
+            If the connection cannot be established.
+        ConnectionError
+            If the connection is lost before the response header or the
+            caster does not respond with status 200.
+        TimeoutError
+            If connecting or receiving the response header times out.
+        """
+        casterUrl, mountPoint, user, passwd = self.ntripStreamRequest
+        self.rtcmFramer.reset()
+        self.casterUrl = urlsplit(casterUrl)
+        self.setRequestStreamHeader(
+            self.casterUrl.geturl(), self.ntripMountPoint, user, passwd
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            _, self.rtcmProtocol = await self._wait(
+                loop.create_connection(
+                    lambda: NtripProtocol(self, self.rtcmFrameCallback),
+                    self.casterUrl.hostname,
+                    self.casterUrl.port,
+                    ssl=True if self.casterUrl.scheme == "https" else None,
+                ),
+                self.connectTimeout,
+                "connection",
+            )
+        except TimeoutError as error:
+            logging.error(f"Connection to {casterUrl} timed out: {error}")
+            raise TimeoutError(
+                f"Connection to {casterUrl} timed out: {error}"
+            ) from None
+        except OSError as error:
+            logging.error(f"Connection to {casterUrl} failed with: {error}")
+            raise OSError(f"Connection to {casterUrl} failed with: {error}") from None
+        self.rtcmProtocol.transport.write(self.ntripRequestHeader)
+        logging.info(f"{self.ntripMountPoint}: Request sent.")
+        try:
+            await self._wait(
+                asyncio.shield(self.rtcmProtocol.headerReceived),
+                self.headerTimeout,
+                "response header",
+            )
+        except TimeoutError as error:
+            logging.error(f"{self.ntripMountPoint}: {error}")
+            self.rtcmProtocol.transport.abort()
+            raise
+        try:
+            self.ntripResponseStatusOk()
+        except ConnectionError:
+            self.rtcmProtocol.transport.abort()
+            raise
+        self.rtcmProtocol.deliverRtcmFrames()
+
+    async def sendRtcmFrame(
+        self, rtcmFrame: Union[RtcmFrame, BitStream, bytes]
+    ) -> None:
         """Send a single RTCM 3 frame to the caster.
 
         Parameters
         ----------
-        rtcmFrame : bitstring.BitStream
-            A complete RTCM 3 frame (preamble, payload and CRC). It is
-            converted to bytes before being written.
+        rtcmFrame : RtcmFrame, bitstring.BitStream or bytes
+            A complete RTCM 3 frame (preamble, payload and CRC). Frames and
+            bytes are written as they are; a BitStream is converted to bytes.
         """
-        self.ntripWriter.write(rtcmFrame.tobytes())
+        if isinstance(rtcmFrame, RtcmFrame):
+            rtcmFrame = rtcmFrame.data
+        elif isinstance(rtcmFrame, BitStream):
+            rtcmFrame = rtcmFrame.tobytes()
+        self.ntripWriter.write(rtcmFrame)
         await self.ntripWriter.drain()
 
     async def getRtcmFrame(self):
         """Read the next complete, CRC-validated RTCM 3 frame from the stream.
 
-        Data is buffered until a frame preamble is found and the frame is
-        CRC-24Q verified; on a CRC mismatch the buffer is realigned and the
-        search continues.
+        Received data is framed by ``self.rtcmFramer``, an
+        :class:`~ntripstreams.framer.RtcmFramer`; the socket is only read when
+        no complete frame is buffered.
 
         Raises
         ------
         ConnectionError
-            If the connection fails while receiving data.
+            If the connection fails or is closed while receiving data.
         IOError
-            If a chunk is malformed or incomplete.
+            If a chunk is malformed.
 
         Returns
         -------
-        tuple of (bitstring.BitStream, float)
+        tuple of (RtcmFrame, float)
             The validated RTCM 3 frame and the Unix timestamp at which it was
             received.
         """
-        rtcm3FramePreample = Bits(bin="0b11010011")
-        rtcm3FrameHeaderFormat = "bin:8, pad:6, uint:10"
-        rtcmFrameComplete = False
-        while not rtcmFrameComplete:
-            timeStamp = time()
-            # Only read from the socket when the buffer is running low so it does
-            # not grow faster than frames are consumed. The 16384-bit (2048-byte)
-            # low-water mark stays well above the maximum RTCM3 frame size
-            # (8232 bits) so any single frame can always be fully accumulated.
-            if self.rtcmFrameBuffer.length < 16384:
-                if self.ntripStreamChunked:
-                    try:
-                        rawLine = await self.ntripReader.readuntil(b"\r\n")
-                        length = int(rawLine[:-2].decode("ISO-8859-1"), 16)
-                        rawLine = await self.ntripReader.readexactly(length + 2)
-                    except (
-                        asyncio.IncompleteReadError,
-                        asyncio.LimitOverrunError,
-                    ) as error:
-                        logging.error(
-                            f"Connection to {self.casterUrl} failed with: {error}"
-                            "during data reception."
-                        )
-                        raise ConnectionError(
-                            f"Connection to {self.casterUrl} failed with: {error}"
-                            "during data reception."
-                        ) from None
-                    if rawLine[-2:] != b"\r\n":
-                        logging.error(
-                            f"{self.ntripMountPoint}:Chunk malformed. "
-                            "Expected \r\n as ending. Closing connection!"
-                        )
-                        raise IOError("Chunk malformed ")
-                    receivedBytes = BitStream(rawLine[:-2])
-                    logging.debug(f"Chunk {receivedBytes.length}:{length * 8}. ")
-                else:
-                    rawLine = await self.ntripReader.read(2048)
-                    receivedBytes = BitStream(rawLine)
-                if self.ntripStreamChunked and receivedBytes.length != length * 8:
-                    logging.error(
-                        f"{self.ntripMountPoint}:Chunk incomplete "
-                        f"{receivedBytes.length}:{length * 8}. "
-                        "Closing connection! "
-                    )
-                    raise IOError("Chunk incomplete ")
-                self.rtcmFrameBuffer += receivedBytes
-            if not self.rtcmFrameAligned:
-                rtcmFramePos = self.rtcmFrameBuffer.find(
-                    rtcm3FramePreample, bytealigned=True
+        while True:
+            rtcmFrame = self.rtcmFramer.extract()
+            if rtcmFrame is not None:
+                return rtcmFrame, self.rtcmFrameTimeStamp
+            await self._receiveRtcmData()
+
+    async def getRtcmFrames(self) -> list:
+        """Read every complete, CRC-validated RTCM 3 frame already received.
+
+        Returns all frames buffered by ``self.rtcmFramer`` at once and only
+        waits for the socket when no complete frame is left, so a single read
+        holding several frames costs one call instead of one per frame.
+
+        Raises
+        ------
+        ConnectionError
+            If the connection fails or is closed while receiving data.
+        IOError
+            If a chunk is malformed.
+
+        Returns
+        -------
+        list of tuple of (RtcmFrame, float)
+            The validated RTCM 3 frames in stream order, each with the Unix
+            timestamp at which it was received.
+        """
+        while True:
+            rtcmFrames = self.rtcmFramer.extractAll()
+            if rtcmFrames:
+                timeStamp = self.rtcmFrameTimeStamp
+                return [(rtcmFrame, timeStamp) for rtcmFrame in rtcmFrames]
+            await self._receiveRtcmData()
+
+    async def _receiveRtcmData(self) -> None:
+        """Read the next block of stream data into ``self.rtcmFramer``.
+
+        A stall, no data for ``self.idleTimeout`` seconds, is answered with
+        :meth:`reconnectNtripStream` if ``self.reconnectOnStall`` is set; the
+        next call then reads from the new connection.
+
+        Raises
+        ------
+        ConnectionError
+            If the connection fails or is closed while receiving data.
+        TimeoutError
+            If the stream stalls and is not reconnected.
+        IOError
+            If a chunk is malformed.
+        """
+        if self.ntripStreamChunked and self.ntripChunkedDecoder.done:
+            # The terminating zero-length chunk ends the stream.
+            receivedBytes = b""
+        else:
+            try:
+                receivedBytes = await self._wait(
+                    self.ntripReader.read(2048), self.idleTimeout, "data"
                 )
-                if rtcmFramePos:
-                    firstFrame = rtcmFramePos[0]
-                    self.rtcmFrameBuffer = self.rtcmFrameBuffer[firstFrame:]
-                    self.rtcmFramePreample = True
-                else:
-                    self.rtcmFrameBuffer = BitStream()
-            if self.rtcmFramePreample and self.rtcmFrameBuffer.length >= 48:
-                # Reset the read position before peeking: bitstring >= 4.1.0 no
-                # longer guarantees pos == 0 after slicing/concatenating the
-                # buffer, which would otherwise peek the header at a wrong offset.
-                self.rtcmFrameBuffer.pos = 0
-                rtcmPreAmple, rtcmPayloadLength = self.rtcmFrameBuffer.peeklist(
-                    rtcm3FrameHeaderFormat
+            except TimeoutError as error:
+                self._rtcmStalled(error)
+                if not self.reconnectOnStall or self.ntripStreamRequest is None:
+                    raise
+                await self.reconnectNtripStream()
+                return
+        if not receivedBytes:
+            logging.error(
+                f"{self.ntripMountPoint}:Connection to "
+                f"{self.casterUrl} closed during data reception."
+            )
+            raise ConnectionError(
+                f"Connection to {self.casterUrl} closed during data reception."
+            )
+        if self.ntripStreamChunked:
+            try:
+                receivedBytes = self.ntripChunkedDecoder.feed(receivedBytes)
+            except IOError:
+                logging.error(
+                    f"{self.ntripMountPoint}:Chunk malformed. Closing connection!"
+                )
+                raise
+        self._rtcmDataReceived()
+        self.rtcmFramer.append(receivedBytes)
+
+    def _rtcmStalled(self, error: Exception) -> None:
+        """Count a stall and start timing the recovery from it."""
+        self.rtcmStalls += 1
+        if self.rtcmStallStart is None:
+            self.rtcmStallStart = (
+                monotonic() if self.rtcmLastDataTime is None else self.rtcmLastDataTime
+            )
+        logging.warning(f"{self.ntripMountPoint}: Stream stalled. {error}")
+
+    def _rtcmDataReceived(self) -> None:
+        """Time stamp received data and record the recovery from a stall."""
+        self.rtcmFrameTimeStamp = time()
+        self.rtcmLastDataTime = monotonic()
+        if self.rtcmStallStart is not None:
+            recoveryTime = self.rtcmLastDataTime - self.rtcmStallStart
+            self.rtcmStallStart = None
+            self.rtcmLastRecoveryTime = recoveryTime
+            self.rtcmMaxRecoveryTime = max(self.rtcmMaxRecoveryTime, recoveryTime)
+            logging.info(
+                f"{self.ntripMountPoint}: Stream recovered after {recoveryTime:.1f} s."
+            )
+
+    def __aiter__(self):
+        """Start the reader task and iterate over ``(frame, timestamp)`` tuples.
+
+        Raises
+        ------
+        RuntimeError
+            If the stream was requested in protocol mode with a
+            ``frameCallback``, which receives all the frames instead.
+        """
+        if self.rtcmProtocol is not None:
+            if self.rtcmProtocol.frameCallback is not None:
+                raise RuntimeError(
+                    f"{self.ntripMountPoint}: Frames are delivered to the "
+                    "frameCallback; async for needs a stream requested without one."
                 )
-                rtcmFrameLength = (rtcmPayloadLength + 6) * 8
-                if self.rtcmFrameBuffer.length >= rtcmFrameLength:
-                    rtcmFrame = self.rtcmFrameBuffer[:rtcmFrameLength]
-                    calcCrc = crc24q(rtcmFrame[:-24])
-                    frameCrc = rtcmFrame[-24:].unpack("uint:24")
-                    if calcCrc == frameCrc[0]:
-                        self.rtcmFrameAligned = True
-                        self.rtcmFrameBuffer = self.rtcmFrameBuffer[rtcmFrameLength:]
-                        rtcmFrameComplete = True
-                    else:
-                        self.rtcmFrameAligned = False
-                        self.rtcmFrameBuffer = self.rtcmFrameBuffer[8:]
-                        logging.warning(
-                            f"{self.ntripMountPoint}:CRC mismatch "
-                            f"{hex(calcCrc)} != {rtcmFrame[-24:]}."
-                            f" Realigning!"
-                        )
-        return rtcmFrame, timeStamp
+            return self
+        if self.rtcmReaderTask is None or (
+            self.rtcmReaderTask.done() and self.rtcmQueue.empty()
+        ):
+            self.rtcmQueue = asyncio.Queue(self.rtcmQueueSize)
+            self.rtcmReaderError = None
+            self.rtcmReaderTask = asyncio.create_task(self._rtcmReader())
+        return self
+
+    async def __anext__(self):
+        """Return the next queued ``(frame, timestamp)`` tuple.
+
+        Raises
+        ------
+        StopAsyncIteration
+            When the reader task has been stopped.
+        ConnectionError
+            If the connection failed or was closed while receiving data.
+        IOError
+            If a chunk was malformed.
+        """
+        if self.rtcmProtocol is not None:
+            self.rtcmProtocol.deliverRtcmFrames()
+        if self.rtcmQueue.empty() and self.rtcmReaderTask.done():
+            item = None
+        else:
+            item = await self.rtcmQueue.get()
+        if item is None:
+            if self.rtcmReaderError is not None:
+                raise self.rtcmReaderError
+            raise StopAsyncIteration
+        return item
+
+    async def stopRtcmReader(self) -> None:
+        """Cancel the reader task started by ``async for`` and end iteration.
+
+        In protocol mode the connection is closed, and a pending reconnect
+        cancelled, instead.
+        """
+        if self.rtcmProtocol is not None:
+            if self.rtcmReconnectTask is not None:
+                self.rtcmReconnectTask.cancel()
+            self.rtcmProtocol.transport.close()
+            await self.rtcmProtocol.connectionClosed
+            self._endRtcmProtocol(None)
+            self.rtcmReaderError = None
+        elif self.rtcmReaderTask is not None and not self.rtcmReaderTask.done():
+            self.rtcmReaderTask.cancel()
+            try:
+                await self.rtcmReaderTask
+            except asyncio.CancelledError:
+                pass
+
+    async def _rtcmReader(self) -> None:
+        """Move frames from the stream into ``self.rtcmQueue`` until it fails."""
+        try:
+            while True:
+                for item in await self.getRtcmFrames():
+                    await self._queueRtcmFrame(item)
+        except Exception as error:
+            self.rtcmReaderError = error
+        finally:
+            # Wake a consumer waiting on an empty queue; otherwise __anext__
+            # notices the finished task once the queue is drained.
+            if self.rtcmQueue.empty():
+                self.rtcmQueue.put_nowait(None)
+
+    async def _reconnectRtcmProtocol(self) -> None:
+        """Request a stalled protocol mode stream again, or end it."""
+        try:
+            await self.reconnectNtripStream()
+        except OSError as error:
+            self._endRtcmProtocol(error)
+        except asyncio.CancelledError:
+            self._endRtcmProtocol(None)
+            raise
+        finally:
+            self.rtcmReconnectTask = None
+
+    def _endRtcmProtocol(self, error) -> None:
+        """End a protocol mode stream, once, with ``error`` or at its end."""
+        if self.rtcmReaderTask.done():
+            return
+        self.rtcmReaderError = error
+        self.rtcmReaderTask.set_result(None)
+        if self.rtcmQueue.empty():
+            self.rtcmQueue.put_nowait(None)
+
+    async def _queueRtcmFrame(self, item) -> None:
+        """Queue one ``(frame, timestamp)`` tuple according to the policy."""
+        if not self._offerRtcmFrame(item):
+            await self.rtcmQueue.put(item)
+
+    def _offerRtcmFrame(self, item) -> bool:
+        """Queue one item without waiting.
+
+        Returns
+        -------
+        bool
+            ``False`` if the queue is full under the ``"block"`` policy and
+            the item was not queued.
+        """
+        if not self.rtcmQueue.full():
+            self.rtcmQueue.put_nowait(item)
+            return True
+        if self.rtcmOverflowPolicy == "block":
+            return False
+        if self.rtcmOverflowPolicy == "dropOldest":
+            self.rtcmQueue.get_nowait()
+            self.rtcmQueue.put_nowait(item)
+        self.rtcmFramesDropped += 1
+        return True
+
+
+class NtripProtocol(asyncio.Protocol):
+    """Low-level asyncio protocol feeding an :class:`NtripStream` framer.
+
+    Buffers the caster's response header, then appends every received block
+    straight to the stream's :class:`~ntripstreams.framer.RtcmFramer` and hands
+    the validated frames to a callback or to the stream's frame queue. Under
+    the ``"block"`` overflow policy reading is paused while the queue is full
+    and the undelivered bytes stay in the framer.
+
+    A watchdog timer aborts the connection once no data has been received
+    for the stream's ``idleTimeout`` while reading; the stall is counted on
+    the stream, which is requested again or ends with a
+    :class:`TimeoutError`.
+
+    Parameters
+    ----------
+    ntripStream : NtripStream
+        The stream owning the framer, queue and response header state.
+    frameCallback : callable, optional
+        Called as ``frameCallback(frame, timeStamp)`` for every validated
+        frame instead of queueing it. The default is None.
+    """
+
+    def __init__(self, ntripStream: NtripStream, frameCallback=None):
+        loop = asyncio.get_running_loop()
+        self.ntripStream = ntripStream
+        self.frameCallback = frameCallback
+        self.transport = None
+        self.headerBuffer = bytearray()
+        self.headerReceived = loop.create_future()
+        self.connectionClosed = loop.create_future()
+        self.paused = False
+        self.lastDataTime = None
+        self.watchdog = None
+        self.stallError = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        self.lastDataTime = monotonic()
+        if self.ntripStream.idleTimeout is not None:
+            self.watchdog = asyncio.get_running_loop().call_later(
+                self.ntripStream.idleTimeout, self.checkIdle
+            )
+
+    def checkIdle(self) -> None:
+        """Abort the connection if it has stalled, or check again later."""
+        stream = self.ntripStream
+        idleTime = monotonic() - self.lastDataTime
+        if self.paused:
+            # Reading is paused by the consumer, not stalled by the caster.
+            idleTime = 0.0
+        if idleTime < stream.idleTimeout:
+            self.watchdog = asyncio.get_running_loop().call_later(
+                stream.idleTimeout - idleTime, self.checkIdle
+            )
+            return
+        self.stallError = TimeoutError(
+            f"No data from {stream.casterUrl.netloc} within {stream.idleTimeout} s"
+        )
+        stream._rtcmStalled(self.stallError)
+        self.transport.abort()
+
+    def data_received(self, data: bytes) -> None:
+        stream = self.ntripStream
+        self.lastDataTime = monotonic()
+        if not self.headerReceived.done():
+            self.headerBuffer += data
+            headerEnd = self.headerBuffer.find(b"\r\n\r\n")
+            if headerEnd < 0:
+                return
+            rawHeader = bytes(self.headerBuffer[: headerEnd + 4])
+            data = self.headerBuffer[headerEnd + 4 :]
+            self.headerBuffer = None
+            stream.setNtripResponseHeader(rawHeader.splitlines(keepends=True))
+            self.headerReceived.set_result(True)
+        if stream.ntripStreamChunked:
+            try:
+                data = stream.ntripChunkedDecoder.feed(data)
+            except IOError:
+                logging.error(
+                    f"{stream.ntripMountPoint}:Chunk malformed. Closing connection!"
+                )
+                self.transport.close()
+                return
+        stream._rtcmDataReceived()
+        stream.rtcmFramer.append(data)
+        if stream.ntripResponseStatusCode == "200":
+            self.deliverRtcmFrames()
+
+    def deliverRtcmFrames(self) -> None:
+        """Hand buffered frames to the callback or queue, pausing when full."""
+        stream = self.ntripStream
+        timeStamp = stream.rtcmFrameTimeStamp
+        if self.frameCallback is not None:
+            for rtcmFrame in stream.rtcmFramer.extractAll():
+                self.frameCallback(rtcmFrame, timeStamp)
+            return
+        while True:
+            if stream.rtcmQueue.full() and stream.rtcmOverflowPolicy == "block":
+                if not self.paused and not self.transport.is_closing():
+                    self.transport.pause_reading()
+                    self.paused = True
+                return
+            rtcmFrame = stream.rtcmFramer.extract()
+            if rtcmFrame is None:
+                break
+            stream._offerRtcmFrame((rtcmFrame, timeStamp))
+        if self.paused:
+            self.transport.resume_reading()
+            self.paused = False
+
+    def connection_lost(self, exc) -> None:
+        stream = self.ntripStream
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+        error = self.stallError or ConnectionError(
+            f"Connection to {stream.casterUrl} closed during data reception."
+        )
+        headerReceived = self.headerReceived.done()
+        if not headerReceived:
+            self.headerReceived.set_exception(error)
+        self.connectionClosed.set_result(None)
+        if stream.rtcmProtocol is not self or stream.rtcmReconnecting:
+            # Replaced by a reconnect, which ends the stream if it fails.
+            return
+        if self.stallError is not None and headerReceived and stream.reconnectOnStall:
+            stream.rtcmReconnectTask = asyncio.create_task(
+                stream._reconnectRtcmProtocol()
+            )
+            return
+        stream._endRtcmProtocol(error)
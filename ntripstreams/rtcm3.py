@@ -9,22 +9,541 @@ Created on Fri May  7 11:15:55 2021
 
 import logging
 import re
+from collections import OrderedDict
 from time import time
 
-from bitstring import Bits, pack
+from bitstring import BitStream
 
+from ntripstreams.crc import crc24q
+from ntripstreams.framer import RtcmFrame
 
-def _readfmt(fmt: str) -> str:
-    """Return *fmt* with ``=field`` labels and value assertions removed.
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
 
-    bitstring >= 4.2 no longer accepts the ``token=name`` label syntax (e.g.
-    ``uint:12=refStationId``) nor the ``token=value`` assertion syntax (e.g.
-    ``uint:12=1004``) in ``readlist`` / ``unpack``. Those methods return
-    positional lists, and the message type is already dispatched via ``peek``,
-    so both forms were redundant here. ``pack`` still consumes the labelled
-    formats and is left untouched.
+
+def _framePayload(buffer, offset: int = 0, length: int = None):
+    """Return a view of the payload and the CRC of a frame within a buffer.
+
+    The frame starts at ``offset``; its length is taken from the frame header
+    unless given. The buffer is not copied.
+
+    Raises
+    ------
+    ValueError
+        If there is no preamble at ``offset`` or the frame is incomplete.
+
+    Returns
+    -------
+    tuple of (memoryview, int)
+        The message payload and the 24-bit CRC transmitted with it.
+    """
+    view = memoryview(buffer)
+    if len(view) < offset + 3 or view[offset] != 0xD3:
+        raise ValueError(f"No RTCM 3 frame at offset {offset}")
+    if length is None:
+        length = (((view[offset + 1] & 0x03) << 8) | view[offset + 2]) + 6
+    end = offset + length
+    if length < 6 or end > len(view):
+        raise ValueError(f"Incomplete RTCM 3 frame at offset {offset}")
+    return view[offset + 3 : end - 3], int.from_bytes(view[end - 3 : end], "big")
+
+
+def _maskIndices(mask: int, length: int) -> list:
+    """Return the indices of the set bits of a mask, counted from the MSB."""
+    indices = []
+    while mask:
+        bit = mask.bit_length() - 1
+        indices.append(length - 1 - bit)
+        mask ^= 1 << bit
+    return indices
+
+
+class _Record:
+    """Base class of the decoded records: a slotted object indexed like a list.
+
+    The values are held in ``__slots__`` only, so a record takes less memory
+    than the list the decoder returned before. Records are still indexed,
+    sliced, iterated, modified by index and compared equal to lists like
+    those lists were, and give named access to the same values, e.g.
+    ``head.refStationId`` for ``head[1]``.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    @classmethod
+    def _make(cls, iterable):
+        """Make a record from an iterable of field values."""
+        return cls(*iterable)
+
+    def _asdict(self) -> dict:
+        """Return the record as a dict of field names and values."""
+        return dict(zip(self._fields, self))
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __iter__(self):
+        for field in self._fields:
+            yield getattr(self, field)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [getattr(self, field) for field in self._fields[index]]
+        return getattr(self, self._fields[index])
+
+    def __setitem__(self, index, value) -> None:
+        setattr(self, self._fields[index], value)
+
+    def __eq__(self, other):
+        if isinstance(other, (_Record, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        values = ", ".join(
+            f"{field}={value!r}" for field, value in zip(self._fields, self)
+        )
+        return f"{type(self).__name__}({values})"
+
+
+def _record(name: str, labels: list, base: type = _Record):
+    """Return a slotted record class with a field per format label.
+
+    A value assertion label (e.g. ``uint:12=1004``) names the message number
+    field ``messageType``.
+    """
+    fields = ["messageType" if label.isdigit() else label for label in labels]
+    # A generated __init__ assigns the slots directly, as namedtuple does.
+    source = f"def __init__(self, {', '.join(fields)}):\n" + "".join(
+        f"    self.{field} = {field}\n" for field in fields
+    )
+    namespace = {}
+    exec(source, namespace)
+    return type(
+        name,
+        (base,),
+        {
+            "__slots__": tuple(fields),
+            "__module__": __name__,
+            "__init__": namespace["__init__"],
+            "_fields": tuple(fields),
+        },
+    )
+
+
+class _MsmHeader(_Record):
+    """Base class of the MSM header records.
+
+    The satellite, signal and cell masks are kept as integers. Earlier
+    versions of the decoder returned them as strings of ``"0"``/``"1"``
+    characters; the ``...Bin`` properties format them that way for code
+    written against those versions.
+    """
+
+    __slots__ = ()
+
+    @property
+    def gnssSatMaskBin(self) -> str:
+        """The 64-bit satellite mask as a string of bits."""
+        return format(self.gnssSatMask, "064b")
+
+    @property
+    def gnssSignalMaskBin(self) -> str:
+        """The 32-bit signal mask as a string of bits."""
+        return format(self.gnssSignalMask, "032b")
+
+    @property
+    def cellMaskBin(self) -> str:
+        """The ``numSats * numSignals`` bit cell mask as a string of bits."""
+        length = self.gnssSatMask.bit_count() * self.gnssSignalMask.bit_count()
+        return format(self.cellMask, f"0{length}b") if length else ""
+
+
+def _maskValue(mask) -> int:
+    """Return a mask given as an integer or a string of bits as an integer."""
+    if isinstance(mask, str):
+        return int(mask, 2) if mask else 0
+    return mask
+
+
+class _BitFormat:
+    """A labelled bitstring format string compiled to fixed bit offsets.
+
+    The format is parsed once; decoding then extracts every field from a
+    single integer holding the whole message with shifts and masks, giving
+    the same values ``BitStream.readlist`` returns for the format. Supported
+    tokens are ``uint:n``, ``int:n``, ``bin:n``, ``bool``, ``pad:n`` and a
+    trailing ``bytes`` that takes the rest of the message.
+
+    Given a ``name``, a :attr:`record` class, with a slotted field per
+    label, is created for the decoded values.
+    """
+
+    __slots__ = ("fields", "labels", "length", "tailBytes", "record")
+
+    _tokenRe = re.compile(r"(uint|int|bin|bool|pad|bytes)(?::(\d+))?(?:=(\w+))?$")
+
+    def __init__(self, fmt: str, name: str = None):
+        self.fields = []
+        self.labels = []
+        self.length = 0
+        self.tailBytes = False
+        for token in fmt.split(","):
+            kind, width, label = self._tokenRe.match(token.strip()).groups()
+            if kind == "bytes":
+                self.tailBytes = True
+                self.labels.append(label)
+                continue
+            width = 1 if kind == "bool" else int(width)
+            self.length += width
+            if kind == "pad":
+                continue
+            extra = None
+            if kind == "int":
+                extra = 1 << (width - 1)
+            elif kind == "bin":
+                extra = f"0{width}b"
+            self.fields.append((self.length, (1 << width) - 1, kind, extra))
+            self.labels.append(label)
+        self.record = _record(name, self.labels) if name else None
+
+    def read(self, value: int, nbits: int, pos: int):
+        """Decode the format at bit ``pos`` of a ``nbits`` long message.
+
+        Returns
+        -------
+        tuple of (list, int)
+            The field values and the bit position after the format.
+        """
+        base = nbits - pos
+        values = []
+        for end, mask, kind, extra in self.fields:
+            field = (value >> (base - end)) & mask
+            if kind == "uint":
+                values.append(field)
+            elif kind == "int":
+                values.append(field - (extra << 1) if field & extra else field)
+            elif kind == "bool":
+                values.append(field == 1)
+            else:
+                values.append(format(field, extra))
+        pos += self.length
+        if self.tailBytes:
+            numBytes = (nbits - pos) // 8
+            tail = (value >> (nbits - pos - numBytes * 8)) & ((1 << numBytes * 8) - 1)
+            values.append(tail.to_bytes(numBytes, "big"))
+            pos += numBytes * 8
+        return values, pos
+
+    def readColumn(self, count: int, value: int, nbits: int, pos: int):
+        """Decode ``count`` consecutive copies of a single-field format.
+
+        Equivalent to reading ``f"{count}*{fmt}"``.
+
+        Returns
+        -------
+        tuple of (list, int)
+            The ``count`` field values and the bit position after them.
+        """
+        ((_, mask, kind, extra),) = self.fields
+        width = self.length
+        total = count * width
+        block = (value >> (nbits - pos - total)) & ((1 << total) - 1)
+        values = [(block >> shift) & mask for shift in range(total - width, -1, -width)]
+        if kind == "int":
+            values = [
+                field - (extra << 1) if field & extra else field for field in values
+            ]
+        elif kind == "bool":
+            values = [field == 1 for field in values]
+        elif kind == "bin":
+            values = [format(field, extra) for field in values]
+        return values, pos + total
+
+    def pack(self, values):
+        """Encode the field values, in label order, into one integer.
+
+        Negative ``int`` fields are stored in two's complement; ``bin``
+        fields take a string of ``"0"``/``"1"`` characters and padding is
+        zero.
+
+        Raises
+        ------
+        ValueError
+            If a value does not fit the width of its field.
+
+        Returns
+        -------
+        tuple of (int, int)
+            The encoded bits and their number.
+        """
+        packed = 0
+        length = self.length
+        for (end, mask, kind, extra), label, field in zip(
+            self.fields, self.labels, values
+        ):
+            field = self._fieldValue(field, mask, kind, extra, label)
+            packed |= (field & mask) << (length - end)
+        if self.tailBytes:
+            tail = bytes(values[len(self.fields)])
+            packed = (packed << (8 * len(tail))) | int.from_bytes(tail, "big")
+            length += 8 * len(tail)
+        return packed, length
+
+    def packColumn(self, values):
+        """Encode consecutive values of a single-field format into one integer.
+
+        Raises
+        ------
+        ValueError
+            If a value does not fit the width of the field.
+
+        Returns
+        -------
+        tuple of (int, int)
+            The encoded bits and their number.
+        """
+        ((_, mask, kind, extra),) = self.fields
+        (label,) = self.labels
+        width = self.length
+        packed = 0
+        for field in values:
+            field = self._fieldValue(field, mask, kind, extra, label)
+            packed = (packed << width) | (field & mask)
+        return packed, width * len(values)
+
+    @staticmethod
+    def _fieldValue(field, mask: int, kind: str, extra, label: str) -> int:
+        """Return a field value as an integer, checking it fits the field.
+
+        Raises
+        ------
+        ValueError
+            If the value is out of the range of the field.
+        """
+        if kind == "bin":
+            field = int(field, 2) if field else 0
+        field = int(field)
+        if kind == "int":
+            low, high = -extra, extra - 1
+        else:
+            low, high = 0, mask
+        if not low <= field <= high:
+            raise ValueError(
+                f"{label} = {field} is out of range [{low}, {high}] of its field"
+            )
+        return field
+
+    def readColumnArray(self, count: int, bits, pos: int):
+        """Decode ``count`` copies of a single-field format with NumPy.
+
+        The ``count * width`` bits are reshaped to one row per value and
+        weighted with powers of two, so the whole column is extracted without
+        a Python loop.
+
+        Parameters
+        ----------
+        count : int
+            Number of values to decode.
+        bits : numpy.ndarray of uint8
+            The message unpacked to one element per bit.
+        pos : int
+            Bit position of the first value.
+
+        Returns
+        -------
+        tuple of (numpy.ndarray, int)
+            The values (``int64``, or ``bool`` for ``bool`` fields) and the bit
+            position after them.
+        """
+        ((_, _, kind, extra),) = self.fields
+        width = self.length
+        total = count * width
+        rows = bits[pos : pos + total].reshape(count, width).astype(np.int64)
+        values = rows @ (1 << np.arange(width - 1, -1, -1, dtype=np.int64))
+        if kind == "int":
+            values = np.where(values & extra, values - (extra << 1), values)
+        elif kind == "bool":
+            values = values.astype(bool)
+        return values, pos + total
+
+    @property
+    def dtype(self):
+        """NumPy dtype of a single-field ``uint``, ``int`` or ``bool`` format."""
+        ((_, _, kind, _),) = self.fields
+        if kind == "bool":
+            return np.bool_
+        if self.length > 31:
+            return np.int64
+        return np.int32
+
+
+class RtcmMessage:
+    """An RTCM 3 message whose observation blocks are decoded on first access.
+
+    Created by :meth:`Rtcm3.decodeRtcmHeader`. The message number and the
+    header, including the MSM satellite, signal and cell masks, are decoded
+    immediately; the per-satellite and per-cell blocks are decoded the first
+    time :attr:`satData`, :attr:`signalData` or :attr:`data` is read.
+
+    Attributes
+    ----------
+    messageType : int
+        The RTCM 3 message number.
+    head : record or str
+        The decoded header record, as in :meth:`Rtcm3.decodeRtcmMessage`.
+    numSats : int
+        Number of satellite records.
+    numCells : int
+        Number of MSM signal cells (0 for other message types).
+    """
+
+    __slots__ = (
+        "messageType",
+        "head",
+        "numSats",
+        "numCells",
+        "_decoder",
+        "_value",
+        "_nbits",
+        "_pos",
+        "_asArray",
+        "_body",
+    )
+
+    # Header fields holding the epoch of MSM, legacy GPS and legacy GLONASS
+    _epochFields = ("gnssEpochTime", "tow", "epochTime")
+
+    def __init__(self, decoder, value: int, nbits: int, asArray: bool = False):
+        self._decoder = decoder
+        self._value = value
+        self._nbits = nbits
+        self._asArray = asArray
+        self._body = None
+        (
+            self.messageType,
+            self.head,
+            self.numSats,
+            self.numCells,
+            self._pos,
+        ) = decoder._decodeHeader(value, nbits)
+
+    def __repr__(self) -> str:
+        return (
+            f"RtcmMessage(messageType={self.messageType}, "
+            f"numSats={self.numSats}, numCells={self.numCells})"
+        )
+
+    @property
+    def gnssEpochTime(self):
+        """The GNSS epoch time of an observation message, or ``None``."""
+        for field in self._epochFields:
+            epochTime = getattr(self.head, field, None)
+            if epochTime is not None:
+                return epochTime
+        return None
+
+    def _decode(self):
+        if self._body is None:
+            self._body = self._decoder._decodeBody(
+                self.messageType,
+                self.numSats,
+                self.numCells,
+                self._value,
+                self._nbits,
+                self._pos,
+                self._asArray,
+            )
+        return self._body
+
+    @property
+    def satData(self):
+        """The per-satellite data, decoded on first access."""
+        return self._decode()[0]
+
+    @property
+    def signalData(self):
+        """The per-cell signal data, decoded on first access."""
+        return self._decode()[1]
+
+    @property
+    def data(self) -> list:
+        """``[head, satData, signalData]`` as from :meth:`Rtcm3.decodeRtcmFrame`."""
+        return [self.head, self.satData, self.signalData]
+
+
+class RtcmMessageType:
+    """Registry entry describing how to route and decode one message number.
+
+    Entries are created with :meth:`Rtcm3.register` and looked up with
+    :meth:`Rtcm3.messageTypeInfo`.
+
+    Attributes
+    ----------
+    messageType : int
+        The RTCM 3 message number.
+    description : str
+        Human-readable description of the message.
+    constellation : str
+        GNSS constellation of the message, ``"GNSS"`` if not specific.
+    msmLevel : int or None
+        MSM level 1-7 for Multiple Signal Messages, otherwise ``None``.
+    observables : bool
+        ``True`` for messages carrying GNSS observables.
+    decodeHeader : callable or None
+        ``decodeHeader(rtcm, messageType, value, nbits, pos)`` returning
+        ``(head, numSats, numCells, pos)``, or ``None`` if the message is not
+        field-decoded.
+    decodeBody : callable or None
+        ``decodeBody(rtcm, messageType, numSats, numCells, value, nbits, pos,
+        asArray)`` returning ``(satData, signalData, pos)``, or ``None`` if the
+        message has no satellite or signal blocks.
+    encodeMessage : callable or None
+        ``encodeMessage(rtcm, messageType, data)`` returning the payload as
+        ``(value, nbits)``, or ``None`` if the message cannot be encoded.
     """
-    return re.sub(r"=[A-Za-z0-9_]+", "", fmt)
+
+    __slots__ = (
+        "messageType",
+        "description",
+        "constellation",
+        "msmLevel",
+        "observables",
+        "decodeHeader",
+        "decodeBody",
+        "encodeMessage",
+    )
+
+    def __init__(
+        self,
+        messageType: int,
+        description: str,
+        constellation: str = "GNSS",
+        msmLevel: int = None,
+        observables: bool = False,
+        decodeHeader=None,
+        decodeBody=None,
+        encodeMessage=None,
+    ):
+        self.messageType = messageType
+        self.description = description
+        self.constellation = constellation
+        self.msmLevel = msmLevel
+        self.observables = observables
+        self.decodeHeader = decodeHeader
+        self.decodeBody = decodeBody
+        self.encodeMessage = encodeMessage
+
+    def __repr__(self) -> str:
+        return (
+            f"RtcmMessageType(messageType={self.messageType}, "
+            f"constellation={self.constellation!r}, msmLevel={self.msmLevel})"
+        )
 
 
 class Rtcm3:
@@ -35,18 +554,159 @@ class Rtcm3:
     decoding of the legacy GPS/GLONASS observables (1001-1004, 1009-1012) and
     the Multiple Signal Messages (MSM, 1071-1127), and lookups for message
     descriptions, GNSS constellations and MSM signal types.
+
+    Message numbers are routed through a registry of :class:`RtcmMessageType`
+    entries shared by all instances; decoders for further message types can
+    be added with :meth:`register`.
+
+    Parameters
+    ----------
+    cacheSize : int, optional
+        Number of decoded frames kept in a least-recently-used cache in front
+        of :meth:`decodeRtcmFrame`. The default is 0, no cache.
+    cacheTypes : iterable of int, optional
+        Message types that are cached. The default is
+        :attr:`staticMessageTypes`, messages casters resend unchanged.
+
+    Attributes
+    ----------
+    cacheHits : int
+        Frames answered from the decode cache.
+    cacheMisses : int
+        Cacheable frames that had to be decoded.
+    cacheEvictions : int
+        Entries dropped from the full decode cache.
     """
 
-    def __init__(self):
-        pass
+    _messageTypes = {}
+    _msmSignalTables = {}
+    _msmSatelliteTables = {}
+
+    # Station and system metadata that casters repeat unchanged
+    staticMessageTypes = frozenset((1005, 1006, 1007, 1008, 1013, 1029, 1033, 1230))
+
+    def __init__(self, cacheSize: int = 0, cacheTypes=None):
+        self.cacheSize = cacheSize
+        if cacheTypes is None:
+            cacheTypes = self.staticMessageTypes
+        self.cacheTypes = frozenset(cacheTypes)
+        self.decodeCache = OrderedDict()
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.cacheEvictions = 0
+
+    @classmethod
+    def register(
+        cls,
+        messageType: int,
+        decodeHeader=None,
+        decodeBody=None,
+        description: str = None,
+        constellation: str = "GNSS",
+        msmLevel: int = None,
+        observables: bool = False,
+        encodeMessage=None,
+    ):
+        """Register or replace the routing entry of a message number.
+
+        Parameters
+        ----------
+        messageType : int
+            RTCM 3 message number.
+        decodeHeader : callable, optional
+            ``decodeHeader(rtcm, messageType, value, nbits, pos)`` decoding the
+            header from the payload held in the integer ``value`` of ``nbits``
+            bits, starting at bit ``pos`` (the message number). Returns
+            ``(head, numSats, numCells, pos)``. The default is None, i.e. the
+            message is recognised but not field-decoded.
+        decodeBody : callable, optional
+            ``decodeBody(rtcm, messageType, numSats, numCells, value, nbits, pos,
+            asArray)`` decoding the blocks after the header. Returns
+            ``(satData, signalData, pos)``. The default is None.
+        description : str, optional
+            Message description. The default is the entry in
+            :attr:`messageDescriptionText`, if any.
+        constellation : str, optional
+            GNSS constellation. The default is ``"GNSS"``.
+        msmLevel : int, optional
+            MSM level 1-7 for Multiple Signal Messages. The default is None.
+        observables : bool, optional
+            ``True`` for messages carrying GNSS observables. The default is
+            False.
+        encodeMessage : callable, optional
+            ``encodeMessage(rtcm, messageType, data)`` encoding the message
+            data into the payload bits, returned as ``(value, nbits)``. The
+            default is None.
+
+        Returns
+        -------
+        RtcmMessageType
+            The registered entry.
+        """
+        if description is None:
+            description = cls.messageDescriptionText.get(
+                messageType, f"Message type {messageType} currently not implemented"
+            )
+        entry = RtcmMessageType(
+            messageType,
+            description,
+            constellation,
+            msmLevel,
+            observables,
+            decodeHeader,
+            decodeBody,
+            encodeMessage,
+        )
+        cls._messageTypes[messageType] = entry
+        return entry
+
+    def messageTypeInfo(self, messageType: int):
+        """Return the registry entry of a message number.
 
-    def _rl(self, message, fmt):
-        """readlist with ``=name`` labels stripped for bitstring >= 4.2."""
-        return message.readlist(_readfmt(fmt))
+        Parameters
+        ----------
+        messageType : int
+            RTCM 3 message number.
+
+        Returns
+        -------
+        RtcmMessageType or None
+            The entry, or ``None`` for unregistered message numbers.
+        """
+        return self._messageTypes.get(messageType)
 
-    def _up(self, message, fmt):
-        """unpack with ``=name`` labels stripped for bitstring >= 4.2."""
-        return message.unpack(_readfmt(fmt))
+    @classmethod
+    def _registerBuiltins(cls):
+        """Register the message types known to this module."""
+        for messageType in cls.messageDescriptionText:
+            cls.register(messageType)
+        for messageType in cls.__fmtLegacy:
+            cls.register(
+                messageType,
+                cls.__decodeLegacyHeader,
+                cls.__decodeLegacyBody,
+                constellation="GPS" if messageType <= 1004 else "GLONASS",
+                observables=True,
+                encodeMessage=cls.__encodeLegacy,
+            )
+        for messageType in range(1071, 1128):
+            msmLevel = messageType % 10
+            if msmLevel in cls.__fmtMsmSat:
+                cls.register(
+                    messageType,
+                    cls.__decodeMsmHeader,
+                    cls.__decodeMsmBody,
+                    constellation=cls.__msmConstellations[messageType // 10 % 100],
+                    msmLevel=msmLevel,
+                    observables=True,
+                    encodeMessage=cls.__encodeMsm,
+                )
+            else:
+                cls.register(
+                    messageType,
+                    constellation=cls.__msmConstellations[messageType // 10 % 100],
+                )
+        cls.register(1029, cls.__decode1029Header, encodeMessage=cls.__encode1029)
 
     def mjd(self, unixTimestamp):
         """Convert a Unix timestamp to a Modified Julian Date (integer day).
@@ -96,26 +756,22 @@ class Rtcm3:
             (1009-1012) and MSM (1071-1127) messages; ``"GNSS"`` for any other
             message type.
         """
-        if messageType >= 1001 and messageType <= 1004:
-            constellation = self.__msmConstellations[7]
-        elif messageType >= 1009 and messageType <= 1012:
-            constellation = self.__msmConstellations[8]
-        elif messageType >= 1071 and messageType <= 1127:
-            constellation = self.msmConstellation(messageType)
-        else:
-            constellation = "GNSS"
-        return constellation
+        entry = self._messageTypes.get(messageType)
+        return "GNSS" if entry is None else entry.constellation
 
     def msmSignalTypes(self, messageType: int, msmSignals):
         """Resolve the signal-type codes selected by an MSM signal mask.
 
+        The codes are looked up in a table cached per constellation and mask,
+        as the mask of a station rarely changes between epochs.
+
         Parameters
         ----------
         messageType : int
             An MSM message number in the range 1071-1127.
-        msmSignals : str
-            The 32-bit GNSS signal mask as a string of ``"0"``/``"1"``
-            characters (the ``gnssSignalMask`` header field).
+        msmSignals : int or str
+            The 32-bit GNSS signal mask (the ``gnssSignalMask`` header field),
+            or the mask as a string of ``"0"``/``"1"`` characters.
 
         Returns
         -------
@@ -123,46 +779,121 @@ class Rtcm3:
             RINEX-style signal codes (e.g. ``"L1C"``, ``"L2W"``) for each bit
             set in the mask, in mask order.
         """
-        signals = [
-            self.__msmSignalTypes[self.msmConstellation(messageType)][i]
-            for i, mask in enumerate(msmSignals)
-            if mask == "1"
-        ]
-        return signals
+        msmSignals = _maskValue(msmSignals)
+        constellation = self.msmConstellation(messageType)
+        key = (constellation, msmSignals)
+        signals = self._msmSignalTables.get(key)
+        if signals is None:
+            signalTypes = self.__msmSignalTypes[constellation]
+            signals = tuple(signalTypes[i] for i in _maskIndices(msmSignals, 32))
+            self._cacheMaskTable(self._msmSignalTables, key, signals)
+        return list(signals)
+
+    def msmSatellites(self, messageType: int, msmSatellites):
+        """Resolve the satellite PRNs selected by an MSM satellite mask.
+
+        The PRNs are looked up in a table cached per constellation and mask.
+
+        Parameters
+        ----------
+        messageType : int
+            An MSM message number in the range 1071-1127.
+        msmSatellites : int or str
+            The 64-bit GNSS satellite mask (the ``gnssSatMask`` header field),
+            or the mask as a string of ``"0"``/``"1"`` characters.
+
+        Returns
+        -------
+        list of int
+            The PRN of each satellite set in the mask, in mask order. The
+            satellite ID is offset to the PRN for SBAS (120-) and QZSS (193-);
+            for GLONASS it is the slot number.
+        """
+        msmSatellites = _maskValue(msmSatellites)
+        constellation = self.msmConstellation(messageType)
+        key = (constellation, msmSatellites)
+        prns = self._msmSatelliteTables.get(key)
+        if prns is None:
+            offset = self.__msmPrnOffsets.get(constellation, 1)
+            prns = tuple(i + offset for i in _maskIndices(msmSatellites, 64))
+            self._cacheMaskTable(self._msmSatelliteTables, key, prns)
+        return list(prns)
+
+    @staticmethod
+    def _cacheMaskTable(table: dict, key, value) -> None:
+        """Store a mask lookup, clearing the table if it grows implausibly."""
+        if len(table) >= 4096:
+            table.clear()
+        table[key] = value
 
     def encodeRtcmFrame(self, messageType: int, dataDict):
-        """Encode an RTCM 3 message into a frame.
+        """Encode an RTCM 3 message into a complete frame.
 
-        .. note::
-            Currently only message type 1029 is implemented, and the returned
-            frame does not yet include the preamble, length and CRC wrapper.
+        The payload from :meth:`encodeRtcmMessage` is padded to whole bytes
+        and wrapped in the preamble, the 10-bit length and the CRC-24Q.
 
         Parameters
         ----------
         messageType : int
             RTCM 3 message number to encode.
-        dataDict : dict
-            Field values for the message; missing fields fall back to defaults.
+        dataDict : dict or list
+            The message data; see :meth:`encodeRtcmMessage`.
+
+        Raises
+        ------
+        ValueError
+            If the data is inconsistent or the payload exceeds 1023 bytes.
 
         Returns
         -------
-        bitstring.BitStream
-            The encoded message.
+        RtcmFrame or None
+            The encoded frame, or ``None`` for message types without an
+            encoder.
         """
-        message = self.encodeRtcmMessage(messageType, dataDict)
-        rtcmFrame = message
-        return rtcmFrame
+        payload = self._encodePayload(messageType, dataDict)
+        if payload is None:
+            return None
+        value, nbits = payload
+        numBytes = (nbits + 7) // 8
+        if numBytes > 1023:
+            raise ValueError(f"Message type {messageType} payload exceeds 1023 bytes")
+        frame = bytearray(b"\xd3")
+        frame += numBytes.to_bytes(2, "big")
+        frame += (value << (numBytes * 8 - nbits)).to_bytes(numBytes, "big")
+        frame += crc24q(frame).to_bytes(3, "big")
+        return RtcmFrame(bytes(frame))
 
-    def decodeRtcmFrame(self, rtcmFrame):
+    def decodeRtcmFrame(
+        self, rtcmFrame, asArray: bool = False, offset: int = 0, length: int = None
+    ):
         """Decode a complete RTCM 3 frame.
 
         Strips the 24-bit header/preamble and the trailing 24-bit CRC, then
         decodes the payload with :meth:`decodeRtcmMessage`.
 
+        With a ``cacheSize``, frames of the ``cacheTypes`` are looked up by
+        message type, CRC and length, and a hit is confirmed against the
+        payload bytes. A cached result is returned as the same object every
+        time, so it must not be modified.
+
         Parameters
         ----------
-        rtcmFrame : bitstring.BitStream
-            A complete, CRC-validated RTCM 3 frame.
+        rtcmFrame : RtcmFrame, bytes, bytearray, memoryview or bitstring.BitStream
+            A complete, CRC-validated RTCM 3 frame, or a buffer holding one.
+            Buffers are decoded in place, without copying.
+        asArray : bool, optional
+            Return MSM satellite and signal data as NumPy structured arrays.
+            The default is False.
+        offset : int, optional
+            Position of the frame in a buffer. The default is 0.
+        length : int, optional
+            Length of the frame in a buffer. The default is the length given
+            by the frame header.
+
+        Raises
+        ------
+        ValueError
+            If a buffer holds no complete frame at ``offset``.
 
         Returns
         -------
@@ -170,189 +901,618 @@ class Rtcm3:
             The message type and its decoded data; see
             :meth:`decodeRtcmMessage` for the data layout.
         """
-        rtcmPayload = rtcmFrame[24:-24]
-        messageType, data = self.decodeRtcmMessage(rtcmPayload)
+        if isinstance(rtcmFrame, RtcmFrame):
+            rtcmPayload = rtcmFrame.payload
+            crc = rtcmFrame.crc
+        elif isinstance(rtcmFrame, (bytes, bytearray, memoryview)):
+            rtcmPayload, crc = _framePayload(rtcmFrame, offset, length)
+        elif self.cacheSize > 0:
+            rtcmPayload, crc = _framePayload(
+                rtcmFrame.tobytes(), 0, len(rtcmFrame) // 8
+            )
+        else:
+            return self.decodeRtcmMessage(rtcmFrame[24:-24], asArray)
+        if self.cacheSize > 0 and len(rtcmPayload) >= 2:
+            messageType = (rtcmPayload[0] << 4) | (rtcmPayload[1] >> 4)
+            if messageType in self.cacheTypes:
+                return self.__decodeCached(messageType, crc, rtcmPayload, asArray)
+        (messageType, data), _ = self._decodePayload(
+            int.from_bytes(rtcmPayload, "big"), len(rtcmPayload) * 8, 0, asArray
+        )
         return messageType, data
 
+    def __decodeCached(self, messageType: int, crc: int, rtcmPayload, asArray: bool):
+        """Decode a frame payload through the LRU decode cache."""
+        key = (messageType, crc, len(rtcmPayload), asArray)
+        cached = self.decodeCache.get(key)
+        if cached is not None and cached[0] == rtcmPayload:
+            self.cacheHits += 1
+            self.decodeCache.move_to_end(key)
+            return cached[1]
+        self.cacheMisses += 1
+        (messageType, data), _ = self._decodePayload(
+            int.from_bytes(rtcmPayload, "big"), len(rtcmPayload) * 8, 0, asArray
+        )
+        self.decodeCache[key] = (bytes(rtcmPayload), (messageType, data))
+        self.decodeCache.move_to_end(key)
+        if len(self.decodeCache) > self.cacheSize:
+            self.decodeCache.popitem(last=False)
+            self.cacheEvictions += 1
+        return messageType, data
+
+    def decodeRtcmHeader(
+        self, rtcmFrame, asArray: bool = False, offset: int = 0, length: int = None
+    ):
+        """Decode the message number and header of a frame, deferring the rest.
+
+        Use this when only the header is needed, e.g. for monitoring or
+        routing; the observation blocks cost nothing until they are read.
+
+        Parameters
+        ----------
+        rtcmFrame : RtcmFrame, bytes, bytearray, memoryview or bitstring.BitStream
+            A complete, CRC-validated RTCM 3 frame, or a buffer holding one.
+        asArray : bool, optional
+            Decode MSM blocks to NumPy structured arrays when they are
+            accessed. The default is False.
+        offset : int, optional
+            Position of the frame in a buffer. The default is 0.
+        length : int, optional
+            Length of the frame in a buffer. The default is the length given
+            by the frame header.
+
+        Returns
+        -------
+        RtcmMessage
+            The message with its header decoded.
+        """
+        if isinstance(rtcmFrame, RtcmFrame):
+            rtcmPayload = rtcmFrame.payload
+        elif isinstance(rtcmFrame, (bytes, bytearray, memoryview)):
+            rtcmPayload, _ = _framePayload(rtcmFrame, offset, length)
+        else:
+            rtcmPayload = None
+        if rtcmPayload is not None:
+            return RtcmMessage(
+                self, int.from_bytes(rtcmPayload, "big"), len(rtcmPayload) * 8, asArray
+            )
+        rtcmPayload = rtcmFrame[24:-24]
+        return RtcmMessage(self, rtcmPayload.uint, rtcmPayload.len, asArray)
+
     def encodeRtcmMessage(self, messageType: int, dataDict):
         """Encode an RTCM 3 message payload.
 
-        .. note::
-            Only message type 1029 (Unicode Text String) is implemented;
-            other message types return ``None``.
+        Message types 1001-1004, 1009-1012, 1029 and MSM1-7 (1071-1127) are
+        encoded with packers compiled from the message formats. They take
+        the ``[head, satData, signalData]`` data returned by
+        :meth:`decodeRtcmMessage`, which re-encodes to the same message.
+        Message type 1029 also takes a dict of fields, where missing fields
+        fall back to defaults and the character counts follow the string.
 
         Parameters
         ----------
         messageType : int
             RTCM 3 message number to encode.
-        dataDict : dict
-            Field values for the message; missing fields fall back to defaults.
+        dataDict : dict or list
+            The message data.
+
+        Raises
+        ------
+        ValueError
+            If the satellite or cell count of the header does not match the
+            data.
 
         Returns
         -------
         bitstring.BitStream or None
             The packed message payload, or ``None`` for unimplemented types.
         """
-        if messageType == 1029:
-            utfStr = "Default string"
+        payload = self._encodePayload(messageType, dataDict)
+        if payload is None:
+            return None
+        value, nbits = payload
+        return BitStream(uint=value, length=nbits)
+
+    def _encodePayload(self, messageType: int, data):
+        """Encode a message payload into one integer.
+
+        Returns
+        -------
+        tuple of (int, int) or None
+            The payload bits and their number, or ``None`` for message types
+            without an encoder.
+        """
+        entry = self._messageTypes.get(messageType)
+        if entry is None or entry.encodeMessage is None:
+            return None
+        return entry.encodeMessage(self, messageType, data)
+
+    def __encode1029(self, messageType: int, data):
+        """Encode message 1029, Unicode Text String."""
+        if isinstance(data, dict):
             default = {
                 "refStationId": 0,
                 "mjd": self.mjd(time()),
                 "utc": int(time() % 86400),
-                "utfChars": 0,
-                "charBytes": 0,
-                "string": utfStr,
+                "string": "Default string",
             }
-            data = {key: dataDict.get(key, default[key]) for key in default}
-            data["utfChars"] = len(data["string"])
-            data["string"] = data["string"].encode()
-            data["charBytes"] = len(data["string"])
-            message = pack(self.__msg1029, **data)
-            return message
-
-    def __decodeMsmHeader(self, message):
+            fields = {key: data.get(key, default[key]) for key in default}
+            string = fields["string"].encode()
+            head = [
+                messageType,
+                fields["refStationId"],
+                fields["mjd"],
+                fields["utc"],
+                len(fields["string"]),
+                len(string),
+                string,
+            ]
+        else:
+            head = data[0]
+        if head[4] > 127:
+            raise ValueError(f"{head[4]} characters exceed the 127 of message 1029")
+        if head[5] > 255:
+            raise ValueError(f"{head[5]} bytes exceed the 255 of message 1029")
+        return self.__fmt1029.pack(head)
+
+    def __encodeLegacy(self, messageType: int, data):
+        """Encode a legacy GPS/GLONASS observation message."""
+        head, satData = data[0], data[1]
+        if head[4] != len(satData):
+            raise ValueError(
+                f"Header announces {head[4]} satellites, got {len(satData)}"
+            )
+        headFormat, obsFormat = self.__fmtLegacy[messageType]
+        value, nbits = headFormat.pack(head)
+        for obs in satData:
+            packed, length = obsFormat.pack(obs)
+            value = (value << length) | packed
+            nbits += length
+        return value, nbits
+
+    def __encodeMsm(self, messageType: int, data):
+        """Encode a Multiple Signal Message."""
+        head, satData, signalData = data
+        head = list(head)
+        head[9] = _maskValue(head[9])
+        head[10] = _maskValue(head[10])
+        numSats = head[9].bit_count()
+        maskLength = numSats * head[10].bit_count()
+        cellMask = head[11]
+        if isinstance(cellMask, str) and len(cellMask) != maskLength:
+            raise ValueError(
+                f"Cell mask has {len(cellMask)} bits, expected {maskLength}"
+            )
+        cellMask = _maskValue(cellMask)
+        if cellMask >> maskLength:
+            raise ValueError(f"Cell mask has more than {maskLength} bits")
+        numCells = cellMask.bit_count()
+        if len(satData) != numSats or len(signalData) != numCells:
+            raise ValueError(
+                f"Masks announce {numSats} satellites and {numCells} "
+                f"cells, got {len(satData)} and {len(signalData)}"
+            )
+        if messageType // 10 == 108:
+            head[2] |= head[12] << 27
+        value, nbits = self.__fmtMsmHead.pack(head)
+        value = (value << maskLength) | cellMask
+        nbits += maskLength
+        msmLevel = messageType % 10
+        for formats, rows in (
+            (self.__fmtMsmSat[msmLevel], satData),
+            (self.__fmtMsmSignal[msmLevel], signalData),
+        ):
+            for i, obsFormat in enumerate(formats):
+                packed, length = obsFormat.packColumn([row[i] for row in rows])
+                value = (value << length) | packed
+                nbits += length
+        return value, nbits
+
+    def __decodeMsmHeader(self, messageType: int, value: int, nbits: int, pos: int):
         """Decode the common MSM header, including the satellite/cell masks.
 
         Parameters
         ----------
-        message : bitstring.BitStream
-            The message payload, positioned at the start of the header.
+        messageType : int
+            The MSM message number.
+        value : int
+            The whole message payload as one integer.
+        nbits : int
+            Length of the payload in bits.
+        pos : int
+            Bit position of the start of the header.
 
         Returns
         -------
         tuple of (list, int, int, int)
-            The header fields, the number of satellites, the number of signals
-            and the number of cells (``numSats * numSignals`` selected cells).
+            The header record, the number of satellites, the number of cells
+            (selected in the ``numSats * numSignals`` cell mask) and the bit
+            position after the header.
         """
-        head = self._rl(message, self.__msgMsmHead)
-        numSats = Bits(bin=head[9]).bin.count("1")
-        numSignals = Bits(bin=head[10]).bin.count("1")
-        cellMask = message.read(f"bin:{numSats * numSignals}")
+        start = pos
+        head, pos = self.__fmtMsmHead.read(value, nbits, pos)
+        numSats = head[9].bit_count()
+        maskLength = numSats * head[10].bit_count()
+        cellMask = (value >> (nbits - pos - maskLength)) & ((1 << maskLength) - 1)
         head.append(cellMask)
-        numCells = Bits(bin=head[11]).bin.count("1")
-        if head[0] >= 1081 and head[0] <= 1087:
-            glonassEpoch = self._up(message, self.__msgMsmHeadGlonassEpoch)
+        pos += maskLength
+        numCells = cellMask.bit_count()
+        if messageType // 10 == 108:
+            glonassEpoch, _ = self.__fmtMsmHeadGlonassEpoch.read(value, nbits, start)
             head[2] = glonassEpoch[1]
             head.append(glonassEpoch[0])
-        return head, numSats, numSignals, numCells
+            return self.__recMsmHeadGlonass._make(head), numSats, numCells, pos
+        return self.__recMsmHead._make(head), numSats, numCells, pos
+
+    def __decodeMsmBody(
+        self,
+        messageType: int,
+        numSats: int,
+        numCells: int,
+        value: int,
+        nbits: int,
+        pos: int,
+        asArray: bool = False,
+    ):
+        """Decode the MSM satellite and signal blocks to lists of records."""
+        msmLevel = messageType % 10
+        if asArray:
+            return self.__decodeMsmArrays(
+                msmLevel, numSats, numCells, value, nbits, pos
+            )
+        satData = []
+        for obsFormat in self.__fmtMsmSat[msmLevel]:
+            column, pos = obsFormat.readColumn(numSats, value, nbits, pos)
+            satData.append(column)
+        satData = list(map(self.__recMsmSat[msmLevel]._make, zip(*satData)))
+        signalData = []
+        for obsFormat in self.__fmtMsmSignal[msmLevel]:
+            column, pos = obsFormat.readColumn(numCells, value, nbits, pos)
+            signalData.append(column)
+        signalData = list(map(self.__recMsmSignal[msmLevel]._make, zip(*signalData)))
+        return satData, signalData, pos
+
+    def __decodeLegacyHeader(self, messageType: int, value: int, nbits: int, pos: int):
+        """Decode the header of a legacy GPS/GLONASS observation message."""
+        headFormat = self.__fmtLegacy[messageType][0]
+        head, pos = headFormat.read(value, nbits, pos)
+        head = headFormat.record._make(head)
+        return head, head.numSignalsObs, 0, pos
+
+    def __decodeLegacyBody(
+        self,
+        messageType: int,
+        numSats: int,
+        numCells: int,
+        value: int,
+        nbits: int,
+        pos: int,
+        asArray: bool = False,
+    ):
+        """Decode the satellite records of a legacy observation message."""
+        obsFormat = self.__fmtLegacy[messageType][1]
+        satData = []
+        for _ in range(numSats):
+            obs, pos = obsFormat.read(value, nbits, pos)
+            satData.append(obsFormat.record._make(obs))
+        return satData, [], pos
+
+    def __decode1029Header(self, messageType: int, value: int, nbits: int, pos: int):
+        """Decode message 1029, Unicode Text String."""
+        head, pos = self.__fmt1029.read(value, nbits, pos)
+        return self.__fmt1029.record._make(head), 0, 0, pos
 
-    def decodeRtcmMessage(self, message):
+    def decodeRtcmMessage(
+        self, message, asArray: bool = False, offset: int = 0, length: int = None
+    ):
         """Decode an RTCM 3 message payload (without preamble or CRC).
 
         Fully decodes the legacy GPS/GLONASS observables (1001-1004,
         1009-1012) and the Multiple Signal Messages (1071-1127). Other message
-        types are recognised but not field-decoded.
+        types are recognised but not field-decoded. Every message layout is
+        compiled once into fixed bit offsets, and the fields are extracted
+        from a single integer holding the whole payload.
 
         Parameters
         ----------
-        message : bitstring.BitStream
+        message : bytes, bytearray, memoryview or bitstring.BitStream
             The message payload (frame with the 24-bit header and 24-bit CRC
-            removed).
+            removed). A buffer is decoded in place from ``offset``. A
+            BitStream is decoded from its current read position, which is
+            left after the last decoded field.
+        asArray : bool, optional
+            Return the MSM ``satData`` and ``signalData`` as NumPy structured
+            arrays with one record per satellite and per cell, and fields
+            named after the format labels (e.g. ``roughRangeMod1ms``,
+            ``signalFinePseudorange``, ``signalCNR``). Requires numpy. Other
+            message types are returned as lists. The default is False.
+        offset : int, optional
+            Position of the payload in a buffer. The default is 0.
+        length : int, optional
+            Length of the payload in a buffer. The default is the rest of the
+            buffer.
+
+        Raises
+        ------
+        ImportError
+            If ``asArray`` is set and numpy is not installed.
 
         Returns
         -------
         tuple of (int, list)
             ``(messageType, [head, satData, signalData])`` where ``head`` is
-            the list of decoded header fields (or the string
+            a record of the decoded header fields (or the string
             ``"Message type not implemented"``), and ``satData`` /
-            ``signalData`` are column-wise lists of the per-satellite and
-            per-signal fields (empty for non-observable messages).
+            ``signalData`` are lists with a record per satellite and per
+            signal cell (empty for non-observable messages), or structured
+            arrays for MSM messages decoded with ``asArray``. The records are
+            indexed like lists and have fields named after the labels of the
+            message formats, e.g. ``head.gnssSignalMask`` or
+            ``signalData[0].signalCNR``. The MSM satellite, signal and cell
+            masks are integers; earlier versions returned them as strings of
+            bits, which ``head.gnssSatMaskBin``, ``head.gnssSignalMaskBin``
+            and ``head.cellMaskBin`` still give.
         """
-        data = []
-        head = []
-        satData = []
-        signalData = []
-        messageType = message.peek("uint:12")
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            end = None if length is None else offset + length
+            rtcmPayload = memoryview(message)[offset:end]
+            (messageType, data), _ = self._decodePayload(
+                int.from_bytes(rtcmPayload, "big"), len(rtcmPayload) * 8, 0, asArray
+            )
+            return messageType, data
+        (messageType, data), message.pos = self._decodePayload(
+            message.uint, message.len, message.pos, asArray
+        )
+        return messageType, data
+
+    def _decodePayload(
+        self, value: int, nbits: int, pos: int = 0, asArray: bool = False
+    ):
+        """Decode a message payload held in one integer.
+
+        Parameters
+        ----------
+        value : int
+            The message payload as one big-endian integer.
+        nbits : int
+            Length of the payload in bits.
+        pos : int, optional
+            Bit position of the message number. The default is 0.
+        asArray : bool, optional
+            Decode MSM blocks to NumPy structured arrays. The default is False.
+
+        Returns
+        -------
+        tuple of ((int, list), int)
+            The ``(messageType, data)`` result of :meth:`decodeRtcmMessage` and
+            the bit position after the last decoded field.
+        """
+        messageType, head, numSats, numCells, pos = self._decodeHeader(
+            value, nbits, pos
+        )
+        satData, signalData, pos = self._decodeBody(
+            messageType, numSats, numCells, value, nbits, pos, asArray
+        )
+        data = [head, satData, signalData]
+        return (messageType, data), pos
+
+    def _decodeHeader(self, value: int, nbits: int, pos: int = 0):
+        """Decode the message number and header of a payload held in one integer.
+
+        Returns
+        -------
+        tuple of (int, list, int, int, int)
+            The message type, the header fields, the number of satellite
+            records, the number of MSM cells and the bit position of the
+            first satellite record. A payload too short for a message number,
+            e.g. of a zero-length fill frame, has message type ``None``.
+        """
+        if nbits - pos < 12:
+            return None, "Empty message", 0, 0, pos
+        messageType = (value >> (nbits - pos - 12)) & 0xFFF
         logging.debug(f"Decoding message type {messageType}")
-        if messageType == 1001:
-            head = self._rl(message, self.__msg1001Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1001Obs))
-        elif messageType == 1002:
-            head = self._rl(message, self.__msg1002Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1002Obs))
-        elif messageType == 1003:
-            head = self._rl(message, self.__msg1003Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1003Obs))
-        elif messageType == 1004:
-            head = self._rl(message, self.__msg1004Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1004Obs))
-
-        elif messageType == 1009:
-            head = self._rl(message, self.__msg1009Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1009Obs))
-        elif messageType == 1010:
-            head = self._rl(message, self.__msg1010Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1010Obs))
-        elif messageType == 1011:
-            head = self._rl(message, self.__msg1011Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1011Obs))
-        elif messageType == 1012:
-            head = self._rl(message, self.__msg1012Head)
-            for _ in range(head[4]):
-                satData.append(self._rl(message, self.__msg1012Obs))
-
-        elif (
-            (messageType >= 1071 and messageType <= 1077)
-            or (messageType >= 1081 and messageType <= 1087)
-            or (messageType >= 1091 and messageType <= 1097)
-            or (messageType >= 1101 and messageType <= 1107)
-            or (messageType >= 1111 and messageType <= 1117)
-            or (messageType >= 1121 and messageType <= 1127)
+        entry = self._messageTypes.get(messageType)
+        if entry is None or entry.decodeHeader is None:
+            return messageType, "Message type not implemented", 0, 0, pos
+        head, numSats, numCells, pos = entry.decodeHeader(
+            self, messageType, value, nbits, pos
+        )
+        return messageType, head, numSats, numCells, pos
+
+    def _decodeBody(
+        self,
+        messageType: int,
+        numSats: int,
+        numCells: int,
+        value: int,
+        nbits: int,
+        pos: int,
+        asArray: bool = False,
+    ):
+        """Decode the satellite and signal blocks following a message header.
+
+        Returns
+        -------
+        tuple of (list, list, int)
+            The satellite data, the signal data and the bit position after the
+            last decoded field.
+        """
+        entry = self._messageTypes.get(messageType)
+        if entry is None or entry.decodeBody is None:
+            return [], [], pos
+        return entry.decodeBody(
+            self, messageType, numSats, numCells, value, nbits, pos, asArray
+        )
+
+    def __decodeMsmArrays(
+        self, msmLevel: int, numSats: int, numCells: int, value, nbits, pos
+    ):
+        """Decode the MSM satellite and signal blocks to structured arrays.
+
+        Returns
+        -------
+        tuple of (numpy.ndarray, numpy.ndarray, int)
+            The satellite block, the signal (cell) block and the bit position
+            after the signal block.
+        """
+        if np is None:
+            raise ImportError("asArray decoding requires numpy (pip install numpy)")
+        numBytes = (nbits + 7) // 8
+        bits = np.unpackbits(
+            np.frombuffer(value.to_bytes(numBytes, "big"), dtype=np.uint8)
+        )[numBytes * 8 - nbits :]
+        blocks = []
+        for formats, count in (
+            (self.__fmtMsmSat[msmLevel], numSats),
+            (self.__fmtMsmSignal[msmLevel], numCells),
         ):
-            head, numSats, numSignals, numCells = self.__decodeMsmHeader(message)
-            if (
-                (messageType % 10 == 1)
-                or (messageType % 10 == 2)
-                or (messageType % 10 == 3)
-            ):
-                for obs in self.__msgMsm123Sat:
-                    satData.append(self._rl(message, f"{numSats}*{obs}"))
-            elif (messageType % 10 == 4) or (messageType % 10 == 6):
-                for obs in self.__msgMsm46Sat:
-                    satData.append(self._rl(message, f"{numSats}*{obs}"))
-            elif (messageType % 10 == 5) or (messageType % 10 == 7):
-                for obs in self.__msgMsm57Sat:
-                    satData.append(self._rl(message, f"{numSats}*{obs}"))
-            satData = [[row[i] for row in satData] for i in range(len(satData[0]))]
-
-            if messageType % 10 == 1:
-                for obs in self.__msgMsm1Signal:
-                    signalData.append(self._rl(message, f"{numCells}*{obs}"))
-            elif messageType % 10 == 2:
-                for obs in self.__msgMsm2Signal:
-                    signalData.append(self._rl(message, f"{numCells}*{obs}"))
-            elif messageType % 10 == 3:
-                for obs in self.__msgMsm3Signal:
-                    signalData.append(self._rl(message, f"{numCells}*{obs}"))
-            elif messageType % 10 == 4:
-                for obs in self.__msgMsm4Signal:
-                    signalData.append(self._rl(message, f"{numCells}*{obs}"))
-            elif messageType % 10 == 5:
-                for obs in self.__msgMsm5Signal:
-                    signalData.append(self._rl(message, f"{numCells}*{obs}"))
-            elif messageType % 10 == 6:
-                for obs in self.__msgMsm6Signal:
-                    signalData.append(self._rl(message, f"{numCells}*{obs}"))
-            elif messageType % 10 == 7:
-                for obs in self.__msgMsm7Signal:
-                    signalData.append(self._rl(message, f"{numCells}*{obs}"))
-            signalData = [
-                [row[i] for row in signalData] for i in range(len(signalData[0]))
-            ]
+            block = np.empty(
+                count, dtype=[(obs.labels[0], obs.dtype) for obs in formats]
+            )
+            for obsFormat in formats:
+                block[obsFormat.labels[0]], pos = obsFormat.readColumnArray(
+                    count, bits, pos
+                )
+            blocks.append(block)
+        return blocks[0], blocks[1], pos
 
-        elif messageType == 1029:
-            head = self._rl(message, self.__msg1029)
-        else:
-            head = "Message type not implemented"
-        data = [head, satData, signalData]
-        return messageType, data
+    def msmObservables(self, rtcmFrame, glonassChannels: dict = None):
+        """Convert the observables of an MSM frame to physical units.
+
+        The satellite rough ranges are combined with the fine values of every
+        signal cell and the RTCM scale factors are applied with NumPy, for the
+        whole epoch at once. Invalid values (the sentinels of DF397, DF399,
+        DF400, DF401, DF404, DF405 and DF406, and a zero CNR) are returned as
+        NaN, as are observables the MSM level does not carry. MSM1-3 carry no
+        whole milliseconds of the rough range, so their ranges are modulo one
+        light-millisecond.
+
+        Parameters
+        ----------
+        rtcmFrame : RtcmFrame or bitstring.BitStream
+            A complete, CRC-validated MSM frame (1071-1127).
+        glonassChannels : dict, optional
+            GLONASS frequency channel number per slot number, used for the
+            carrier phase of the FDMA signals when the message does not carry
+            them (MSM5 and MSM7 do). The default is None.
+
+        Raises
+        ------
+        ImportError
+            If numpy is not installed.
+        ValueError
+            If the frame is not an MSM1-7 message.
+
+        Returns
+        -------
+        numpy.ndarray
+            A structured array with one record per signal cell and the fields
+            ``prn``, ``signal`` (RINEX code), ``pseudorange`` (m),
+            ``phaseRange`` (m), ``carrierPhase`` (cycles), ``phaseRangeRate``
+            (m/s) and ``cnr`` (dB-Hz).
+        """
+        if np is None:
+            raise ImportError("msmObservables requires numpy (pip install numpy)")
+        message = self.decodeRtcmHeader(rtcmFrame, asArray=True)
+        messageType = message.messageType
+        info = self._messageTypes.get(messageType)
+        if info is None or not info.msmLevel:
+            raise ValueError(f"Message type {messageType} is not an MSM message")
+        head = message.head
+        satData = message.satData
+        signalData = message.signalData
+        prns = np.array(self.msmSatellites(messageType, head.gnssSatMask))
+        signals = np.array(self.msmSignalTypes(messageType, head.gnssSignalMask))
+        cells = np.array(
+            _maskIndices(head.cellMask, len(prns) * len(signals)), dtype=np.intp
+        )
+        satIndex, signalIndex = np.divmod(cells, max(len(signals), 1))
+
+        roughRange = satData["roughRangeMod1ms"] * 2.0**-10
+        if "numIntMsRoughRange" in satData.dtype.names:
+            intMs = satData["numIntMsRoughRange"]
+            roughRange = np.where(intMs == 255, np.nan, roughRange + intMs)
+        roughRange = roughRange[satIndex]
+        roughRate = self.__msmScaled(satData, "roughPhaseRangeRate")[satIndex]
+
+        observables = np.empty(len(signalData), dtype=self.__msmObservablesDtype)
+        observables["prn"] = prns[satIndex]
+        observables["signal"] = signals[signalIndex]
+        observables["pseudorange"] = self.__speedOfLightMs * (
+            roughRange
+            + self.__msmScaled(
+                signalData, "signalFinePseudorange", "signalFinePseudorangeExtRes"
+            )
+        )
+        observables["phaseRange"] = self.__speedOfLightMs * (
+            roughRange
+            + self.__msmScaled(
+                signalData, "signalFinePhaserange", "signalFinePhaserangeExtRes"
+            )
+        )
+        observables["carrierPhase"] = observables["phaseRange"] / (
+            self.__wavelengths(
+                info.constellation,
+                signals,
+                prns,
+                satData,
+                satIndex,
+                signalIndex,
+                glonassChannels,
+            )
+        )
+        observables["phaseRangeRate"] = roughRate + self.__msmScaled(
+            signalData, "signalFinePhaserangeRate"
+        )
+        observables["cnr"] = self.__msmScaled(
+            signalData, "signalCNR", "signalCNRExtRes"
+        )
+        return observables
+
+    def __msmScaled(self, block, *fields):
+        """Scale the first present field of an MSM block, NaN for invalid values."""
+        for field in fields:
+            if field in block.dtype.names:
+                scale, invalid = self.__msmFieldScales[field]
+                raw = block[field]
+                return np.where(raw == invalid, np.nan, raw * scale)
+        return np.full(len(block), np.nan)
+
+    def __wavelengths(
+        self,
+        constellation: str,
+        signals,
+        prns,
+        satData,
+        satIndex,
+        signalIndex,
+        glonassChannels: dict = None,
+    ):
+        """Carrier wavelength in metres of every signal cell (NaN if unknown)."""
+        carrierFrequencies = self.__carrierFrequencies[constellation]
+        frequencies = np.array(
+            [carrierFrequencies.get(signal[1], np.nan) for signal in signals]
+        )[signalIndex]
+        if constellation != "GLONASS":
+            return self.__speedOfLight / frequencies
+        channels = np.full(len(prns), np.nan)
+        if "extSatInfo" in satData.dtype.names:
+            extSatInfo = satData["extSatInfo"]
+            channels = np.where(extSatInfo <= 13, extSatInfo - 7.0, np.nan)
+        if glonassChannels:
+            # Only fill in the channels the message does not carry.
+            channels = np.array(
+                [
+                    glonassChannels.get(prn, channel) if np.isnan(channel) else channel
+                    for prn, channel in zip(prns.tolist(), channels.tolist())
+                ]
+            )
+        steps = np.array(
+            [self.__glonassFdmaSteps.get(signal[1], 0.0) for signal in signals]
+        )[signalIndex]
+        fdma = steps != 0.0
+        frequencies[fdma] += steps[fdma] * channels[satIndex][fdma]
+        return self.__speedOfLight / frequencies
 
     def messageDescription(self, messageType: int):
         """Return a human-readable description for an RTCM 3 message type.
@@ -368,10 +1528,10 @@ class Rtcm3:
             The message description, or a "currently not implemented" note for
             unknown message types.
         """
-        if messageType in self.messageDescriptionText:
-            return self.messageDescriptionText[messageType]
-        else:
+        entry = self._messageTypes.get(messageType)
+        if entry is None:
             return f"Message type {messageType} currently not implemented"
+        return entry.description
 
     messageDescriptionText = {
         1001: "L1-Only GPS RTK Observables",
@@ -505,10 +1665,6 @@ class Rtcm3:
         # 4001-4095: "Proprietary Messages"
     }
 
-    __framePreample = Bits(bin="0b11010011")
-    __frameHeaderFormat = "bin:8, pad:6, uint:10, uint:12"
-    __frameFormat = "bin:8, pad:6, uint:10"
-
     # GPS messages
     __msg1001_4Head = (
         "uint:12=refStationId, uint:30=tow, bool=syncGNSSFlag, "
@@ -569,7 +1725,7 @@ class Rtcm3:
         "uint:12=messageType, uint:12=refStationId, uint:30=gnssEpochTime, "
         "bool=multiMessageFlag, uint:3=iods, pad:7, uint:2=clockSteringIndicator, "
         "uint:2=extClockIndicator, bool=divFreeSmootFlag, bin:3=smoothInterval, "
-        "bin:64=gnssSatMask, bin:32=gnssSignalMask"
+        "uint:64=gnssSatMask, uint:32=gnssSignalMask"
     )
     __msgMsmHeadGlonassEpoch = "pad:24, uint:3=dayOfWeek, uint:27=gnssEpochTime"
     __msgMsm123Sat = ["uint:10=roughRangeMod1ms"]
@@ -806,6 +1962,63 @@ class Rtcm3:
         ],
     }
 
+    # MSM observable conversion (RTCM 10403.3 sec. 3.5.16)
+    __speedOfLight = 299792458.0
+    __speedOfLightMs = __speedOfLight / 1000.0
+    # Field: (scale to ms, m/s or dB-Hz, invalid sentinel)
+    __msmFieldScales = {
+        "roughPhaseRangeRate": (1.0, -(2**13)),
+        "signalFinePseudorange": (2.0**-24, -(2**14)),
+        "signalFinePhaserange": (2.0**-29, -(2**21)),
+        "signalFinePhaserangeRate": (0.0001, -(2**14)),
+        "signalCNR": (1.0, 0),
+        "signalFinePseudorangeExtRes": (2.0**-29, -(2**19)),
+        "signalFinePhaserangeExtRes": (2.0**-31, -(2**23)),
+        "signalCNRExtRes": (2.0**-4, 0),
+    }
+    __msmObservablesDtype = [
+        ("prn", "i2"),
+        ("signal", "U3"),
+        ("pseudorange", "f8"),
+        ("phaseRange", "f8"),
+        ("carrierPhase", "f8"),
+        ("phaseRangeRate", "f8"),
+        ("cnr", "f8"),
+    ]
+    # Carrier frequency in Hz per RINEX band; GLONASS FDMA bands 1 and 2 are
+    # offset by the channel number times the step
+    __carrierFrequencies = {
+        "GPS": {"1": 1575.42e6, "2": 1227.60e6, "5": 1176.45e6},
+        "GLONASS": {
+            "1": 1602.0e6,
+            "2": 1246.0e6,
+            "3": 1202.025e6,
+            "4": 1600.995e6,
+            "6": 1248.06e6,
+        },
+        "GALILEO": {
+            "1": 1575.42e6,
+            "5": 1176.45e6,
+            "6": 1278.75e6,
+            "7": 1207.14e6,
+            "8": 1191.795e6,
+        },
+        "BEIDOU": {
+            "1": 1575.42e6,
+            "2": 1561.098e6,
+            "5": 1176.45e6,
+            "6": 1268.52e6,
+            "7": 1207.14e6,
+            "8": 1191.795e6,
+        },
+        "QZSS": {"1": 1575.42e6, "2": 1227.60e6, "5": 1176.45e6, "6": 1278.75e6},
+        "SBAS": {"1": 1575.42e6, "5": 1176.45e6},
+    }
+    __glonassFdmaSteps = {"1": 0.5625e6, "2": 0.4375e6}
+
+    # PRN of the first bit of the MSM satellite mask (satellite ID 1)
+    __msmPrnOffsets = {"SBAS": 120, "QZSS": 193}
+
     # MSM constellations
     __msmConstellations = {
         7: "GPS",
@@ -815,3 +2028,79 @@ class Rtcm3:
         11: "QZSS",
         12: "BEIDOU",
     }
+
+    # Compiled message layouts
+    __fmtLegacy = {
+        1001: (
+            _BitFormat(__msg1001Head, "Msg1001Header"),
+            _BitFormat(__msg1001Obs, "Msg1001Satellite"),
+        ),
+        1002: (
+            _BitFormat(__msg1002Head, "Msg1002Header"),
+            _BitFormat(__msg1002Obs, "Msg1002Satellite"),
+        ),
+        1003: (
+            _BitFormat(__msg1003Head, "Msg1003Header"),
+            _BitFormat(__msg1003Obs, "Msg1003Satellite"),
+        ),
+        1004: (
+            _BitFormat(__msg1004Head, "Msg1004Header"),
+            _BitFormat(__msg1004Obs, "Msg1004Satellite"),
+        ),
+        1009: (
+            _BitFormat(__msg1009Head, "Msg1009Header"),
+            _BitFormat(__msg1009Obs, "Msg1009Satellite"),
+        ),
+        1010: (
+            _BitFormat(__msg1010Head, "Msg1010Header"),
+            _BitFormat(__msg1010Obs, "Msg1010Satellite"),
+        ),
+        1011: (
+            _BitFormat(__msg1011Head, "Msg1011Header"),
+            _BitFormat(__msg1011Obs, "Msg1011Satellite"),
+        ),
+        1012: (
+            _BitFormat(__msg1012Head, "Msg1012Header"),
+            _BitFormat(__msg1012Obs, "Msg1012Satellite"),
+        ),
+    }
+    __fmt1029 = _BitFormat(__msg1029, "Msg1029")
+    __fmtMsmHead = _BitFormat(__msgMsmHead)
+    __fmtMsmHeadGlonassEpoch = _BitFormat(__msgMsmHeadGlonassEpoch)
+    __fmtMsmSat = {
+        1: [_BitFormat(obs) for obs in __msgMsm123Sat],
+        2: [_BitFormat(obs) for obs in __msgMsm123Sat],
+        3: [_BitFormat(obs) for obs in __msgMsm123Sat],
+        4: [_BitFormat(obs) for obs in __msgMsm46Sat],
+        5: [_BitFormat(obs) for obs in __msgMsm57Sat],
+        6: [_BitFormat(obs) for obs in __msgMsm46Sat],
+        7: [_BitFormat(obs) for obs in __msgMsm57Sat],
+    }
+    __fmtMsmSignal = {
+        1: [_BitFormat(obs) for obs in __msgMsm1Signal],
+        2: [_BitFormat(obs) for obs in __msgMsm2Signal],
+        3: [_BitFormat(obs) for obs in __msgMsm3Signal],
+        4: [_BitFormat(obs) for obs in __msgMsm4Signal],
+        5: [_BitFormat(obs) for obs in __msgMsm5Signal],
+        6: [_BitFormat(obs) for obs in __msgMsm6Signal],
+        7: [_BitFormat(obs) for obs in __msgMsm7Signal],
+    }
+
+    # Named records of the decoded MSM header, satellite and signal data
+    __recMsmHead = _record("MsmHeader", __fmtMsmHead.labels + ["cellMask"], _MsmHeader)
+    __recMsmHeadGlonass = _record(
+        "MsmGlonassHeader",
+        __fmtMsmHead.labels + ["cellMask", "dayOfWeek"],
+        _MsmHeader,
+    )
+    __recMsmSat = {
+        level: _record(f"Msm{level}Satellite", [obs.labels[0] for obs in formats])
+        for level, formats in __fmtMsmSat.items()
+    }
+    __recMsmSignal = {
+        level: _record(f"Msm{level}Signal", [obs.labels[0] for obs in formats])
+        for level, formats in __fmtMsmSignal.items()
+    }
+
+
+Rtcm3._registerBuiltins()
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Parsed and indexed NTRIP source tables.
+
+Defines the :class:`StrRecord`, :class:`CasRecord` and :class:`NetRecord`
+records of the ``STR``, ``CAS`` and ``NET`` source table lines (RTCM 10410.1
+sec. 2.3) and :class:`Sourcetable`, which stores the streams column-wise and
+indexes them by position, format, message type and constellation.
+
+@author: Lars Stenseng
+@mail: lars@stenseng.net
+"""
+
+import re
+from array import array
+from collections import namedtuple
+from math import asin, cos, degrees, floor, inf, isnan, nan, pi, radians, sin, sqrt
+
+EARTH_RADIUS = 6371.0088
+"""Mean Earth radius in km used for distances."""
+
+StrRecord = namedtuple(
+    "StrRecord",
+    [
+        "mountpoint",
+        "identifier",
+        "format",
+        "formatDetails",
+        "carrier",
+        "navSystem",
+        "network",
+        "country",
+        "latitude",
+        "longitude",
+        "nmea",
+        "solution",
+        "generator",
+        "compression",
+        "authentication",
+        "fee",
+        "bitrate",
+        "misc",
+    ],
+)
+StrRecord.__doc__ = """A stream (``STR``) record of a source table."""
+
+CasRecord = namedtuple(
+    "CasRecord",
+    [
+        "host",
+        "port",
+        "identifier",
+        "operator",
+        "nmea",
+        "country",
+        "latitude",
+        "longitude",
+        "fallbackHost",
+        "fallbackPort",
+        "misc",
+    ],
+)
+CasRecord.__doc__ = """A caster (``CAS``) record of a source table."""
+
+NetRecord = namedtuple(
+    "NetRecord",
+    [
+        "identifier",
+        "operator",
+        "authentication",
+        "fee",
+        "webNet",
+        "webStr",
+        "webReg",
+        "misc",
+    ],
+)
+NetRecord.__doc__ = """A network (``NET``) record of a source table."""
+
+# Field converters of the STR, CAS and NET records; other fields are strings.
+_strTypes = {
+    "carrier": int,
+    "latitude": float,
+    "longitude": float,
+    "nmea": int,
+    "solution": int,
+    "bitrate": int,
+}
+_casTypes = {
+    "port": int,
+    "nmea": int,
+    "latitude": float,
+    "longitude": float,
+    "fallbackPort": int,
+}
+
+# Spellings of the navigation systems found in the nav-system field.
+_constellations = {
+    "GPS": "GPS",
+    "GLO": "GLONASS",
+    "GLONASS": "GLONASS",
+    "GAL": "GALILEO",
+    "GALILEO": "GALILEO",
+    "BDS": "BEIDOU",
+    "BEIDOU": "BEIDOU",
+    "COMPASS": "BEIDOU",
+    "QZS": "QZSS",
+    "QZSS": "QZSS",
+    "SBAS": "SBAS",
+    "IRN": "IRNSS",
+    "IRNSS": "IRNSS",
+    "NAVIC": "IRNSS",
+}
+
+_messageTypeRe = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+
+
+def _parseFields(fields: list, record, types: dict):
+    """Convert the fields of a record line, joining the rest into ``misc``."""
+    numFields = len(record._fields)
+    values = fields[: numFields - 1]
+    values += [""] * (numFields - 1 - len(values))
+    values.append(";".join(fields[numFields - 1 :]))
+    for i, name in enumerate(record._fields):
+        convert = types.get(name)
+        if convert is not None:
+            try:
+                values[i] = convert(values[i])
+            except ValueError:
+                values[i] = nan if convert is float else 0
+    return record._make(values)
+
+
+def parseConstellations(navSystem: str) -> list:
+    """Return the constellation names in a nav-system field.
+
+    Parameters
+    ----------
+    navSystem : str
+        The nav-system field, e.g. ``"GPS+GLO+GAL+BDS"``.
+
+    Returns
+    -------
+    list of str
+        The constellations, named as in :class:`~ntripstreams.rtcm3.Rtcm3`
+        (e.g. ``"GLONASS"``); unknown names are upper-cased.
+    """
+    systems = re.split(r"[+,/ ]+", navSystem.strip().upper())
+    return [_constellations.get(system, system) for system in systems if system]
+
+
+def parseMessageTypes(formatDetails: str) -> list:
+    """Return the RTCM message numbers in a format-details field.
+
+    Parameters
+    ----------
+    formatDetails : str
+        The format-details field, e.g. ``"1004(1),1005(10),1033(10)"``.
+
+    Returns
+    -------
+    list of int
+        The message numbers, in field order.
+    """
+    return [int(number) for number in _messageTypeRe.findall(formatDetails)]
+
+
+def parseSourcetableLine(line):
+    """Parse one source table line into its record.
+
+    Parameters
+    ----------
+    line : str or bytes
+        The source table line, with or without the line ending.
+
+    Returns
+    -------
+    StrRecord, CasRecord, NetRecord or None
+        The record of a ``STR``, ``CAS`` or ``NET`` line, or ``None`` for any
+        other line.
+    """
+    if isinstance(line, (bytes, bytearray)):
+        line = line.decode("ISO-8859-1")
+    line = line.rstrip("\r\n")
+    if line.startswith("STR;"):
+        return _parseFields(line.split(";")[1:], StrRecord, _strTypes)
+    if line.startswith("CAS;"):
+        return _parseFields(line.split(";")[1:], CasRecord, _casTypes)
+    if line.startswith("NET;"):
+        return _parseFields(line.split(";")[1:], NetRecord, {})
+    return None
+
+
+def distance(latitude1, longitude1, latitude2, longitude2) -> float:
+    """Return the great-circle distance in km between two positions in degrees."""
+    phi1 = radians(latitude1)
+    phi2 = radians(latitude2)
+    a = (
+        sin((phi2 - phi1) / 2) ** 2
+        + cos(phi1) * cos(phi2) * sin(radians(longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+class Sourcetable:
+    """A parsed NTRIP source table with spatial and attribute indexes.
+
+    ``STR`` records are stored column-wise, with the positions in compact
+    ``array("d")`` columns, and are only turned into :class:`StrRecord` tuples
+    when returned. The streams are indexed on a latitude/longitude grid for
+    :meth:`nearest` and :meth:`within` queries, and by format, RTCM message
+    type and constellation for :meth:`find` and the query filters.
+
+    Several source tables can be merged into one catalogue with
+    :meth:`addRecord`, recording the source of every stream. With ``unique``
+    a stream whose mountpoint is already in the table is dropped, so the
+    source added first wins; likewise for casters with the same host and
+    port and networks with the same identifier.
+
+    Parameters
+    ----------
+    lines : iterable of str or bytes, optional
+        Source table lines to add. The default is None.
+    cellSize : float, optional
+        Size of the spatial grid cells in degrees. The default is 1.0.
+    unique : bool, optional
+        Drop records already in the table. The default is False.
+
+    Attributes
+    ----------
+    casters : list of CasRecord
+        The ``CAS`` records.
+    networks : list of NetRecord
+        The ``NET`` records.
+    sources : list
+        The source of each stream, e.g. its caster URL, in table order.
+    duplicates : list of tuple
+        ``(source, record)`` of the records dropped with ``unique``.
+    complete : bool
+        ``True`` once the ``ENDSOURCETABLE`` line has been added.
+    """
+
+    def __init__(self, lines=None, cellSize: float = 1.0, unique: bool = False):
+        self.cellSize = cellSize
+        self.unique = unique
+        self.numRows = round(180 / cellSize)
+        self.numColumns = round(360 / cellSize)
+        self.columns = {name: [] for name in StrRecord._fields}
+        self.columns["latitude"] = array("d")
+        self.columns["longitude"] = array("d")
+        self.casters = []
+        self.networks = []
+        self.sources = []
+        self.duplicates = []
+        self.complete = False
+        self.mountpoints = {}
+        self.grid = {}
+        self.byFormat = {}
+        self.byMessageType = {}
+        self.byConstellation = {}
+        if lines is not None:
+            self.extend(lines)
+
+    @classmethod
+    def parse(cls, lines, cellSize: float = 1.0):
+        """Build a source table from its lines.
+
+        Parameters
+        ----------
+        lines : iterable of str or bytes
+            The source table lines, e.g. from
+            :meth:`~ntripstreams.ntripstreams.NtripStream.requestSourcetable`.
+        cellSize : float, optional
+            Size of the spatial grid cells in degrees. The default is 1.0.
+
+        Returns
+        -------
+        Sourcetable
+            The parsed source table.
+        """
+        return cls(lines, cellSize)
+
+    def __len__(self) -> int:
+        """Return the number of streams."""
+        return len(self.columns["mountpoint"])
+
+    def __iter__(self):
+        return (self.stream(index) for index in range(len(self)))
+
+    def __contains__(self, mountpoint: str) -> bool:
+        return mountpoint in self.mountpoints
+
+    def __getitem__(self, mountpoint: str) -> StrRecord:
+        """Return the stream record of a mountpoint."""
+        return self.stream(self.mountpoints[mountpoint])
+
+    def __repr__(self) -> str:
+        return (
+            f"Sourcetable(streams={len(self)}, casters={len(self.casters)}, "
+            f"networks={len(self.networks)})"
+        )
+
+    def sourceOf(self, mountpoint: str):
+        """Return the source of a mountpoint's stream, e.g. its caster URL."""
+        return self.sources[self.mountpoints[mountpoint]]
+
+    def stream(self, index: int) -> StrRecord:
+        """Return the stream record at a position in the table."""
+        return StrRecord._make(column[index] for column in self.columns.values())
+
+    def extend(self, lines) -> None:
+        """Add source table lines; see :meth:`add`."""
+        for line in lines:
+            self.add(line)
+
+    def add(self, line) -> None:
+        """Add one source table line.
+
+        ``STR``, ``CAS`` and ``NET`` lines are parsed and indexed. Lines after
+        ``ENDSOURCETABLE`` and other lines are ignored.
+
+        Parameters
+        ----------
+        line : str or bytes
+            The source table line, with or without the line ending.
+        """
+        if self.complete:
+            return
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode("ISO-8859-1")
+        record = parseSourcetableLine(line)
+        if record is not None:
+            self.addRecord(record)
+        elif line.strip() == "ENDSOURCETABLE":
+            self.complete = True
+
+    def addRecord(self, record, source=None) -> bool:
+        """Add a parsed record.
+
+        Parameters
+        ----------
+        record : StrRecord, CasRecord or NetRecord
+            The record, e.g. from :func:`parseSourcetableLine`.
+        source : optional
+            The source of a stream record, e.g. its caster URL. The default
+            is None.
+
+        Returns
+        -------
+        bool
+            ``False`` if the record was dropped as a duplicate.
+        """
+        if isinstance(record, StrRecord):
+            if self.unique and record.mountpoint in self.mountpoints:
+                self.duplicates.append((source, record))
+                return False
+            self._addStream(record, source)
+        elif isinstance(record, CasRecord):
+            if self.unique and any(
+                (caster.host, caster.port) == (record.host, record.port)
+                for caster in self.casters
+            ):
+                self.duplicates.append((source, record))
+                return False
+            self.casters.append(record)
+        elif isinstance(record, NetRecord):
+            if self.unique and any(
+                network.identifier == record.identifier for network in self.networks
+            ):
+                self.duplicates.append((source, record))
+                return False
+            self.networks.append(record)
+        return True
+
+    def _addStream(self, record: StrRecord, source=None) -> None:
+        """Store a stream record and add it to the indexes."""
+        index = len(self)
+        longitude = record.longitude
+        if longitude >= 180.0:
+            longitude -= 360.0
+        record = record._replace(longitude=longitude)
+        for name, value in zip(StrRecord._fields, record):
+            self.columns[name].append(value)
+        self.sources.append(source)
+        self.mountpoints.setdefault(record.mountpoint, index)
+        if not (isnan(record.latitude) or isnan(longitude)):
+            self.grid.setdefault(self._cell(record.latitude, longitude), []).append(
+                index
+            )
+        self.byFormat.setdefault(record.format.strip().upper(), []).append(index)
+        for messageType in set(parseMessageTypes(record.formatDetails)):
+            self.byMessageType.setdefault(messageType, []).append(index)
+        for constellation in set(parseConstellations(record.navSystem)):
+            self.byConstellation.setdefault(constellation, []).append(index)
+
+    def _cell(self, latitude: float, longitude: float) -> tuple:
+        """Return the grid cell of a position."""
+        row = min(max(floor((latitude + 90.0) / self.cellSize), 0), self.numRows - 1)
+        column = floor((longitude + 180.0) / self.cellSize) % self.numColumns
+        return row, column
+
+    def _filter(self, format=None, messageType=None, constellation=None):
+        """Return the set of stream positions matching all filters, or None."""
+        selected = None
+        if format is not None:
+            selected = set(self.byFormat.get(format.strip().upper(), ()))
+        if messageType is not None:
+            matches = self.byMessageType.get(int(messageType), ())
+            selected = set(matches) if selected is None else selected & set(matches)
+        if constellation is not None:
+            constellation = constellation.strip().upper()
+            constellation = _constellations.get(constellation, constellation)
+            matches = self.byConstellation.get(constellation, ())
+            selected = set(matches) if selected is None else selected & set(matches)
+        return selected
+
+    def find(self, format=None, messageType=None, constellation=None) -> list:
+        """Return the streams matching all of the given attributes.
+
+        Parameters
+        ----------
+        format : str, optional
+            Stream format, e.g. ``"RTCM 3.2"`` (case-insensitive).
+        messageType : int, optional
+            RTCM message number listed in the format details.
+        constellation : str, optional
+            Navigation system, e.g. ``"GLONASS"`` or ``"GLO"``.
+
+        Returns
+        -------
+        list of StrRecord
+            The matching streams in table order; all streams if no filter is
+            given.
+        """
+        selected = self._filter(format, messageType, constellation)
+        if selected is None:
+            return list(self)
+        return [self.stream(index) for index in sorted(selected)]
+
+    def within(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        format=None,
+        messageType=None,
+        constellation=None,
+    ) -> list:
+        """Return the streams within a distance of a position.
+
+        Parameters
+        ----------
+        latitude : float
+            Latitude of the position in degrees.
+        longitude : float
+            Longitude of the position in degrees.
+        radius : float
+            Search radius in km.
+        format, messageType, constellation : optional
+            Filters as in :meth:`find`.
+
+        Returns
+        -------
+        list of tuple of (float, StrRecord)
+            Distance in km and stream, nearest first.
+        """
+        selected = self._filter(format, messageType, constellation)
+        found = [
+            (dist, index)
+            for dist, index in self._within(latitude, longitude, radius)
+            if selected is None or index in selected
+        ]
+        found.sort()
+        return [(dist, self.stream(index)) for dist, index in found]
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        count: int = 1,
+        format=None,
+        messageType=None,
+        constellation=None,
+    ) -> list:
+        """Return the streams nearest to a position.
+
+        The search radius starts at one grid cell and doubles until enough
+        streams are found, so only the grid cells near the position are
+        visited.
+
+        Parameters
+        ----------
+        latitude : float
+            Latitude of the position in degrees.
+        longitude : float
+            Longitude of the position in degrees.
+        count : int, optional
+            Number of streams to return. The default is 1.
+        format, messageType, constellation : optional
+            Filters as in :meth:`find`.
+
+        Returns
+        -------
+        list of tuple of (float, StrRecord)
+            Up to ``count`` pairs of distance in km and stream, nearest first.
+        """
+        selected = self._filter(format, messageType, constellation)
+        radius = radians(self.cellSize) * EARTH_RADIUS
+        halfCircumference = EARTH_RADIUS * pi
+        while True:
+            found = [
+                (dist, index)
+                for dist, index in self._within(latitude, longitude, radius)
+                if selected is None or index in selected
+            ]
+            if len(found) >= count or radius >= halfCircumference:
+                break
+            radius *= 2
+        found.sort()
+        return [(dist, self.stream(index)) for dist, index in found[:count]]
+
+    def _within(self, latitude: float, longitude: float, radius: float):
+        """Yield ``(distance, position)`` of every indexed stream within radius."""
+        cellSize = self.cellSize
+        angle = radius / EARTH_RADIUS
+        deltaLatitude = degrees(angle)
+        firstRow = max(floor((latitude - deltaLatitude + 90.0) / cellSize), 0)
+        lastRow = min(
+            floor((latitude + deltaLatitude + 90.0) / cellSize), self.numRows - 1
+        )
+        columns = range(self.numColumns)
+        polar = latitude + deltaLatitude >= 90.0 or latitude - deltaLatitude <= -90.0
+        reach = inf if polar else sin(min(angle, pi / 2))
+        if not polar and reach < cos(radians(latitude)):
+            deltaLongitude = degrees(asin(reach / cos(radians(latitude))))
+            firstColumn = floor((longitude - deltaLongitude + 180.0) / cellSize)
+            lastColumn = floor((longitude + deltaLongitude + 180.0) / cellSize)
+            if lastColumn - firstColumn + 1 < self.numColumns:
+                columns = [
+                    column % self.numColumns
+                    for column in range(firstColumn, lastColumn + 1)
+                ]
+        latitudes = self.columns["latitude"]
+        longitudes = self.columns["longitude"]
+        grid = self.grid
+        for row in range(firstRow, lastRow + 1):
+            for column in columns:
+                for index in grid.get((row, column), ()):
+                    dist = distance(
+                        latitude, longitude, latitudes[index], longitudes[index]
+                    )
+                    if dist <= radius:
+                        yield dist, index
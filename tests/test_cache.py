@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the SourcetableCache.
+
+A loopback caster serves a small source table with ``ETag`` and
+``Last-Modified`` validators and answers matching conditional requests with
+``304 Not Modified``.
+"""
+
+import asyncio
+import tempfile
+import unittest
+
+from ntripstreams.cache import SourcetableCache
+from ntripstreams.ntripstreams import NtripStream
+
+LINES = (
+    "STR;MOUNT1;Copenhagen;RTCM 3.2;1004(1),1005(10);2;GPS+GLO;EXNET;DNK;"
+    "55.68;12.57;0;0;Leica;none;B;N;9600;",
+    "ENDSOURCETABLE",
+)
+LAST_MODIFIED = "Sat, 17 Oct 2026 10:00:00 GMT"
+
+
+class TestSourcetableCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests = []
+        self.etag = '"v1"'
+        self.hangUp = False
+
+        async def serve(reader, writer):
+            request = (await reader.readuntil(b"\r\n\r\n")).decode("ISO-8859-1")
+            self.requests.append(request)
+            await asyncio.sleep(0.01)
+            if self.hangUp:
+                writer.close()
+                return
+            if f"If-None-Match: {self.etag}\r\n" in request:
+                writer.write(b"HTTP/1.1 304 Not Modified\r\n\r\n")
+            else:
+                writer.write(
+                    (
+                        f"HTTP/1.1 200 OK\r\nETag: {self.etag}\r\n"
+                        f"Last-Modified: {LAST_MODIFIED}\r\n\r\n"
+                        + "".join(line + "\r\n" for line in LINES)
+                    ).encode("ISO-8859-1")
+                )
+            await writer.drain()
+            writer.close()
+
+        self.server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_fresh_copy_is_served_from_memory(self):
+        cache = SourcetableCache(ttl=60)
+        self.assertEqual(await cache.getLines(self.url), LINES)
+        self.assertEqual(await cache.getLines(self.url), LINES)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    async def test_concurrent_requests_share_one_fetch(self):
+        cache = SourcetableCache(ttl=60)
+        results = await asyncio.gather(*(cache.getLines(self.url) for _ in range(20)))
+        self.assertEqual(results, [LINES] * 20)
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_expired_copy_is_revalidated(self):
+        cache = SourcetableCache(ttl=0)
+        table = await cache.getSourcetable(self.url)
+        self.assertIs(await cache.getSourcetable(self.url), table)
+        self.assertIn(f"If-Modified-Since: {LAST_MODIFIED}\r\n", self.requests[1])
+        self.assertIn('If-None-Match: "v1"\r\n', self.requests[1])
+        self.assertEqual((cache.revalidations, cache.notModified), (1, 1))
+        self.etag = '"v2"'
+        self.assertIsNot(await cache.getSourcetable(self.url), table)
+        self.assertEqual(cache.entries[self.url].etag, '"v2"')
+
+    async def test_validators_survive_bare_not_modified(self):
+        cache = SourcetableCache(ttl=0)
+        lines = await cache.getLines(self.url)
+        for _ in range(2):
+            self.assertIs(await cache.getLines(self.url), lines)
+        for request in self.requests[1:]:
+            self.assertIn('If-None-Match: "v1"\r\n', request)
+            self.assertIn(f"If-Modified-Since: {LAST_MODIFIED}\r\n", request)
+        self.assertEqual(cache.notModified, 2)
+
+    async def test_stale_copy_when_caster_fails(self):
+        cache = SourcetableCache(ttl=0)
+        lines = await cache.getLines(self.url)
+        self.server.close()
+        await self.server.wait_closed()
+        self.assertIs(await cache.getLines(self.url), lines)
+        self.assertEqual((cache.staleHits, cache.errors), (1, 1))
+        cache.maxStale = 0
+        with self.assertRaises(OSError):
+            await cache.getLines(self.url)
+
+    async def test_stale_copy_when_caster_hangs_up(self):
+        cache = SourcetableCache(ttl=0)
+        lines = await cache.getLines(self.url)
+        self.hangUp = True
+        self.assertIs(await cache.getLines(self.url), lines)
+        self.assertEqual((cache.staleHits, cache.errors), (1, 1))
+        with self.assertRaises(ConnectionError):
+            await SourcetableCache().getLines(self.url)
+        ntripStream = NtripStream()
+        with self.assertRaises(ConnectionError):
+            async for _ in ntripStream.iterSourcetableLines(self.url):
+                pass
+        self.assertTrue(ntripStream.ntripWriter.is_closing())
+
+    async def test_cached_lines_are_immutable(self):
+        cache = SourcetableCache(ttl=60)
+        table = await cache.getSourcetable(self.url)
+        lines = await cache.getLines(self.url)
+        self.assertIsInstance(lines, tuple)
+        self.assertIs(await cache.getLines(self.url), lines)
+        self.assertIs(await cache.getSourcetable(self.url), table)
+
+    async def test_disk_cache_is_shared(self):
+        with tempfile.TemporaryDirectory() as cacheDir:
+            await SourcetableCache(ttl=60, cacheDir=cacheDir).getLines(self.url)
+            cache = SourcetableCache(ttl=60, cacheDir=cacheDir)
+            self.assertEqual(await cache.getLines(self.url), LINES)
+            self.assertEqual(len(self.requests), 1)
+            self.assertEqual(cache.hits, 1)
+            cache.invalidate()
+            self.assertEqual(await cache.getLines(self.url), LINES)
+            self.assertEqual(len(self.requests), 2)
+            self.assertNotIn("If-None-Match", self.requests[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
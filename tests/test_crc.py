@@ -11,7 +11,20 @@ import unittest
 
 from bitstring import BitStream
 
-from ntripstreams.crc import crc24q, crcNmea, genLookup
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ntripstreams.crc import (
+    _CRC24Q_LUT,
+    crc24q,
+    crc24qArray,
+    crc24qVerify,
+    crc24qVerifyArray,
+    crcNmea,
+    genLookup,
+)
 
 
 class TestCrcFunctions(unittest.TestCase):
@@ -28,9 +41,45 @@ class TestCrcFunctions(unittest.TestCase):
         rtcmCrcBits = rtcmBits[-24:].unpack("uint:24")[0]
         self.assertEqual(crc24q(rtcmBits[:-24]), rtcmCrcBits)
 
+    def test_crc24q_bytes_and_memoryview(self):
+        rtcm = bytes.fromhex("D300133ED7D30202980EDEEF34B4BD62AC0941986F33360B98")
+        expected = int.from_bytes(rtcm[-3:], "big")
+        self.assertEqual(crc24q(rtcm[:-3]), expected)
+        self.assertEqual(crc24q(bytearray(rtcm[:-3])), expected)
+        self.assertEqual(crc24q(memoryview(rtcm)[:-3]), expected)
+
+    def test_crc24qVerify(self):
+        rtcm = bytes.fromhex("D300133ED7D30202980EDEEF34B4BD62AC0941986F33360B98")
+        corrupt = rtcm[:-1] + b"\x00"
+        self.assertEqual(
+            crc24qVerify([rtcm, corrupt, memoryview(rtcm)]), [True, False, True]
+        )
+
+    def test_lookup_table_matches_genLookup(self):
+        self.assertEqual(list(_CRC24Q_LUT), genLookup())
+
     def test_genLookup(self):
         remTab = genLookup()
         self.assertEqual(remTab[0], 0x000000)
         self.assertEqual(remTab[1], 0x864CFB)
         self.assertEqual(remTab[-2], 0x5BC9C3)
         self.assertEqual(remTab[-1], 0xDD8538)
+
+
+@unittest.skipUnless(numpy, "numpy not installed")
+class TestCrcArray(unittest.TestCase):
+    RTCM = bytes.fromhex("D300133ED7D30202980EDEEF34B4BD62AC0941986F33360B98")
+
+    def test_crc24qArray_matches_crc24q(self):
+        data = bytes(range(256)) * 4 + self.RTCM
+        offsets = [0, 3, 100, 1000, 7]
+        lengths = [0, 1, 512, 30, 900]
+        expected = [crc24q(data[o : o + n]) for o, n in zip(offsets, lengths)]
+        self.assertEqual(crc24qArray(data, offsets, lengths).tolist(), expected)
+
+    def test_crc24qVerifyArray(self):
+        data = self.RTCM + b"\x00" + self.RTCM[:-1] + b"\x00" + self.RTCM
+        size = len(self.RTCM)
+        mask = crc24qVerifyArray(data, [0, size + 1, 2 * size + 1], [size] * 3)
+        self.assertEqual(mask.tolist(), [True, False, True])
+        self.assertEqual(crc24qVerifyArray(data, [], []).tolist(), [])
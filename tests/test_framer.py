@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the sans-IO RtcmFramer.
+
+The raw captures under ``tests/data/samples`` are fed in chunks of varying size
+and the emitted frames are compared with a straightforward scan of the file.
+"""
+
+import glob
+import os
+import random
+import unittest
+
+from ntripstreams.framer import ChunkedDecoder, RtcmFrame, RtcmFramer
+from ntripstreams.rtcm3 import Rtcm3
+
+RAW_GLOB = os.path.join(os.path.dirname(__file__), "data", "samples", "*.rtcm3")
+
+
+def frame_bytes(frames):
+    return [frame.data for frame in frames]
+
+
+def split_frames(raw):
+    """Return the raw RTCM3 frames (preamble to CRC) found in a capture."""
+    frames = []
+    i = 0
+    while i + 3 <= len(raw):
+        if raw[i] != 0xD3:
+            i += 1
+            continue
+        end = i + 6 + (((raw[i + 1] & 0x03) << 8) | raw[i + 2])
+        if end > len(raw):
+            break
+        frames.append(raw[i:end])
+        i = end
+    return frames
+
+
+class TestRtcmFramer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.captures = []
+        for path in sorted(glob.glob(RAW_GLOB)):
+            with open(path, "rb") as fh:
+                raw = fh.read()
+            cls.captures.append((raw, split_frames(raw)))
+
+    def test_feed_in_chunks_matches_capture(self):
+        for chunkSize in (1, 7, 2048, 1 << 20):
+            for raw, expected in self.captures:
+                framer = RtcmFramer()
+                frames = []
+                for i in range(0, len(raw), chunkSize):
+                    frames += framer.feed(raw[i : i + chunkSize])
+                self.assertEqual(frame_bytes(frames), expected)
+                self.assertEqual(framer.framesEmitted, len(expected))
+                self.assertEqual(framer.crcFailures, 0)
+
+    def test_frame_fields(self):
+        _, expected = self.captures[0]
+        frame = RtcmFramer().feed(expected[0], timeNs=123)[0]
+        self.assertEqual(frame.messageType, int(expected[0][3:5].hex()[:3], 16))
+        self.assertEqual(frame.payloadLength, len(expected[0]) - 6)
+        self.assertEqual(frame.crc, int.from_bytes(expected[0][-3:], "big"))
+        self.assertEqual(frame.timeNs, 123)
+        self.assertEqual(bytes(frame.payload), expected[0][3:-3])
+        self.assertEqual(bytes(frame), frame.tobytes())
+        self.assertFalse(hasattr(RtcmFrame(expected[0]), "__dict__"))
+
+    def test_counters_on_garbage_and_crc_failure(self):
+        raw, expected = self.captures[0]
+        corrupt = bytearray(expected[0])
+        corrupt[-1] ^= 0xFF
+        framer = RtcmFramer()
+        frames = framer.feed(b"\x00\x01" + bytes(corrupt) + expected[1])
+        self.assertEqual(frame_bytes(frames), [expected[1]])
+        self.assertEqual(framer.crcFailures, 1)
+        self.assertEqual(framer.bytesSkipped, 2 + len(corrupt))
+        self.assertEqual(len(framer), 0)
+
+    def test_resync_after_garbage(self):
+        _, expected = self.captures[0]
+        rng = random.Random(42)
+        garbage = bytes(
+            rng.choice((0xD3, 0x00, 0xFF, rng.randrange(256))) for _ in range(20000)
+        )
+        framer = RtcmFramer()
+        frames = framer.feed(b"\xd3\xfc\x10\xd3\x00\x01" + garbage)
+        frames += framer.feed(b"".join(expected[:5]))
+        self.assertEqual(frame_bytes(frames[-5:]), expected[:5])
+        self.assertGreater(framer.headerRejects, 2)
+        self.assertEqual(len(framer), 0)
+        self.assertEqual(
+            framer.bytesSkipped,
+            6 + len(garbage) - sum(len(frame) for frame in frames[:-5]),
+        )
+
+    def test_zero_length_frame(self):
+        _, expected = self.captures[0]
+        fill = b"\xd3\x00\x00\x47\xea\x4b"
+        framer = RtcmFramer()
+        frames = framer.feed(fill + expected[0] + fill)
+        self.assertEqual(frame_bytes(frames), [fill, expected[0], fill])
+        self.assertIsNone(frames[0].messageType)
+        self.assertEqual(frames[0].payloadLength, 0)
+        self.assertEqual(framer.headerRejects, 0)
+        self.assertEqual(framer.bytesSkipped, 0)
+        self.assertEqual(
+            Rtcm3().decodeRtcmFrame(frames[0]), (None, ["Empty message", [], []])
+        )
+
+    def test_partial_frame_is_kept(self):
+        _, expected = self.captures[0]
+        framer = RtcmFramer()
+        self.assertEqual(framer.feed(expected[0][:-1]), [])
+        self.assertEqual(len(framer), len(expected[0]) - 1)
+        self.assertEqual(frame_bytes(framer.feed(expected[0][-1:])), [expected[0]])
+
+    def test_reset_discards_buffer(self):
+        _, expected = self.captures[0]
+        framer = RtcmFramer()
+        framer.feed(expected[0][:10])
+        framer.reset()
+        self.assertEqual(frame_bytes(framer.feed(expected[1])), [expected[1]])
+
+    def test_chunked_frames_through_framer(self):
+        raw, expected = self.captures[0]
+        body = b"".join(
+            b"%x\r\n%s\r\n" % (len(raw[i : i + 100]), raw[i : i + 100])
+            for i in range(0, len(raw), 100)
+        )
+        decoder = ChunkedDecoder()
+        framer = RtcmFramer()
+        frames = []
+        for i in range(0, len(body), 2048):
+            frames += framer.feed(decoder.feed(body[i : i + 2048]))
+        self.assertEqual(frame_bytes(frames), expected)
+
+
+class TestChunkedDecoder(unittest.TestCase):
+    BODY = b"5\r\nHELLO\r\n6;ext=1\r\n WORLD\r\n\r\n1\r\n!\r\n0\r\n\r\n"
+
+    def test_split_at_every_byte(self):
+        decoder = ChunkedDecoder()
+        payload = b"".join(
+            decoder.feed(self.BODY[i : i + 1]) for i in range(len(self.BODY))
+        )
+        self.assertEqual(payload, b"HELLO WORLD!")
+        self.assertTrue(decoder.done)
+
+    def test_data_after_last_chunk_is_ignored(self):
+        decoder = ChunkedDecoder()
+        self.assertEqual(decoder.feed(self.BODY + b"3\r\nXYZ\r\n"), b"HELLO WORLD!")
+
+    def test_malformed_chunks(self):
+        for body in (b"zz\r\n", b"2\r\nABC\r\n", b"1" * 2000):
+            with self.assertRaises(IOError):
+                ChunkedDecoder().feed(body)
+
+
+if __name__ == "__main__":
+    unittest.main()
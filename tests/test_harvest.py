@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for harvesting source tables from several loopback casters."""
+
+import asyncio
+import socket
+import unittest
+
+from ntripstreams.cache import SourcetableCache
+from ntripstreams.harvest import harvestSourcetables
+
+
+def str_line(mountpoint, latitude=55.0, longitude=12.0):
+    return (
+        f"STR;{mountpoint};;RTCM 3.2;1004(1);2;GPS;NET;DNK;{latitude};{longitude};"
+        "0;0;;none;N;N;9600;"
+    )
+
+
+class TestHarvest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servers = []
+        self.requests = 0
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def caster(self, lines, delay=0.0):
+        """Start a loopback caster answering after ``delay`` seconds.
+
+        With ``lines`` None the caster closes the connection without answering.
+        """
+
+        async def serve(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            self.requests += 1
+            await asyncio.sleep(delay)
+            if lines is None:
+                writer.close()
+                return
+            writer.write(
+                b"SOURCETABLE 200 OK\r\n\r\n"
+                + "".join(line + "\r\n" for line in lines).encode("ISO-8859-1")
+            )
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        self.servers.append(server)
+        return f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    def closed_port_url(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    async def test_merge_with_partial_results(self):
+        first = await self.caster(
+            [str_line("SHARED", 1.0, 1.0), str_line("A1"), "ENDSOURCETABLE"], 0.3
+        )
+        second = await self.caster(
+            [str_line("SHARED", 2.0, 2.0), str_line("B1"), "ENDSOURCETABLE"]
+        )
+        truncated = await self.caster([str_line("C1")])
+        hanging = await self.caster(["ENDSOURCETABLE"], 10.0)
+        refused = self.closed_port_url()
+        result = await harvestSourcetables(
+            [first, second, truncated, hanging, refused, first], timeout=1.0
+        )
+        table = result.sourcetable
+        self.assertEqual(
+            [stream.mountpoint for stream in table], ["SHARED", "A1", "B1"]
+        )
+        self.assertEqual(table["SHARED"].latitude, 1.0)
+        self.assertEqual(table.sourceOf("SHARED"), first)
+        self.assertEqual(table.sourceOf("B1"), second)
+        self.assertEqual(
+            [(source, record.latitude) for source, record in table.duplicates],
+            [(second, 2.0)],
+        )
+        self.assertEqual(set(result.errors), {truncated, hanging, refused})
+        self.assertIsInstance(result.errors[hanging], asyncio.TimeoutError)
+        self.assertFalse(table.complete)
+
+    async def test_failing_casters_do_not_abort_harvest(self):
+        good = await self.caster([str_line("M1"), "ENDSOURCETABLE"], 0.2)
+        silent = await self.caster(None)
+        badPort = "http://127.0.0.1:99999"
+        for cache in (None, SourcetableCache()):
+            result = await harvestSourcetables([silent, badPort, good], cache=cache)
+            self.assertEqual(list(result.sourcetable.mountpoints), ["M1"])
+            self.assertEqual(set(result.errors), {silent, badPort})
+            self.assertIsInstance(result.errors[silent], ConnectionError)
+            self.assertIsInstance(result.errors[badPort], ValueError)
+        self.assertEqual(len(asyncio.all_tasks()), 1)
+
+    async def test_casters_are_fetched_concurrently(self):
+        urls = [
+            await self.caster([str_line(f"M{i}"), "ENDSOURCETABLE"], 0.2)
+            for i in range(8)
+        ]
+        result = await harvestSourcetables(urls, maxConcurrency=8)
+        self.assertEqual(len(result.sourcetable), 8)
+        self.assertEqual(result.errors, {})
+        self.assertTrue(result.sourcetable.complete)
+        self.assertLess(result.elapsed, 0.2 * 4)
+
+        limited = await harvestSourcetables(urls, maxConcurrency=2)
+        self.assertGreaterEqual(limited.elapsed, 0.2 * 4)
+
+    async def test_harvest_through_cache(self):
+        url = await self.caster([str_line("M1"), "ENDSOURCETABLE"])
+        cache = SourcetableCache(ttl=60)
+        for _ in range(3):
+            result = await harvestSourcetables([url], cache=cache)
+            self.assertEqual(result.sourcetable.sourceOf("M1"), url)
+        self.assertEqual(self.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
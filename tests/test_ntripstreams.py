@@ -7,11 +7,14 @@ response-parsing tests drive the methods with a small in-memory fake reader.
 """
 
 import asyncio
+import os
 import unittest
+from urllib.parse import urlsplit
 
 from ntripstreams.ntripstreams import NtripStream
 
 URL = "http://caster.example.net:2101"
+SAMPLE = os.path.join(os.path.dirname(__file__), "data", "samples", "aamakinen.rtcm3")
 
 
 def header_lines(raw):
@@ -48,6 +51,28 @@ class FakeReader:
         self._pos += n
         return chunk
 
+    async def read(self, n=-1):
+        end = len(self._data) if n < 0 else self._pos + n
+        chunk = self._data[self._pos : end]
+        self._pos += len(chunk)
+        return chunk
+
+
+def split_frames(raw):
+    """Return the raw RTCM3 frames (preamble to CRC) found in a capture."""
+    frames = []
+    i = 0
+    while i + 3 <= len(raw):
+        if raw[i] != 0xD3:
+            i += 1
+            continue
+        end = i + 6 + (((raw[i + 1] & 0x03) << 8) | raw[i + 2])
+        if end > len(raw):
+            break
+        frames.append(raw[i:end])
+        i = end
+    return frames
+
 
 class TestStreamHeader(unittest.TestCase):
     def test_basic_get_request(self):
@@ -149,11 +174,377 @@ class TestResponseParsing(unittest.IsolatedAsyncioTestCase):
         await ns.getNtripResponseHeader()
         self.assertTrue(ns.ntripStreamChunked)
 
-    async def test_read_chunked_body_decodes_and_strips_extension(self):
+    async def test_read_chunked_lines_decodes_and_strips_extension(self):
         # RTCM 10410.1 sec. 2.4: hex size lines, optional ;extension, 0 ends.
         ns = NtripStream()
-        ns.ntripReader = FakeReader(b"5\r\nHELLO\r\n6;ext\r\n WORLD\r\n0\r\n\r\n")
-        self.assertEqual(await ns._readChunkedBody(), b"HELLO WORLD")
+        ns.ntripReader = FakeReader(
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5\r\nHELLO\r\n8;ext\r\n WORLD\r\n\r\n3\r\nEND\r\n0\r\n\r\n"
+        )
+        await ns.getNtripResponseHeader()
+        lines = [line async for line in ns._readChunkedLines()]
+        self.assertEqual(lines, ["HELLO WORLD", "END"])
+
+    async def test_read_chunked_lines_raises_on_malformed_chunk(self):
+        ns = NtripStream()
+        ns.casterUrl = urlsplit("http://127.0.0.1:2101")
+        ns.ntripReader = FakeReader(
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5\r\nLINE\n\r\nzz\r\n"
+        )
+        await ns.getNtripResponseHeader()
+        with self.assertRaises(IOError):
+            [line async for line in ns._readChunkedLines()]
+
+
+class TestRtcmFraming(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(SAMPLE, "rb") as fh:
+            cls.raw = fh.read()
+        cls.frames = split_frames(cls.raw)
+
+    async def read_all(self, ns, count):
+        return [(await ns.getRtcmFrame())[0].tobytes() for _ in range(count)]
+
+    async def test_frames_match_capture(self):
+        ns = NtripStream()
+        ns.ntripReader = FakeReader(self.raw)
+        frames = await self.read_all(ns, len(self.frames))
+        self.assertEqual(frames, self.frames)
+
+    async def test_skips_garbage_and_corrupt_frame(self):
+        corrupt = bytearray(self.frames[0])
+        corrupt[-1] ^= 0xFF
+        ns = NtripStream()
+        ns.ntripReader = FakeReader(
+            b"\x00\xd3\x00\x00garbage" + bytes(corrupt) + b"".join(self.frames[1:4])
+        )
+        self.assertEqual(await self.read_all(ns, 3), self.frames[1:4])
+
+    async def test_get_frames_drains_buffer(self):
+        ns = NtripStream()
+        ns.ntripReader = FakeReader(self.raw)
+        frames = []
+        batches = 0
+        while len(frames) < len(self.frames):
+            batch = await ns.getRtcmFrames()
+            self.assertEqual(len({timeStamp for _, timeStamp in batch}), 1)
+            frames += [frame.tobytes() for frame, _ in batch]
+            batches += 1
+        self.assertEqual(frames, self.frames)
+        self.assertLess(batches, len(self.frames))
+
+    async def test_async_iteration_ends_with_connection_error(self):
+        ns = NtripStream()
+        ns.ntripReader = FakeReader(self.raw)
+        frames = []
+        with self.assertRaises(ConnectionError):
+            async for frame, timeStamp in ns:
+                frames.append(frame.tobytes())
+        self.assertEqual(frames, self.frames)
+        self.assertEqual(ns.rtcmFramesDropped, 0)
+
+    async def test_async_iteration_drop_policies(self):
+        for policy, kept in (
+            ("dropOldest", self.frames[-2:]),
+            ("dropNewest", self.frames[:2]),
+        ):
+            ns = NtripStream(maxQueueSize=2, overflowPolicy=policy)
+            ns.ntripReader = FakeReader(self.raw)
+            iterator = ns.__aiter__()
+            await asyncio.sleep(0)
+            frames = []
+            with self.assertRaises(ConnectionError):
+                async for frame, _ in iterator:
+                    frames.append(frame.tobytes())
+            self.assertEqual(frames, kept)
+            self.assertEqual(ns.rtcmFramesDropped, len(self.frames) - 2)
+
+    async def test_stop_reader_ends_iteration(self):
+        ns = NtripStream(maxQueueSize=1)
+        ns.ntripReader = FakeReader(self.raw)
+        frames = []
+        async for frame, _ in ns:
+            frames.append(frame)
+            await ns.stopRtcmReader()
+        self.assertLessEqual(len(frames), 2)
+        self.assertEqual(ns.rtcmFramesDropped, 0)
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            NtripStream(overflowPolicy="spill")
+
+    async def test_chunked_stream(self):
+        body = b"".join(
+            b"%x;ext\r\n%s\r\n" % (len(self.raw[i : i + 300]), self.raw[i : i + 300])
+            for i in range(0, len(self.raw), 300)
+        )
+        ns = NtripStream()
+        ns.ntripReader = FakeReader(
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            + body
+            + b"0\r\n\r\n"
+        )
+        await ns.getNtripResponseHeader()
+        frames = []
+        with self.assertRaises(ConnectionError):
+            while True:
+                frames += [frame.tobytes() for frame, _ in await ns.getRtcmFrames()]
+        self.assertEqual(frames, self.frames)
+
+    async def test_closed_connection_raises(self):
+        ns = NtripStream()
+        ns.ntripReader = FakeReader(self.frames[0])
+        await ns.getRtcmFrame()
+        with self.assertRaises(ConnectionError):
+            await ns.getRtcmFrame()
+
+
+class TestProtocolTransport(unittest.IsolatedAsyncioTestCase):
+    """Drive NtripProtocol against a loopback caster serving a capture."""
+
+    async def asyncSetUp(self):
+        with open(SAMPLE, "rb") as fh:
+            self.raw = fh.read()
+        self.frames = split_frames(self.raw)
+
+        async def serve(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"HTTP/1.1 200 OK\r\nServer: test\r\n\r\n" + self.raw)
+            await writer.drain()
+            writer.close()
+
+        self.server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_frames_reach_callback(self):
+        frames = []
+        ns = NtripStream()
+        await ns.requestNtripStreamProtocol(
+            self.url, "MOUNT1", frameCallback=lambda frame, _: frames.append(frame)
+        )
+        await ns.rtcmReaderTask
+        self.assertEqual([frame.tobytes() for frame in frames], self.frames)
+
+    async def test_async_iteration_with_callback_raises(self):
+        ns = NtripStream()
+        await ns.requestNtripStreamProtocol(
+            self.url, "MOUNT1", frameCallback=lambda frame, _: None
+        )
+        with self.assertRaises(RuntimeError):
+            async for _ in ns:
+                pass
+        await ns.stopRtcmReader()
+
+    async def test_async_iteration_with_blocking_queue(self):
+        ns = NtripStream(maxQueueSize=2)
+        await ns.requestNtripStreamProtocol(self.url, "MOUNT1")
+        frames = []
+        with self.assertRaises(ConnectionError):
+            async for frame, _ in ns:
+                frames.append(frame.tobytes())
+                await asyncio.sleep(0)
+        self.assertEqual(frames, self.frames)
+        self.assertEqual(ns.rtcmFramesDropped, 0)
+
+
+class TestSourcetableStreaming(unittest.IsolatedAsyncioTestCase):
+    """Stream source tables from a loopback caster."""
+
+    LINES = [
+        "CAS;caster.example.net;2101;EXAMPLE;Operator;0;DNK;55.67;12.57;;0;",
+        "STR;MOUNT1;Copenhagen;RTCM 3.2;1004(1),1005(10);2;GPS+GLO;EXNET;DNK;"
+        "55.68;12.57;0;0;Leica;none;B;N;9600;",
+        "STR;MOUNT2;Aarhus;RTCM 3.3;1077(1);2;GPS;EXNET;DNK;56.16;10.20;0;0;"
+        "Trimble;none;B;N;9600;",
+        "ENDSOURCETABLE",
+    ]
+
+    async def asyncSetUp(self):
+        self.body = "".join(line + "\r\n" for line in self.LINES).encode()
+        self.header = b"SOURCETABLE 200 OK\r\nContent-Type: text/plain\r\n\r\n"
+        self.release = asyncio.Event()
+
+        async def serve(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(self.header)
+            for piece in self.pieces:
+                if piece is None:
+                    await self.release.wait()
+                    continue
+                writer.write(piece)
+                await writer.drain()
+            writer.close()
+
+        self.server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_plain_sourcetable(self):
+        self.pieces = [self.body]
+        self.assertEqual(await NtripStream().requestSourcetable(self.url), self.LINES)
+
+    async def test_chunked_sourcetable_split_across_chunks(self):
+        self.header = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+        self.pieces = [
+            b"%x\r\n%s\r\n" % (len(self.body[i : i + 7]), self.body[i : i + 7])
+            for i in range(0, len(self.body), 7)
+        ] + [b"0\r\n\r\n"]
+        self.assertEqual(await NtripStream().requestSourcetable(self.url), self.LINES)
+
+    async def test_records_are_yielded_before_end_of_table(self):
+        split = self.body.index(b"STR;MOUNT2")
+        self.pieces = [self.body[:split], None, self.body[split:]]
+        records = NtripStream().iterSourcetable(self.url)
+        await anext(records)
+        stream = await anext(records)
+        self.assertEqual(stream.mountpoint, "MOUNT1")
+        self.assertFalse(self.release.is_set())
+        self.release.set()
+        self.assertEqual([record.mountpoint async for record in records], ["MOUNT2"])
+
+
+class TestTimeoutsAndStalls(unittest.IsolatedAsyncioTestCase):
+    """Drive timeouts and the stall watchdog with a loopback caster."""
+
+    async def asyncSetUp(self):
+        with open(SAMPLE, "rb") as fh:
+            self.frames = split_frames(fh.read())
+        self.connections = 0
+        self.hang = asyncio.Event()
+
+        async def serve(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            self.connections += 1
+            if self.connections in self.silent:
+                await self.hang.wait()
+            writer.write(b"HTTP/1.1 200 OK\r\nServer: test\r\n\r\n")
+            if self.connections in self.stalling:
+                writer.write(b"".join(self.frames[:10]))
+                await writer.drain()
+                await self.hang.wait()
+            writer.write(b"".join(self.frames[10:]))
+            await writer.drain()
+            writer.close()
+
+        self.silent = ()
+        self.stalling = (1,)
+        self.server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        self.hang.set()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def read_until_closed(self, ns):
+        frames = []
+        with self.assertRaises(ConnectionError):
+            while True:
+                frames += [frame.tobytes() for frame, _ in await ns.getRtcmFrames()]
+        return frames
+
+    async def test_only_the_deadline_is_reported_as_exceeded(self):
+        ns = NtripStream()
+        ns.casterUrl = urlsplit(self.url)
+        error = TimeoutError(110, "Connection timed out")
+
+        async def connect():
+            raise error
+
+        with self.assertRaises(TimeoutError) as raised:
+            await ns._wait(connect(), 10.0, "connection")
+        self.assertIs(raised.exception, error)
+        with self.assertRaisesRegex(TimeoutError, "No connection .* within 0.01 s"):
+            await ns._wait(asyncio.sleep(1), 0.01, "connection")
+
+    async def test_header_timeout(self):
+        self.silent = (1,)
+        ns = NtripStream(headerTimeout=0.1)
+        with self.assertRaises(TimeoutError):
+            await ns.requestNtripStream(self.url, "MOUNT1")
+
+    async def test_stall_reconnects(self):
+        ns = NtripStream(idleTimeout=0.2)
+        await ns.requestNtripStream(self.url, "MOUNT1")
+        self.assertEqual(await self.read_until_closed(ns), self.frames)
+        self.assertEqual((ns.rtcmStalls, ns.rtcmReconnects), (1, 1))
+        self.assertGreaterEqual(ns.rtcmLastRecoveryTime, 0.2)
+        self.assertLess(ns.rtcmLastRecoveryTime, 2.0)
+        self.assertEqual(ns.rtcmMaxRecoveryTime, ns.rtcmLastRecoveryTime)
+
+    async def test_stall_without_reconnect(self):
+        ns = NtripStream(idleTimeout=0.1, reconnectOnStall=False)
+        await ns.requestNtripStream(self.url, "MOUNT1")
+        frames = []
+        with self.assertRaises(TimeoutError):
+            async for frame, _ in ns:
+                frames.append(frame.tobytes())
+        self.assertEqual(frames, self.frames[:10])
+        self.assertEqual(
+            (ns.rtcmStalls, ns.rtcmReconnects, self.connections), (1, 0, 1)
+        )
+
+    async def test_failed_reconnect(self):
+        self.silent = (2,)
+        ns = NtripStream(idleTimeout=0.2, headerTimeout=0.2)
+        await ns.requestNtripStream(self.url, "MOUNT1")
+        with self.assertRaises(TimeoutError):
+            async for _ in ns:
+                pass
+        self.assertEqual((ns.rtcmReconnects, ns.rtcmReconnectFailures), (0, 1))
+
+    async def test_protocol_stall_reconnects(self):
+        ns = NtripStream(idleTimeout=0.1)
+        await ns.requestNtripStreamProtocol(self.url, "MOUNT1")
+        frames = []
+        with self.assertRaises(ConnectionError):
+            async for frame, _ in ns:
+                frames.append(frame.tobytes())
+        self.assertEqual(frames, self.frames)
+        self.assertEqual(
+            (ns.rtcmStalls, ns.rtcmReconnects, self.connections), (1, 1, 2)
+        )
+        self.assertGreaterEqual(ns.rtcmLastRecoveryTime, 0.1)
+
+    async def test_protocol_watchdog_without_reconnect(self):
+        ns = NtripStream(idleTimeout=0.1, reconnectOnStall=False)
+        await ns.requestNtripStreamProtocol(self.url, "MOUNT1")
+        frames = []
+        with self.assertRaises(TimeoutError):
+            async for frame, _ in ns:
+                frames.append(frame.tobytes())
+        self.assertEqual(frames, self.frames[:10])
+        self.assertEqual((ns.rtcmStalls, ns.rtcmReconnects), (1, 0))
+        await ns.reconnectNtripStream()
+        with self.assertRaises(ConnectionError):
+            async for frame, _ in ns:
+                frames.append(frame.tobytes())
+        self.assertEqual(frames, self.frames)
+        self.assertEqual(ns.rtcmReconnects, 1)
+
+    async def test_protocol_failed_reconnect(self):
+        self.silent = (2,)
+        frames = []
+        ns = NtripStream(idleTimeout=0.1, headerTimeout=0.2)
+        await ns.requestNtripStreamProtocol(
+            self.url, "MOUNT1", frameCallback=lambda frame, _: frames.append(frame)
+        )
+        await ns.rtcmReaderTask
+        self.assertIsInstance(ns.rtcmReaderError, TimeoutError)
+        self.assertEqual(len(frames), 10)
+        self.assertEqual((ns.rtcmReconnects, ns.rtcmReconnectFailures), (0, 1))
 
 
 if __name__ == "__main__":
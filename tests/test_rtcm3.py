@@ -14,12 +14,21 @@ rtk2go.com caster, covering RTCM 3.0, 3.2 and 3.3 mountpoints:
 import glob
 import json
 import os
+import random
 import re
+import sys
 import unittest
 
 from bitstring import BitStream
 
-from ntripstreams.rtcm3 import Rtcm3, _readfmt
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ntripstreams.crc import crc24q
+from ntripstreams.framer import RtcmFrame
+from ntripstreams.rtcm3 import Rtcm3, _BitFormat
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 SAMPLES_JSON = os.path.join(DATA_DIR, "rtcm3_samples.json")
@@ -31,17 +40,13 @@ LEGACY = set(range(1001, 1005)) | set(range(1009, 1013))
 MSM = set(range(1071, 1128))
 
 
-def format_bits(fmt):
-    """Sum the bit width of a bitstring read format string (after _readfmt)."""
-    total = 0
-    for token in _readfmt(fmt).split(","):
-        token = token.strip()
-        match = re.search(r":(\d+)", token)
-        if match:
-            total += int(match.group(1))
-        elif token == "bool":
-            total += 1
-    return total
+def readlist_format(fmt):
+    """Return a labelled format as bitstring's readlist accepts it.
+
+    bitstring >= 4.2 rejects the ``token=label`` syntax of the compiled
+    formats, so the labels are stripped for the reference decoding.
+    """
+    return re.sub(r"=\w+", "", fmt)
 
 
 def iter_raw_frames(path):
@@ -62,15 +67,142 @@ def iter_raw_frames(path):
         i += flen
 
 
-class TestReadFmt(unittest.TestCase):
-    def test_strips_name_labels(self):
-        self.assertEqual(_readfmt("uint:12=messageType"), "uint:12")
+class TestBitFormat(unittest.TestCase):
+    """Compiled formats decode exactly like bitstring's readlist."""
+
+    def formats(self):
+        for name, fmt in vars(Rtcm3).items():
+            if not name.startswith("_Rtcm3__msg"):
+                continue
+            for single in fmt if isinstance(fmt, list) else [fmt]:
+                yield name, single
+
+    def test_read_matches_readlist(self):
+        rng = random.Random(0)
+        for name, fmt in self.formats():
+            for _ in range(20):
+                bits = BitStream(uint=rng.getrandbits(400), length=400)
+                expected = bits.readlist(readlist_format(fmt))
+                values, pos = _BitFormat(fmt).read(bits.uint, bits.len, 0)
+                self.assertEqual(values, expected, name)
+                self.assertEqual(pos, bits.pos, name)
+
+    def test_read_column_matches_repeated_readlist(self):
+        rng = random.Random(1)
+        for name, fmt in self.formats():
+            if "," in fmt:
+                continue
+            for count in (0, 1, 7):
+                bits = BitStream(uint=rng.getrandbits(300), length=300)
+                bits.pos = 5
+                expected = bits.readlist(f"{count}*{readlist_format(fmt)}")
+                values, pos = _BitFormat(fmt).readColumn(count, bits.uint, 300, 5)
+                self.assertEqual(values, expected, name)
+                self.assertEqual(pos, bits.pos, name)
+
+
+@unittest.skipUnless(numpy, "numpy not installed")
+class TestMsmArrays(unittest.TestCase):
+    """Structured-array MSM decoding matches the list decoding."""
+
+    def test_read_column_array_matches_read_column(self):
+        rng = random.Random(2)
+        for name, fmt in TestBitFormat().formats():
+            if "," in fmt or "bin" in fmt or "bytes" in fmt:
+                continue
+            bits = BitStream(uint=rng.getrandbits(300), length=300)
+            unpacked = numpy.array(list(bits), dtype=numpy.uint8)
+            compiled = _BitFormat(fmt)
+            expected = compiled.readColumn(7, bits.uint, 300, 5)
+            values, pos = compiled.readColumnArray(7, unpacked, 5)
+            self.assertEqual(values.tolist(), expected[0], name)
+            self.assertEqual(pos, expected[1], name)
+
+    def test_sample_frames(self):
+        rtcm = Rtcm3()
+        for path in sorted(glob.glob(RAW_GLOB)):
+            for payload in iter_raw_frames(path):
+                if payload.peek("uint:12") not in MSM:
+                    continue
+                _, (head, satData, signalData) = rtcm.decodeRtcmMessage(payload.copy())
+                _, (arrayHead, satArray, signalArray) = rtcm.decodeRtcmMessage(
+                    payload, asArray=True
+                )
+                self.assertEqual(arrayHead, head)
+                self.assertEqual(list(map(list, satArray.tolist())), satData)
+                self.assertEqual(list(map(list, signalArray.tolist())), signalData)
+        self.assertIn("signalFinePseudorangeExtRes", signalArray.dtype.names)
+
+
+@unittest.skipUnless(numpy, "numpy not installed")
+class TestMsmObservables(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rtcm = Rtcm3()
+        cls.frames = {}
+        for path in sorted(glob.glob(RAW_GLOB)):
+            for payload in iter_raw_frames(path):
+                raw = payload.tobytes()
+                frame = RtcmFrame(
+                    b"\xd3" + len(raw).to_bytes(2, "big") + raw + bytes(3)
+                )
+                if frame.messageType in MSM:
+                    cls.frames.setdefault(frame.messageType, frame)
+
+    def test_observables_in_si_units(self):
+        for messageType, frame in self.frames.items():
+            observables = self.rtcm.msmObservables(frame)
+            _, data = self.rtcm.decodeRtcmFrame(frame)
+            self.assertEqual(len(observables), len(data[2]))
+            if messageType % 10 < 4 or not len(observables):
+                continue
+            pseudorange = observables["pseudorange"]
+            self.assertTrue(numpy.all((pseudorange > 1.9e7) & (pseudorange < 4.5e7)))
+            self.assertTrue(
+                numpy.all(abs(observables["phaseRange"] - pseudorange) < 1000.0)
+            )
+            if messageType in (1075, 1077):
+                l1 = observables["signal"] == "L1C"
+                self.assertTrue(
+                    numpy.allclose(
+                        observables["carrierPhase"][l1] * 299792458.0 / 1575.42e6,
+                        observables["phaseRange"][l1],
+                    )
+                )
 
-    def test_strips_value_assertions(self):
-        self.assertEqual(_readfmt("uint:12=1004"), "uint:12")
+    def test_glonass_channels(self):
+        frame = self.frames[1084]
+        observables = self.rtcm.msmObservables(frame)
+        self.assertTrue(numpy.all(numpy.isnan(observables["carrierPhase"])))
+        self.assertTrue(numpy.all(numpy.isnan(observables["phaseRangeRate"])))
+        channels = {prn: 0 for prn in observables["prn"].tolist()}
+        observables = self.rtcm.msmObservables(frame, glonassChannels=channels)
+        g1 = observables["signal"] == "G1C"
+        self.assertTrue(g1.any())
+        self.assertTrue(
+            numpy.allclose(
+                observables["carrierPhase"][g1] * 299792458.0 / 1602.0e6,
+                observables["phaseRange"][g1],
+            )
+        )
+        self.assertFalse(numpy.isnan(observables["carrierPhase"]).any())
+
+    def test_glonass_channels_do_not_override_message(self):
+        for messageType in (1085, 1087):
+            frame = self.frames[messageType]
+            observables = self.rtcm.msmObservables(frame)
+            wrong = {prn: -7 for prn in observables["prn"].tolist()}
+            overridden = self.rtcm.msmObservables(frame, glonassChannels=wrong)
+            numpy.testing.assert_array_equal(
+                overridden["carrierPhase"], observables["carrierPhase"]
+            )
+            numpy.testing.assert_array_equal(
+                overridden["phaseRangeRate"], observables["phaseRangeRate"]
+            )
 
-    def test_leaves_plain_tokens(self):
-        self.assertEqual(_readfmt("uint:12, pad:6, bool"), "uint:12, pad:6, bool")
+    def test_not_msm(self):
+        with self.assertRaises(ValueError):
+            self.rtcm.msmObservables(RtcmFrame(b"\xd3\x00\x02\x3e\xd0\x00\x00\x00"))
 
 
 class TestSampleFrames(unittest.TestCase):
@@ -94,6 +226,112 @@ class TestSampleFrames(unittest.TestCase):
                 checked += 1
         self.assertGreater(checked, 20)
 
+    def test_rtcm_frame_decodes_like_bitstream(self):
+        for d in self.fixture.values():
+            for hexstr in d["sample_frames_hex"].values():
+                raw = bytes.fromhex(hexstr)
+                self.assertEqual(
+                    self.rtcm.decodeRtcmFrame(RtcmFrame(raw)),
+                    self.rtcm.decodeRtcmFrame(BitStream(raw)),
+                )
+
+    def test_lazy_message_decodes_like_frame(self):
+        for d in self.fixture.values():
+            for hexstr in d["sample_frames_hex"].values():
+                frame = RtcmFrame(bytes.fromhex(hexstr))
+                messageType, data = self.rtcm.decodeRtcmFrame(frame)
+                message = self.rtcm.decodeRtcmHeader(frame)
+                self.assertEqual(message.messageType, messageType)
+                self.assertEqual(message.head, data[0])
+                self.assertIsNone(message._body)
+                self.assertEqual(message.numSats, len(data[1]))
+                if messageType in MSM:
+                    self.assertEqual(message.numCells, len(data[2]))
+                self.assertEqual(message.data, data)
+                self.assertEqual(
+                    self.rtcm.decodeRtcmHeader(BitStream(frame.data)).data, data
+                )
+
+    def test_named_records(self):
+        for d in self.fixture.values():
+            for mt_str, hexstr in d["sample_frames_hex"].items():
+                frame = RtcmFrame(bytes.fromhex(hexstr))
+                _, (head, satData, signalData) = self.rtcm.decodeRtcmFrame(frame)
+                if int(mt_str) not in LEGACY | MSM:
+                    continue
+                self.assertFalse(hasattr(head, "__dict__"))
+                self.assertEqual(head.messageType, int(mt_str))
+                self.assertEqual(head, list(head))
+                self.assertEqual(satData, [list(record) for record in satData])
+                self.assertEqual(
+                    self.rtcm.decodeRtcmHeader(frame).gnssEpochTime, head[2]
+                )
+                for record in satData + signalData:
+                    self.assertFalse(hasattr(record, "__dict__"))
+                if int(mt_str) in MSM:
+                    self.assertEqual(head.gnssSignalMask, head[10])
+                    self.assertEqual(len(signalData), head.cellMask.bit_count())
+                    self.assertEqual(
+                        head.cellMaskBin.count("1"), head.cellMask.bit_count()
+                    )
+                    self.assertEqual(int(head.gnssSatMaskBin, 2), head.gnssSatMask)
+                    self.assertEqual(len(head.gnssSignalMaskBin), 32)
+
+    def test_records_behave_like_lists(self):
+        d = next(iter(self.fixture.values()))
+        for hexstr in d["sample_frames_hex"].values():
+            _, (head, _, _) = self.rtcm.decodeRtcmFrame(bytes.fromhex(hexstr))
+            if not isinstance(head, str):
+                break
+        values = list(head)
+        self.assertEqual(len(head), len(values))
+        self.assertEqual(head[1:3], values[1:3])
+        self.assertEqual(head[-1], values[-1])
+        self.assertNotEqual(head, values[:-1])
+        self.assertLess(sys.getsizeof(head), sys.getsizeof(values))
+        head[1] = 4095
+        self.assertEqual(head.refStationId, 4095)
+        head.refStationId = 7
+        self.assertEqual(head[1], 7)
+        self.assertEqual(head._asdict()["refStationId"], 7)
+        with self.assertRaises(TypeError):
+            hash(head)
+
+    def test_buffers_decode_in_place(self):
+        frames = [
+            bytes.fromhex(hexstr)
+            for d in self.fixture.values()
+            for hexstr in d["sample_frames_hex"].values()
+        ]
+        archive = bytearray(b"junk")
+        offsets = []
+        for raw in frames:
+            offsets.append(len(archive))
+            archive += raw
+        for buffer in (bytes(archive), archive, memoryview(archive)):
+            for raw, offset in zip(frames, offsets):
+                expected = self.rtcm.decodeRtcmFrame(RtcmFrame(raw))
+                self.assertEqual(
+                    self.rtcm.decodeRtcmFrame(buffer, offset=offset), expected
+                )
+                self.assertEqual(
+                    self.rtcm.decodeRtcmFrame(buffer, offset=offset, length=len(raw)),
+                    expected,
+                )
+                self.assertEqual(
+                    self.rtcm.decodeRtcmHeader(buffer, offset=offset).data, expected[1]
+                )
+                self.assertEqual(
+                    self.rtcm.decodeRtcmMessage(
+                        buffer, offset=offset + 3, length=len(raw) - 6
+                    ),
+                    expected,
+                )
+        with self.assertRaises(ValueError):
+            self.rtcm.decodeRtcmFrame(archive, offset=1)
+        with self.assertRaises(ValueError):
+            self.rtcm.decodeRtcmFrame(archive[: offsets[-1] + 10], offset=offsets[-1])
+
     def test_description_known_for_all_types(self):
         for d in self.fixture.values():
             for mt_str in d["sample_frames_hex"]:
@@ -113,6 +351,187 @@ class TestSampleFrames(unittest.TestCase):
                 )
                 signals = self.rtcm.msmSignalTypes(mtype, data[0][10])
                 self.assertIsInstance(signals, list)
+                self.assertEqual(
+                    self.rtcm.msmSignalTypes(mtype, data[0].gnssSignalMaskBin), signals
+                )
+                satellites = self.rtcm.msmSatellites(mtype, data[0].gnssSatMask)
+                self.assertEqual(len(satellites), len(data[1]))
+                self.assertEqual(satellites, sorted(set(satellites)))
+
+    def test_mask_lookups(self):
+        self.assertEqual(
+            self.rtcm.msmSignalTypes(1077, 1 << 30 | 1 << 22), ["L1C", "L2W"]
+        )
+        self.assertEqual(self.rtcm.msmSignalTypes(1077, 0), [])
+        self.assertEqual(self.rtcm.msmSatellites(1077, 1 << 63 | 1), [1, 64])
+        self.assertEqual(self.rtcm.msmSatellites(1117, 1 << 63), [193])
+
+
+class TestEncoder(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rtcm = Rtcm3()
+
+    def test_round_trip_raw_captures(self):
+        encoded = identical = 0
+        for path in sorted(glob.glob(RAW_GLOB)):
+            for payload in iter_raw_frames(path):
+                raw = payload.tobytes()
+                messageType, data = self.rtcm.decodeRtcmMessage(payload)
+                frame = self.rtcm.encodeRtcmFrame(messageType, data)
+                if messageType not in LEGACY | MSM | {1029}:
+                    self.assertIsNone(frame)
+                    continue
+                self.assertEqual(crc24q(frame.data), 0)
+                self.assertEqual(self.rtcm.decodeRtcmFrame(frame), (messageType, data))
+                encoded += 1
+                identical += bytes(frame.payload) == raw
+        self.assertGreater(encoded, 100)
+        self.assertGreater(identical, encoded // 2)
+
+    def test_encode_1029_from_dict(self):
+        message = self.rtcm.encodeRtcmMessage(
+            1029, {"refStationId": 7, "mjd": 59000, "utc": 3600, "string": "Adjø"}
+        )
+        messageType, (head, _, _) = self.rtcm.decodeRtcmMessage(message)
+        self.assertEqual(messageType, 1029)
+        self.assertEqual(head.refStationId, 7)
+        self.assertEqual((head.utfChars, head.charBytes), (4, 5))
+        self.assertEqual(head.string.decode(), "Adjø")
+        frame = self.rtcm.encodeRtcmFrame(1029, {"string": "Adjø"})
+        self.assertEqual(frame.messageType, 1029)
+
+    def test_encode_1029_overflow(self):
+        for data in (
+            {"string": "x" * 128},
+            {"string": "€" * 100},
+            {"refStationId": 5000},
+            {"refStationId": -1},
+            {"utc": 1 << 17},
+        ):
+            with self.assertRaises(ValueError, msg=data):
+                self.rtcm.encodeRtcmFrame(1029, data)
+        frame = self.rtcm.encodeRtcmFrame(1029, {"string": "ø" * 127})
+        _, (head, _, _) = self.rtcm.decodeRtcmFrame(frame)
+        self.assertEqual((head.utfChars, head.charBytes), (127, 254))
+
+    def test_pack_range_checks(self):
+        compiled = _BitFormat("uint:4=a, int:4=b, bin:2=c, bool=d")
+        self.assertEqual(compiled.pack([15, -8, "11", True]), (0b1111_1000_11_1, 11))
+        self.assertEqual(compiled.pack([0, 7, "", False]), (0b0000_0111_00_0, 11))
+        for values in (
+            [16, 0, "", False],
+            [-1, 0, "", False],
+            [0, 8, "", False],
+            [0, -9, "", False],
+            [0, 0, "100", False],
+        ):
+            with self.assertRaises(ValueError, msg=values):
+                compiled.pack(values)
+        with self.assertRaises(ValueError):
+            _BitFormat("int:4=b").packColumn([1, -9])
+
+    def test_inconsistent_counts(self):
+        with open(SAMPLES_JSON) as fh:
+            fixture = json.load(fh)
+        frame = next(
+            RtcmFrame(bytes.fromhex(hexstr))
+            for d in fixture.values()
+            for mt, hexstr in d["sample_frames_hex"].items()
+            if int(mt) in MSM
+        )
+        messageType, (head, satData, signalData) = self.rtcm.decodeRtcmFrame(frame)
+        with self.assertRaises(ValueError):
+            self.rtcm.encodeRtcmFrame(messageType, [head, satData[1:], signalData])
+        bitMasks = list(head)
+        bitMasks[9:12] = head.gnssSatMaskBin, head.gnssSignalMaskBin, head.cellMaskBin
+        self.assertEqual(
+            self.rtcm.encodeRtcmFrame(
+                messageType, [bitMasks, satData, signalData]
+            ).data,
+            self.rtcm.encodeRtcmFrame(messageType, [head, satData, signalData]).data,
+        )
+        bitMasks[11] += "0"
+        with self.assertRaises(ValueError):
+            self.rtcm.encodeRtcmFrame(messageType, [bitMasks, satData, signalData])
+
+
+class TestDecodeCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.frames = []
+        for path in sorted(glob.glob(RAW_GLOB)):
+            for payload in iter_raw_frames(path):
+                raw = payload.tobytes()
+                cls.frames.append(
+                    RtcmFrame(b"\xd3" + len(raw).to_bytes(2, "big") + raw + bytes(3))
+                )
+
+    def test_cached_results_match(self):
+        cached = Rtcm3(cacheSize=64)
+        plain = Rtcm3()
+        for frame in self.frames:
+            self.assertEqual(
+                cached.decodeRtcmFrame(frame), plain.decodeRtcmFrame(frame)
+            )
+        static = [f for f in self.frames if f.messageType in Rtcm3.staticMessageTypes]
+        self.assertEqual(cached.cacheHits + cached.cacheMisses, len(static))
+        self.assertGreater(cached.cacheHits, len(static) // 2)
+        self.assertEqual(cached.cacheEvictions, 0)
+        frame = static[-1]
+        self.assertIs(cached.decodeRtcmFrame(frame), cached.decodeRtcmFrame(frame))
+        self.assertEqual(
+            cached.decodeRtcmFrame(BitStream(frame.data)), plain.decodeRtcmFrame(frame)
+        )
+
+    def test_eviction_and_payload_check(self):
+        rtcm = Rtcm3(cacheSize=1, cacheTypes=[1029])
+        first = rtcm.encodeRtcmFrame(1029, {"mjd": 1, "utc": 2, "string": "a"})
+        second = rtcm.encodeRtcmFrame(1029, {"mjd": 1, "utc": 2, "string": "b"})
+        for frame in (first, second, first):
+            rtcm.decodeRtcmFrame(frame)
+        self.assertEqual((rtcm.cacheHits, rtcm.cacheMisses), (0, 3))
+        self.assertEqual(rtcm.cacheEvictions, 2)
+        # A colliding key with a different payload is decoded, not served.
+        collision = RtcmFrame(second.data[:-3] + first.data[-3:])
+        self.assertEqual(rtcm.decodeRtcmFrame(collision)[1][0].string, b"b")
+        self.assertEqual(rtcm.cacheHits, 0)
+
+
+class TestRegistry(unittest.TestCase):
+    def test_builtin_entries(self):
+        rtcm = Rtcm3()
+        info = rtcm.messageTypeInfo(1087)
+        self.assertEqual((info.constellation, info.msmLevel), ("GLONASS", 7))
+        self.assertTrue(info.observables)
+        self.assertEqual(rtcm.messageTypeInfo(1012).constellation, "GLONASS")
+        self.assertIsNone(rtcm.messageTypeInfo(1078).msmLevel)
+        self.assertIsNone(rtcm.messageTypeInfo(4095))
+
+    def test_decode_at_offset(self):
+        rtcm = Rtcm3()
+        for path in sorted(glob.glob(RAW_GLOB)):
+            for payload in iter_raw_frames(path):
+                if payload.peek("uint:12") not in (1084, 1085, 1087, 1077):
+                    continue
+                expected = rtcm.decodeRtcmMessage(payload.copy())
+                shifted = BitStream(uint=0x5A5, length=11) + payload
+                shifted.pos = 11
+                self.assertEqual(rtcm.decodeRtcmMessage(shifted), expected)
+
+    def test_register_external_decoder(self):
+        def decodeHeader(rtcm, messageType, value, nbits, pos):
+            return [messageType, (value >> (nbits - pos - 20)) & 0xFF], 0, 0, pos + 20
+
+        Rtcm3.register(4001, decodeHeader, description="Proprietary test")
+        try:
+            rtcm = Rtcm3()
+            messageType, data = rtcm.decodeRtcmMessage(BitStream("0xfa12a"))
+            self.assertEqual((messageType, data), (4001, [[4001, 0x2A], [], []]))
+            self.assertEqual(rtcm.messageDescription(4001), "Proprietary test")
+            self.assertEqual(rtcm.constellation(4001), "GNSS")
+        finally:
+            del Rtcm3._messageTypes[4001]
 
 
 class TestRawCaptures(unittest.TestCase):
@@ -171,7 +590,7 @@ class TestLegacyRecordWidths(unittest.TestCase):
         for suffix, expected in self.SPEC_BITS.items():
             fmt = getattr(Rtcm3, "_Rtcm3__msg" + suffix)
             self.assertEqual(
-                format_bits(fmt), expected, f"{suffix} width != {expected} bits"
+                _BitFormat(fmt).length, expected, f"{suffix} width != {expected} bits"
             )
 
 
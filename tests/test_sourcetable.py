@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the parsed and indexed Sourcetable.
+
+Spatial queries are checked against a brute-force scan of a synthetic table
+with streams spread over the whole globe.
+"""
+
+import random
+import unittest
+
+from ntripstreams.sourcetable import (
+    CasRecord,
+    Sourcetable,
+    distance,
+    parseConstellations,
+    parseMessageTypes,
+    parseSourcetableLine,
+)
+
+SOURCETABLE = [
+    "CAS;caster.example.net;2101;EXAMPLE;Operator;0;DNK;55.67;12.57;"
+    "fallback.example.net;2102;http://example.net",
+    "NET;EXNET;Operator;B;N;http://example.net;none;none;misc",
+    "STR;CPH1;Copenhagen;RTCM 3.2;1004(1),1005(10),1077(1),1087(1);2;GPS+GLO;"
+    "EXNET;DNK;55.68;12.57;0;0;Leica;none;B;N;9600;",
+    "STR;AAR1;Aarhus;RTCM 3.3;1005(10),1077(1),1097(1),1127(1);2;GPS+GAL+BDS;"
+    "EXNET;DNK;56.16;10.20;0;0;Trimble;none;B;N;9600;site;with;semicolons",
+    "STR;WRAP;Wrapped;RTCM 3.2;1004(1);2;GPS;EXNET;NZL;-41.29;185.0;0;0;x;none;"
+    "N;N;9600;",
+    "STR;NOPOS;Unknown;RTCM 3.2;1004(1);2;GPS;EXNET;DNK;;;0;0;x;none;N;N;;",
+    "ENDSOURCETABLE",
+    "STR;AFTER;Ignored;RTCM 3.2;;2;GPS;EXNET;DNK;0;0;0;0;x;none;N;N;9600;",
+]
+
+
+class TestParsing(unittest.TestCase):
+    def setUp(self):
+        self.table = Sourcetable.parse(SOURCETABLE)
+
+    def test_records(self):
+        self.assertEqual(len(self.table), 4)
+        self.assertTrue(self.table.complete)
+        self.assertNotIn("AFTER", self.table)
+        stream = self.table["AAR1"]
+        self.assertEqual(stream.latitude, 56.16)
+        self.assertEqual(stream.bitrate, 9600)
+        self.assertEqual(stream.misc, "site;with;semicolons")
+        self.assertEqual(self.table["WRAP"].longitude, -175.0)
+        self.assertNotEqual(self.table["NOPOS"].latitude, self.table["NOPOS"].latitude)
+        (caster,) = self.table.casters
+        self.assertIsInstance(caster, CasRecord)
+        self.assertEqual((caster.port, caster.fallbackPort), (2101, 2102))
+        self.assertEqual(self.table.networks[0].identifier, "EXNET")
+
+    def test_bytes_lines(self):
+        table = Sourcetable.parse(line.encode("ISO-8859-1") for line in SOURCETABLE)
+        self.assertEqual(list(map(repr, table)), list(map(repr, self.table)))
+
+    def test_field_helpers(self):
+        self.assertEqual(
+            parseConstellations("GPS+GLO+Gal+BDS+QZS"),
+            ["GPS", "GLONASS", "GALILEO", "BEIDOU", "QZSS"],
+        )
+        self.assertEqual(
+            parseMessageTypes("1004(1), 1005(10),1230"), [1004, 1005, 1230]
+        )
+
+    def test_parse_line(self):
+        self.assertEqual(parseSourcetableLine(SOURCETABLE[2]), self.table["CPH1"])
+        self.assertEqual(
+            parseSourcetableLine(SOURCETABLE[1].encode() + b"\r\n"),
+            self.table.networks[0],
+        )
+        self.assertIsNone(parseSourcetableLine("ENDSOURCETABLE"))
+
+    def test_find(self):
+        def mountpoints(streams):
+            return [stream.mountpoint for stream in streams]
+
+        self.assertEqual(
+            mountpoints(self.table.find(format="rtcm 3.2")), ["CPH1", "WRAP", "NOPOS"]
+        )
+        self.assertEqual(
+            mountpoints(self.table.find(messageType=1077)), ["CPH1", "AAR1"]
+        )
+        self.assertEqual(mountpoints(self.table.find(constellation="GLO")), ["CPH1"])
+        self.assertEqual(
+            mountpoints(self.table.find(format="RTCM 3.3", constellation="GLONASS")),
+            [],
+        )
+        self.assertEqual(len(self.table.find()), 4)
+
+    def test_unique_merge(self):
+        merged = Sourcetable(unique=True)
+        for source in ("first", "second"):
+            for line in SOURCETABLE[: SOURCETABLE.index("ENDSOURCETABLE")]:
+                record = parseSourcetableLine(line)
+                if record is not None:
+                    merged.addRecord(record, source)
+        self.assertEqual(list(merged.mountpoints), list(self.table.mountpoints))
+        self.assertEqual(merged.sourceOf("CPH1"), "first")
+        self.assertEqual(len(merged.casters), 1)
+        self.assertEqual(len(merged.duplicates), 6)
+        self.assertEqual({source for source, _ in merged.duplicates}, {"second"})
+
+    def test_nearest_with_filter(self):
+        ((dist, stream),) = self.table.nearest(55.7, 12.6, constellation="BEIDOU")
+        self.assertEqual(stream.mountpoint, "AAR1")
+        self.assertAlmostEqual(dist, distance(55.7, 12.6, 56.16, 10.20))
+
+
+class TestSpatialIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(21)
+        lines = [
+            f"STR;M{i};;RTCM 3.2;1004(1);2;GPS;;;{rng.uniform(-90, 90):.3f};"
+            f"{rng.uniform(-180, 180):.3f};0;0;;none;N;N;9600;"
+            for i in range(2000)
+        ]
+        cls.table = Sourcetable(lines, cellSize=2.0)
+        cls.positions = [
+            (rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(50)
+        ]
+        cls.positions += [(89.9, 0.0), (-89.9, 10.0), (0.0, 179.9), (10.0, -180.0)]
+
+    def brute_force(self, latitude, longitude):
+        return sorted(
+            (distance(latitude, longitude, s.latitude, s.longitude), s.mountpoint)
+            for s in self.table
+        )
+
+    def test_nearest_matches_brute_force(self):
+        for count in (1, 7):
+            for latitude, longitude in self.positions:
+                expected = self.brute_force(latitude, longitude)[:count]
+                found = self.table.nearest(latitude, longitude, count)
+                self.assertEqual(
+                    [stream.mountpoint for _, stream in found],
+                    [mountpoint for _, mountpoint in expected],
+                )
+
+    def test_within_matches_brute_force(self):
+        for radius in (50.0, 800.0, 15000.0):
+            for latitude, longitude in self.positions:
+                expected = [
+                    mountpoint
+                    for dist, mountpoint in self.brute_force(latitude, longitude)
+                    if dist <= radius
+                ]
+                found = self.table.within(latitude, longitude, radius)
+                self.assertEqual([stream.mountpoint for _, stream in found], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()